@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable, Iterator, List
+from components.fingerprint import constructor_params
 
 
 
 class IndexingTextOptimizerInterface(ABC):
+
     @abstractmethod
     def optimize_queries(self, queries: List[str]) -> List[str]:
         pass
@@ -11,6 +13,19 @@ class IndexingTextOptimizerInterface(ABC):
     def optimize_documents(self, documents: List[str]) -> List[str]:
         pass
 
+    def optimize_document_batches(self, batches: Iterable[List[str]]) -> Iterator[List[str]]:
+        """Lazily optimizes a stream of document batches, pulling one batch at a time. Empty batches skip the optimizer"""
+        for batch in batches:
+            yield self.optimize_documents(batch) if batch else []
+
+    def fingerprint_params(self) -> dict:
+        """
+        Parameters the optimized texts depend on, part of the fingerprints of the indexes and caches
+        built from them. Defaults to the constructor parameters kept under an attribute of the same name,
+        optimizers override it when their output depends on anything else.
+        """
+        return constructor_params(self)
+
 class NoneIndexOptimizer(IndexingTextOptimizerInterface):
 
     @abstractmethod
@@ -22,4 +37,72 @@ class NoneIndexOptimizer(IndexingTextOptimizerInterface):
     
 
 
+class TokenLevelOptimizer(IndexingTextOptimizerInterface):
+    """
+    Optimizer that works word by word and treats queries and documents alike. Consecutive token
+    level optimizers of an OptimizerChain are fused into a single pass over the tokens.
+    optimize_text(text) must equal " ".join(optimize_tokens(text.split())), with non-empty tokens free of whitespace.
+    """
+
+    @abstractmethod
+    def optimize_tokens(self, tokens: Iterable[str]) -> Iterable[str]:
+        """Lazily optimizes a stream of whitespace free tokens"""
+        pass
+
+    def optimize_text(self, text: str) -> str:
+        return " ".join(self.optimize_tokens(text.split()))
+
+    def optimize_queries(self, lst_text: List[str]) -> List[str]:
+        return [self.optimize_text(text) for text in lst_text]
+
+    def optimize_documents(self, lst_text: List[str]) -> List[str]:
+        return [self.optimize_text(text) for text in lst_text]
+
+
+class TokenPipeline(TokenLevelOptimizer):
+    """
+    Consecutive token level optimizers fused into a single pass: every text is split once, its
+    tokens stream through all the optimizers and the result is joined once, without the
+    intermediate strings of running the optimizers one after the other.
+    """
+
+    def __init__(self, optimizers: List[TokenLevelOptimizer]):
+        self.optimizers = optimizers
+
+    def optimize_tokens(self, tokens: Iterable[str]) -> Iterable[str]:
+        for optimizer in self.optimizers:
+            tokens = optimizer.optimize_tokens(tokens)
+        return tokens
+
+
+class OptimizerChain(IndexingTextOptimizerInterface):
+    """
+    Runs optimizers one after the other, runs of consecutive token level optimizers are fused into
+    a TokenPipeline. Gives the same texts as running the optimizers separately.
+    """
+
+    def __init__(self, optimizers: List[IndexingTextOptimizerInterface]):
+        self.optimizers = list(optimizers)
+        self.stages = []
+        for optimizer in self.optimizers:
+            if not isinstance(optimizer, TokenLevelOptimizer):
+                self.stages.append(optimizer)
+            elif self.stages and isinstance(self.stages[-1], TokenPipeline):
+                self.stages[-1].optimizers.append(optimizer)
+            else:
+                self.stages.append(TokenPipeline([optimizer]))
+
+    def optimize_queries(self, lst_text: List[str]) -> List[str]:
+        for stage in self.stages:
+            lst_text = stage.optimize_queries(lst_text)
+        return lst_text
+
+    def optimize_documents(self, lst_text: List[str]) -> List[str]:
+        for stage in self.stages:
+            lst_text = stage.optimize_documents(lst_text)
+        return lst_text
 
+    def optimize_document_batches(self, batches: Iterable[List[str]]) -> Iterator[List[str]]:
+        for stage in self.stages:
+            batches = stage.optimize_document_batches(batches)
+        return iter(batches)
@@ -2,6 +2,7 @@ from typing import List
 from transformers import AutoModel, AutoTokenizer
 import torch
 from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
+from components.inference_backend import InferenceBackend
 
 
 def make_lemmatized_sentence(bert_output: List[List[tuple]]) -> List[str]:
@@ -24,14 +25,42 @@ def make_lemmatized_sentence(bert_output: List[List[tuple]]) -> List[str]:
 
 
 class LemmatizerIndexOptimizerBert(IndexingTextOptimizerInterface):
-    def __init__(self):
+    def __init__(self, inference_backend: InferenceBackend | None = None):
+        """inference_backend: how dictabert-lex runs (int8 quantization, compilation), fp32 eager when None."""
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.tokenizer = AutoTokenizer.from_pretrained("dicta-il/dictabert-lex")
-        self.model = AutoModel.from_pretrained("dicta-il/dictabert-lex", trust_remote_code=True)
-        self.model.to(self.device)
+        self.inference_backend = inference_backend or InferenceBackend()
+        # Loaded on first use
+        self._tokenizer = None
+        self._model = None
+
+    def __getstate__(self):
+        # Worker processes load the model themselves, once
+        state = self.__dict__.copy()
+        state["_tokenizer"] = None
+        state["_model"] = None
+        return state
+
+    def _load_model(self):
+        self._tokenizer = AutoTokenizer.from_pretrained("dicta-il/dictabert-lex")
+        self._model = AutoModel.from_pretrained("dicta-il/dictabert-lex", trust_remote_code=True)
+        self._model.to(self.device)
+        self._model = self.inference_backend.prepare(self._model, self.device)
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load_model()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load_model()
+        return self._model
     
     def optimize_documents(self, lst_text: List[str]) -> List[str]:
-        outputs = self.model.predict(lst_text, self.tokenizer)
+        with self.inference_backend.context():
+            outputs = self.model.predict(lst_text, self.tokenizer)
         return make_lemmatized_sentence(outputs)
 
     def optimize_queries(self, lst_text: List[str]) -> List[str]:
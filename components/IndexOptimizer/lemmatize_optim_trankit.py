@@ -24,6 +24,12 @@ class LemmatizerIndexOptimizerTrankit(IndexingTextOptimizerInterface):
             print("Using GPU to lemmatize")
         else:
             print("Using CPU to lemmatize")
+
+    def __getstate__(self):
+        # The pipeline is not picklable, worker processes create their own, once
+        state = self.__dict__.copy()
+        state["pipeline"] = None
+        return state
     
     def optimize_documents(self, lst_text: List[str]) -> List[str]:
         """
@@ -35,6 +41,8 @@ class LemmatizerIndexOptimizerTrankit(IndexingTextOptimizerInterface):
         concatenated_text = " [SEP] ".join(lst_text)  # Use a special marker to track original splits
 
         # Perform lemmatization
+        if self.pipeline is None:
+            self.pipeline = trankit.Pipeline("hebrew")
         lemmatized_output = self.pipeline.lemmatize(concatenated_text)
         lemmatized_text = create_lemmatized_text(lemmatized_output)
 
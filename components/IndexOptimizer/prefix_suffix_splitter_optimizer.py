@@ -1,61 +1,130 @@
 import sys
 import os
 import re
+from functools import lru_cache
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
-from typing import List
+from components.IndexOptimizer.indexing_text_optimizer_interface import TokenLevelOptimizer
+from typing import Iterable
 
 
 
-class PrefixSuffixSplitterOptimizer(IndexingTextOptimizerInterface):
+# Compiled once, used for every word of every section and query
+WORD_SEPARATOR_PATTERN = re.compile(r'[\\\s]+')
+# Hebrew characters with optional quotes in the middle
+HEBREW_WORD_PATTERN = re.compile(r'^[\u0590-\u05FF]+[\'\"]?[\u0590-\u05FF]+$')
+# Non-Hebrew characters on the sides of a word, quotes are kept
+NON_HEBREW_SIDES_PATTERN = re.compile(r'^[^\u0590-\u05FF\'\"]+|[^\u0590-\u05FF\'\"]+$')
+OT_SOFIT = {"כ": "ך", "מ": "ם", "נ": "ן", "פ": "ף", "צ": "ץ"}
 
-    def __init__(self):
-        self.prefixes_to_split = [
+
+class PrefixSuffixSplitterOptimizer(TokenLevelOptimizer):
+    """
+    Adds to every Hebrew word its forms without prefixes (ה, ו, ב, ...) and suffixes (ים, ות, ...).
+
+    Prefixes and suffixes are looked up in sets of their characters instead of scanning the lists,
+    and the expansion of every distinct word of the input is computed once and kept in a bounded
+    LRU cache, frequent words are then a single lookup. Assigning prefixes_to_split or
+    suffixes_to_split rebuilds the sets and clears the cache, they are tuples so they can't be
+    changed in place behind the cache.
+    """
+
+    def __init__(self, cache_size: int = 200000):
+        """
+        cache_size: words whose expansion is cached, does not change the output.
+        """
+        self._cache_size = cache_size
+        self._prefixes_to_split = (
             "ה",
             "ו",
             "ב",
             "ל",
             "ש",
             "כ",
-            "מ",            
-        ]
-        self.suffixes_to_split = [
+            "מ",
+        )
+        self._suffixes_to_split = (
             "ים",
             "ות",
             "י",
             "ה",
             "ו",
-        ]
-
-    def optimize_queries(self, lst_text: List[str]) -> List[str]:
-        res = []
-        for text in lst_text:
-            res.append(self.optimize_text(text))
-        return res
-
-    def optimize_documents(self, lst_text: List[str]) -> List[str]:
-        return self.optimize_queries(lst_text)
+        )
+        self._build_lookup_tables()
+
+    @property
+    def prefixes_to_split(self) -> tuple:
+        return self._prefixes_to_split
+
+    @prefixes_to_split.setter
+    def prefixes_to_split(self, prefixes: Iterable[str]):
+        self._prefixes_to_split = tuple(prefixes)
+        self._build_lookup_tables()
+
+    @property
+    def suffixes_to_split(self) -> tuple:
+        return self._suffixes_to_split
+
+    @suffixes_to_split.setter
+    def suffixes_to_split(self, suffixes: Iterable[str]):
+        self._suffixes_to_split = tuple(suffixes)
+        self._build_lookup_tables()
+
+    def _build_lookup_tables(self):
+        self._prefixes = frozenset(prefix for prefix in self.prefixes_to_split if len(prefix) == 1)
+        self._one_letter_suffixes = frozenset(suffix for suffix in self.suffixes_to_split if len(suffix) == 1)
+        self._two_letter_suffixes = frozenset(suffix for suffix in self.suffixes_to_split if len(suffix) == 2)
+        self._expand_word = lru_cache(maxsize=self._cache_size)(self._expand)
+
+    def __getstate__(self):
+        # The cache and lookup tables are rebuilt by the process the optimizer is sent to
+        return {key: value for key, value in self.__dict__.items()
+                if key not in ("_prefixes", "_one_letter_suffixes", "_two_letter_suffixes", "_expand_word")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_lookup_tables()
+
+    def fingerprint_params(self) -> dict:
+        # cache_size does not change the output
+        return {"prefixes_to_split": self.prefixes_to_split, "suffixes_to_split": self.suffixes_to_split}
 
     def optimize_text(self, text: str) -> str:
-        text = self.split_and_trim_hebrew_words(text)
+        expand_word = self._expand_word
         new_text = []
-        for word in text:
-            self.append_word(new_text, word)
-            self.split_prefixes_and_suffixes(new_text, word)
+        for word in WORD_SEPARATOR_PATTERN.split(text):
+            new_text.extend(expand_word(word))
         return " ".join(new_text)
 
+    def optimize_tokens(self, tokens: Iterable[str]) -> Iterable[str]:
+        expand_word = self._expand_word
+        for token in tokens:
+            if "\\" in token:
+                # Backslashes separate words like whitespace does
+                for word in token.split("\\"):
+                    yield from expand_word(word)
+            else:
+                yield from expand_word(token)
+
+    def _expand(self, word: str) -> tuple:
+        """Forms of a whitespace separated word, empty when it is not a Hebrew word"""
+        word = NON_HEBREW_SIDES_PATTERN.sub('', word)
+        if not word or not HEBREW_WORD_PATTERN.match(word):
+            return ()
+        new_text = []
+        self.append_word(new_text, word)
+        self.split_prefixes_and_suffixes(new_text, word)
+        return tuple(new_text)
+
     def split_and_trim_hebrew_words(self, text):
         # Split the text by whitespace or backslash
-        words = re.split(r'[\\\s]+', text)
-        # Regex pattern to match Hebrew characters with optional quotes in the middle
-        hebrew_pattern = re.compile(r'^[\u0590-\u05FF]+[\'\"]?[\u0590-\u05FF]+$')
+        words = WORD_SEPARATOR_PATTERN.split(text)
         # Trim non-Hebrew characters from the sides of each word, allowing for quotes
-        trimmed_words = [re.sub(r'^[^\u0590-\u05FF\'\"]+|[^\u0590-\u05FF\'\"]+$', '', word) for word in words]
+        trimmed_words = [NON_HEBREW_SIDES_PATTERN.sub('', word) for word in words]
         # Filter out empty strings and non-Hebrew words
-        filtered_words = [word for word in trimmed_words if word and hebrew_pattern.match(word)]
+        filtered_words = [word for word in trimmed_words if word and HEBREW_WORD_PATTERN.match(word)]
         return filtered_words
 
     def split_prefixes_and_suffixes(self, new_text, word):
@@ -63,16 +132,17 @@ class PrefixSuffixSplitterOptimizer(IndexingTextOptimizerInterface):
         self.split_suffixes(new_text, word)
 
     def split_suffixes(self, new_text, splitted_word):
-        while (len(splitted_word) >= 1 and splitted_word[-1] in self.suffixes_to_split) or \
-            (len(splitted_word) >= 2 and splitted_word[-2:] in self.suffixes_to_split) :
-            if len(splitted_word) >= 2 and splitted_word[-2:] in self.suffixes_to_split:
+        while splitted_word:
+            if splitted_word[-2:] in self._two_letter_suffixes:
                 splitted_word = splitted_word[:-2]
-            else:
+            elif splitted_word[-1] in self._one_letter_suffixes:
                 splitted_word = splitted_word[:-1]
+            else:
+                return
             self.append_word(new_text, splitted_word)
 
     def split_prefixes(self, new_text, splitted_word):
-        while len(splitted_word) >= 1 and splitted_word[0] in self.prefixes_to_split:
+        while splitted_word and splitted_word[0] in self._prefixes:
             splitted_word = splitted_word[1:]
             self.append_word(new_text, splitted_word)
             self.split_suffixes(new_text, splitted_word)
@@ -83,26 +153,13 @@ class PrefixSuffixSplitterOptimizer(IndexingTextOptimizerInterface):
         
         # Check if last letter needs conversion
         last_letter = word[-1]
-        if last_letter in "כמנפצ":
-            # Only convert to list if needed
-            word_chars = list(word)
-            word_chars[-1] = self.convert_to_ot_sofit(last_letter)
-            word = ''.join(word_chars)
+        if last_letter in OT_SOFIT:
+            word = word[:-1] + OT_SOFIT[last_letter]
         
         new_text.append(word)
 
     def convert_to_ot_sofit(self, letter):
-        if letter == "כ":
-            return "ך"
-        if letter == "מ":
-            return "ם"
-        if letter == "נ":
-            return "ן"
-        if letter == "פ":
-            return "ף"
-        if letter == "צ":
-            return "ץ"
-        return letter
+        return OT_SOFIT.get(letter, letter)
 
 
 def test():
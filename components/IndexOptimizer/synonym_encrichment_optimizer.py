@@ -2,26 +2,29 @@ import os
 import pickle
 from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
 from components.SynonymExpanders.hebrew_synonym_expander import HebrewSynonymExpander
+from components.inference_backend import InferenceBackend
 from components.web_text_unit import WebTextSection
 
 
 class SynonymEnrichmentOptimizer(IndexingTextOptimizerInterface):
 
-    def __init__(self, top_k: int):
+    def __init__(self, top_k: int, inference_backend: InferenceBackend | None = None):
         self.top_k = top_k
-        self.expander = HebrewSynonymExpander(top_k=self.top_k)
+        self.expander = HebrewSynonymExpander(top_k=self.top_k, inference_backend=inference_backend)
         self.cache_file = None
     
+    def fingerprint_params(self) -> dict:
+        # cache_file changes with every call, it is not a parameter
+        return {"top_k": self.top_k, "inference_backend": self.expander.inference_backend}
+
     def optimize_queries(self, lst_text: list[str]) -> list[str]:
         self.cache_file = os.path.join("cache","synonym optimizer", f"e_{self.expander.__class__.__name__}k_{self.top_k} q_{len(lst_text)}.pkl")
         try:
             res = self._load_from_cache()
             return res
         except FileNotFoundError:
-            res = []
-            for query in lst_text:
-                expanded = self.expander.expand_query(query)
-                res.append(expanded)
+            # All the queries in one batched prediction instead of a model call per word and template
+            res = self.expander.expand_queries(lst_text)
             self._save_to_cache(res)
             return res
 
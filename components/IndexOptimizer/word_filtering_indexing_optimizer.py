@@ -1,5 +1,5 @@
-from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
-from typing import List
+from components.IndexOptimizer.indexing_text_optimizer_interface import TokenLevelOptimizer
+from typing import Iterable
 
 words_to_filter_by_category = [
     ('או', 'conjunction'),
@@ -63,24 +63,16 @@ words_to_filter_by_category = [
 ]
 
 
-class WordFilteringIndexingOptimizer(IndexingTextOptimizerInterface):
+class WordFilteringIndexingOptimizer(TokenLevelOptimizer):
 
     def __init__(self):
         self.words_to_filter = [word for word, _ in words_to_filter_by_category]
+        # Constant time membership, the list is kept as the description of the optimizer
+        self._words_to_filter = frozenset(self.words_to_filter)
 
-    def optimize_queries(self, lst_text: List[str]) -> List[str]:
-        res = []
-        for text in lst_text:
-            res.append(self.optimize_text(text))
-        return res
+    def fingerprint_params(self) -> dict:
+        return {"words_to_filter": self.words_to_filter}
 
-    def optimize_documents(self, lst_text: List[str]) -> List[str]:
-        res = []
-        for text in lst_text:
-            res.append(self.optimize_text(text))
-        return res
-
-    def optimize_text(self, text: str) -> str:
-        text = text.split()
-        text = [word for word in text if word not in self.words_to_filter]
-        return ' '.join(text)
\ No newline at end of file
+    def optimize_tokens(self, tokens: Iterable[str]) -> Iterable[str]:
+        words_to_filter = self._words_to_filter
+        return (word for word in tokens if word not in words_to_filter)
@@ -1,5 +1,4 @@
 import os
-import google.generativeai as genai
 import time
 from components.LlmAnswerRetriever.llm_answer_retriever_interface import LlmAnswerRetrieverInterface
 import time
@@ -24,6 +23,8 @@ class Gemini():
         self.constraint_model = constraint_model
 
     def set_api_key(self, api_key):
+        # Imported on first use, the client library is slow to import and only needed once a model is configured
+        import google.generativeai as genai
         self.api_key = api_key
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel("gemini-1.5-flash")
@@ -0,0 +1,39 @@
+from typing import Callable, List, Tuple
+import time
+from components.Reranker.reranker_interface import BudgetedReranker
+from components.inference_backend import InferenceBackend
+
+
+class CrossEncoderReranker(BudgetedReranker):
+    """Reranks the retrieved sections with a CPU cross-encoder reading the question and the section together"""
+
+    def __init__(self, model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", top_n: int = 5,
+                 latency_budget: float | None = None, batch_size: int = 32, max_length: int = 512, device: str = "cpu",
+                 inference_backend: InferenceBackend | None = None, clock: Callable[[], float] = time.perf_counter):
+        """
+        model_name: multilingual cross-encoder, the questions and sections are in Hebrew.
+        max_length: tokens of a (question, section) pair, longer sections are truncated.
+        """
+        super().__init__(top_n=top_n, latency_budget=latency_budget, batch_size=batch_size, clock=clock)
+        self.model_name = model_name
+        self.max_length = max_length
+        self.device = device
+        self.inference_backend = inference_backend or InferenceBackend()
+        # The model is loaded on first use, by prepare before the first batch is timed
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device=self.device)
+            self._model.model = self.inference_backend.prepare(self._model.model, self.device)
+        return self._model
+
+    def prepare(self):
+        self.model
+
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        model = self.model
+        with self.inference_backend.context():
+            return model.predict(pairs, batch_size=len(pairs), convert_to_numpy=True, show_progress_bar=False).tolist()
@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+from typing import Callable, List, Tuple
+import time
+from components.query import Query
+from components.logger import Logger
+
+
+class RerankerInterface(ABC):
+    @abstractmethod
+    def rerank(self, queries: List[Query]):
+        """Reorders, and may cut, the answer_sources of every query in place"""
+        pass
+
+
+class NoneReranker(RerankerInterface):
+    def rerank(self, queries: List[Query]):
+        return
+
+
+class BudgetedReranker(RerankerInterface):
+    """
+    Reranker scoring (query, section) pairs in batches within a latency budget, then keeping the
+    top_n sections of every query.
+
+    Pairs of all queries are batched together, in order of retrieval rank: the first sources of
+    every query are scored first, then the second ones, and so on. Every query has its own
+    latency_budget: the time of a batch is charged to the queries by their pairs in it, and the
+    pairs of a query stop being scored once the next one would go past its budget, at the pace of
+    the last batch. Scored sources then come first, by score, followed by the unscored ones in
+    retrieval order.
+    """
+
+    def __init__(self, top_n: int = 5, latency_budget: float | None = None, batch_size: int = 32,
+                 clock: Callable[[], float] = time.perf_counter):
+        """
+        top_n: sources kept per query.
+        latency_budget: seconds of scoring per query, unbounded when None.
+        batch_size: pairs per scoring call.
+        clock: seconds the scoring time is measured with.
+        """
+        self.logger = Logger().get_logger()
+        self.top_n = top_n
+        self.latency_budget = latency_budget
+        self.batch_size = batch_size
+        self.clock = clock
+
+    @abstractmethod
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Relevance of every (query, section) pair, higher is better"""
+        pass
+
+    def prepare(self):
+        """One-time setup (loading a model), run before any pair is timed so it isn't charged to the budget"""
+        pass
+
+    def rerank(self, queries: List[Query]):
+        self.logger.debug(f'Entering rerank with {len(queries)} queries')
+        try:
+            # (query index, source index) in order of retrieval rank across the queries
+            max_sources = max((len(query.answer_sources) for query in queries), default=0)
+            pair_ids = [(i, rank) for rank in range(max_sources) for i, query in enumerate(queries) if rank < len(query.answer_sources)]
+            if pair_ids:
+                self.prepare()
+            start = self.clock()
+            scores = [{} for _ in queries]
+            spent = [0.0] * len(queries)
+            out_of_budget = set()
+            pair_seconds = 0.0
+            next_pair = 0
+            scored = 0
+            while next_pair < len(pair_ids):
+                batch = []
+                planned = [0.0] * len(queries)
+                while next_pair < len(pair_ids) and len(batch) < self.batch_size:
+                    i, rank = pair_ids[next_pair]
+                    next_pair += 1
+                    if i in out_of_budget:
+                        continue
+                    if self.latency_budget is not None and spent[i] + planned[i] + pair_seconds > self.latency_budget:
+                        out_of_budget.add(i)
+                        continue
+                    planned[i] += pair_seconds
+                    batch.append((i, rank))
+                if not batch:
+                    break
+                batch_begin = self.clock()
+                pairs = [(queries[i].query, queries[i].answer_sources[rank].get_content()) for i, rank in batch]
+                for (i, rank), score in zip(batch, self.score_pairs(pairs)):
+                    scores[i][rank] = float(score)
+                pair_seconds = (self.clock() - batch_begin) / len(batch)
+                for i, _ in batch:
+                    spent[i] += pair_seconds
+                scored += len(batch)
+            if out_of_budget:
+                self.logger.warning(f'Latency budget reached for {len(out_of_budget)} of {len(queries)} queries, '
+                                    f'scored {scored} of {len(pair_ids)} pairs')
+
+            for query, query_scores in zip(queries, scores):
+                # Stable sort, scored sources first and equal scores keep the retrieval order
+                order = sorted(range(len(query.answer_sources)),
+                               key=lambda rank: (rank not in query_scores, -query_scores.get(rank, 0.0)))
+                query.answer_sources = [query.answer_sources[rank] for rank in order[:self.top_n]]
+            self.logger.debug(f'rerank scored {scored} pairs in {self.clock() - start:.3f}s')
+        except Exception as e:
+            self.logger.error(f'Error in rerank: {e}')
+            raise
+        self.logger.debug('Exiting rerank')
@@ -2,24 +2,21 @@ from transformers import AutoTokenizer, AutoModel
 import torch
 from typing import List, Tuple, Set
 import re
+from components.inference_backend import InferenceBackend
 
 class HebrewSynonymExpander:
-    def __init__(self, model_name="onlplab/alephbert-base", top_k=5):
+    def __init__(self, model_name="onlplab/alephbert-base", top_k=5, inference_backend: InferenceBackend | None = None,
+                 batch_size: int = 256):
+        """batch_size: masked texts per forward pass of the batched predictions."""
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model_name = model_name
         self.top_k = top_k
-        
-        # Load model and tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name).to(self.device)
-        
-        # Add MLM head
-        self.mlm_head = torch.nn.Linear(
-            self.model.config.hidden_size, 
-            self.model.config.vocab_size
-        ).to(self.device)
-        
-        self.model.eval()
-        self.mlm_head.eval()
+        self.batch_size = batch_size
+        self.inference_backend = inference_backend or InferenceBackend()
+        # The tokenizer, model and MLM head are loaded on first use
+        self._tokenizer = None
+        self._model = None
+        self._mlm_head = None
 
         # Templates for synonym generation
         self.templates = [
@@ -30,12 +27,45 @@ class HebrewSynonymExpander:
             "TARGET הוא MASK",
         ]
 
+    def _load_model(self):
+        # Load model and tokenizer
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._model = AutoModel.from_pretrained(self.model_name).to(self.device)
+        
+        # Add MLM head
+        self._mlm_head = torch.nn.Linear(
+            self._model.config.hidden_size, 
+            self._model.config.vocab_size
+        ).to(self.device)
+        
+        # Puts both in eval mode, optionally quantized or compiled
+        self._model = self.inference_backend.prepare(self._model, self.device)
+        self._mlm_head = self.inference_backend.prepare(self._mlm_head, self.device)
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load_model()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load_model()
+        return self._model
+
+    @property
+    def mlm_head(self):
+        if self._mlm_head is None:
+            self._load_model()
+        return self._mlm_head
+
     def get_predictions(self, text: str) -> List[Tuple[str, float]]:
         """Get model predictions for a masked position."""
         inputs = self.tokenizer(text, return_tensors="pt")
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
-        with torch.no_grad():
+        with self.inference_backend.context():
             # Get hidden states from base model
             outputs = self.model(**inputs)
             hidden_states = outputs.last_hidden_state
@@ -58,6 +88,40 @@ class HebrewSynonymExpander:
             
             return results
 
+    def get_predictions_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """
+        Model predictions for the masked position of every text, like get_predictions, with one
+        padded forward pass per batch_size texts and a single decode of the distinct predicted tokens.
+        Every text must contain exactly one mask token.
+        """
+        tokenizer = self.tokenizer
+        top_ids, top_probs = [], []
+        with self.inference_backend.context():
+            for start in range(0, len(texts), self.batch_size):
+                inputs = tokenizer(texts[start:start + self.batch_size], return_tensors="pt", padding=True)
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                hidden_states = self.model(**inputs).last_hidden_state
+
+                # Hidden state of the mask position of every text
+                is_mask = inputs["input_ids"] == tokenizer.mask_token_id
+                mask_counts = is_mask.sum(dim=1)
+                if (mask_counts != 1).any():
+                    row = int(torch.nonzero(mask_counts != 1)[0])
+                    raise ValueError(f'Expected exactly one mask token, found {int(mask_counts[row])} in "{texts[start + row]}"')
+                mask_positions = is_mask.int().argmax(dim=1)
+                rows = torch.arange(len(mask_positions), device=hidden_states.device)
+                logits = self.mlm_head(hidden_states[rows, mask_positions])
+
+                top_tokens = torch.topk(logits, self.top_k * 3, dim=-1)
+                # Softmax of every score on its own, as get_predictions computes it
+                probs = torch.softmax(top_tokens.values.unsqueeze(-1), dim=-1).squeeze(-1)
+                top_ids.extend(top_tokens.indices.tolist())
+                top_probs.extend(probs.tolist())
+
+        distinct_ids = sorted({token_id for ids in top_ids for token_id in ids})
+        decoded = dict(zip(distinct_ids, (word.strip() for word in tokenizer.batch_decode([[token_id] for token_id in distinct_ids]))))
+        return [[(decoded[token_id], prob) for token_id, prob in zip(ids, probs)] for ids, probs in zip(top_ids, top_probs)]
+
     def filter_candidates(self, candidates: List[Tuple[str, float]], original_word: str) -> List[Tuple[str, float]]:
         """Filter and clean candidate words."""
         filtered = []
@@ -83,13 +147,26 @@ class HebrewSynonymExpander:
 
     def get_synonyms(self, word: str) -> List[Tuple[str, float]]:
         """Get synonyms for a word using multiple templates."""
-        all_predictions = []
-        
-        for template in self.templates:
-            text = template.replace('TARGET', word).replace('MASK', self.tokenizer.mask_token)
-            predictions = self.get_predictions(text)
-            all_predictions.extend(predictions)
-        
+        return self.get_synonyms_batch([word])[0]
+
+    def get_synonyms_batch(self, words: List[str]) -> List[List[Tuple[str, float]]]:
+        """Synonyms of every word, the templates of all the distinct words are predicted together."""
+        distinct_words = list(dict.fromkeys(words))
+        if not distinct_words:
+            return []
+        mask_token = self.tokenizer.mask_token
+        texts = [template.replace('TARGET', word).replace('MASK', mask_token) for word in distinct_words for template in self.templates]
+        predictions = self.get_predictions_batch(texts)
+
+        num_templates = len(self.templates)
+        synonyms = {}
+        for i, word in enumerate(distinct_words):
+            all_predictions = [prediction for template_predictions in predictions[i * num_templates:(i + 1) * num_templates]
+                               for prediction in template_predictions]
+            synonyms[word] = self._combine_predictions(all_predictions, word)
+        return [synonyms[word] for word in words]
+
+    def _combine_predictions(self, all_predictions: List[Tuple[str, float]], word: str) -> List[Tuple[str, float]]:
         # Combine predictions from all templates
         word_scores = {}
         for word, score in all_predictions:
@@ -98,7 +175,8 @@ class HebrewSynonymExpander:
             else:
                 word_scores[word] = score
         
-        # Convert back to list and filter
+        # Convert back to list and filter. The loop above rebinds word, so the candidates are filtered
+        # against the last predicted word, as get_synonyms always did
         candidates = [(word, score) for word, score in word_scores.items()]
         filtered_synonyms = self.filter_candidates(candidates, word)
         
@@ -106,15 +184,22 @@ class HebrewSynonymExpander:
 
     def expand_query(self, query: str) -> str:
         """Expand a Hebrew search query with synonyms."""
-        words = query.split()
-        expanded_words = set(words)
-        
-        for word in words:
-            synonyms = self.get_synonyms(word)
-            for synonym, _ in synonyms:
-                expanded_words.add(synonym)
-        
-        return ' '.join(expanded_words)
+        return self.expand_queries([query])[0]
+
+    def expand_queries(self, queries: List[str]) -> List[str]:
+        """Expand Hebrew search queries with synonyms, the words of all the queries are predicted together."""
+        words_per_query = [query.split() for query in queries]
+        distinct_words = list(dict.fromkeys(word for words in words_per_query for word in words))
+        synonyms_by_word = dict(zip(distinct_words, self.get_synonyms_batch(distinct_words)))
+
+        expanded_queries = []
+        for words in words_per_query:
+            expanded_words = set(words)
+            for word in words:
+                for synonym, _ in synonyms_by_word[word]:
+                    expanded_words.add(synonym)
+            expanded_queries.append(' '.join(expanded_words))
+        return expanded_queries
 
 def demo_usage():
     expander = HebrewSynonymExpander(top_k=3)
@@ -0,0 +1,76 @@
+from collections import Counter
+from typing import Dict, List
+import numpy as np
+
+# Defaults of bm25s.BM25, which scores with the lucene variant
+K1 = 1.5
+B = 0.75
+
+
+def lucene_idf(doc_freqs, num_docs):
+    """Lucene idf, as computed by bm25s"""
+    doc_freqs = np.asarray(doc_freqs, dtype=np.float64)
+    return np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+
+def lucene_tfc(term_freqs, doc_lengths, avg_doc_len, k1=K1, b=B):
+    """Lucene term frequency component, as computed by bm25s"""
+    term_freqs = np.asarray(term_freqs, dtype=np.float64)
+    return term_freqs / (k1 * ((1 - b) + b * np.asarray(doc_lengths, dtype=np.float64) / avg_doc_len) + term_freqs)
+
+
+def doc_freqs_from_scores(scores: dict) -> np.ndarray:
+    """Document frequency of every token of a bm25s index, read off its CSC score matrix"""
+    return np.diff(np.asarray(scores["indptr"], dtype=np.int64))
+
+
+def doc_token_ids_from_scores(scores: dict, doc_idx: int) -> np.ndarray:
+    """Ids of the tokens a document of a bm25s index contains"""
+    positions = np.flatnonzero(np.asarray(scores["indices"]) == doc_idx)
+    return np.searchsorted(np.asarray(scores["indptr"]), positions, side='right') - 1
+
+
+class DeltaSegment:
+    """
+    Small in-memory inverted index over the documents added since the main index was built.
+    Documents are keyed by their position in the indexer's web_text_units and tokens by their text,
+    so the segment doesn't depend on the main index vocabulary.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_tokens: Dict[int, List[str]] = {}
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __contains__(self, position: int):
+        return position in self.doc_lengths
+
+    def add(self, position: int, tokens: List[str]):
+        self.doc_lengths[position] = len(tokens)
+        self.doc_tokens[position] = tokens
+        for token, term_freq in Counter(tokens).items():
+            self.postings.setdefault(token, {})[position] = term_freq
+
+    def remove(self, position: int):
+        for token in set(self.doc_tokens.pop(position)):
+            token_postings = self.postings[token]
+            del token_postings[position]
+            if not token_postings:
+                del self.postings[token]
+        del self.doc_lengths[position]
+
+    def doc_freq(self, token: str) -> int:
+        return len(self.postings.get(token, ()))
+
+    def score_token(self, token: str, idf: float, avg_doc_len: float):
+        """Positions of the documents containing token and their BM25 contribution"""
+        token_postings = self.postings.get(token)
+        if not token_postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.fromiter(token_postings.keys(), dtype=np.int64, count=len(token_postings))
+        term_freqs = np.fromiter(token_postings.values(), dtype=np.float64, count=len(token_postings))
+        doc_lengths = np.array([self.doc_lengths[position] for position in positions], dtype=np.float64)
+        return positions, (idf * lucene_tfc(term_freqs, doc_lengths, avg_doc_len)).astype(np.float32)
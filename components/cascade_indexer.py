@@ -0,0 +1,164 @@
+import os
+from typing import List
+import numpy as np
+from components.index_data_interface import IndexerInferface, Bm25Indexer
+from components.web_text_unit import WebTextUnit
+from components.query import Query
+from components.logger import Logger
+
+CASCADE_MODES = ("rerank", "fused")
+
+
+class CascadeIndexer(IndexerInferface):
+    """
+    Two stage retrieval: BM25 proposes num_candidates units per query and a dense indexer
+    (LlmIndexer, InstractorIndexer) scores only these, with a gather of their embeddings and a
+    dot product instead of a product with the whole embedding matrix.
+
+    rerank orders the candidates by dense score, equal scores keep the BM25 order. fused orders them
+    by bm25_weight * BM25 score + (1 - bm25_weight) * dense score, both min-max normalized over
+    the candidates of the query. Queries without any BM25 candidate (no known token) fall back to
+    a dense search over the whole corpus.
+
+    add_documents and remove_documents update both stages. Units added to or replaced in the BM25
+    stage directly have no embedding yet, they are not proposed until the cascade re-indexes them.
+    """
+
+    def __init__(self, bm25: Bm25Indexer, dense: IndexerInferface, num_candidates: int = 200, mode: str = "rerank",
+                 bm25_weight: float = 0.5):
+        """
+        bm25: first stage, generates the candidates.
+        dense: second stage, must expose st_vectors, encode_queries and top_k (DenseIndexer).
+        num_candidates: BM25 candidates scored by the dense indexer per query.
+        mode: rerank or fused.
+        bm25_weight: weight of the normalized BM25 score in fused mode.
+        """
+        if mode not in CASCADE_MODES:
+            raise ValueError(f"Unknown cascade mode {mode}, expected one of {CASCADE_MODES}")
+        self.logger = Logger().get_logger()
+        self.bm25 = bm25
+        self.dense = dense
+        self.num_candidates = num_candidates
+        self.mode = mode
+        self.bm25_weight = bm25_weight
+        self.index_optimizers = []
+        self.web_text_units = None
+        self._positions = None
+
+    def set_index_optimizers(self, index_optimizers: list):
+        super().set_index_optimizers(index_optimizers)
+        self.bm25.set_index_optimizers(index_optimizers)
+        self.dense.set_index_optimizers(index_optimizers)
+
+    def _set_units(self, web_text_units: List[WebTextUnit]):
+        # The dense stage indexes the units in this order, BM25 results are mapped back to embedding rows by id
+        self.web_text_units = web_text_units
+        self._positions = {unit.get_id(): position for position, unit in enumerate(web_text_units)}
+
+    def _embedding_row(self, unit: WebTextUnit) -> int | None:
+        """Embedding row of a BM25 candidate, None when the dense stage has not embedded this version of the unit"""
+        position = self._positions.get(unit.get_id())
+        if position is None or self.web_text_units[position] is not unit:
+            return None
+        return position
+
+    def add_documents(self, web_text_units: List[WebTextUnit]):
+        """
+        Adds the units to the BM25 stage incrementally and re-indexes the dense stage over the live
+        units, a unit whose id is already indexed replaces it. With an embedding cache only the new
+        units are encoded.
+        """
+        self.logger.debug(f'Entering add_documents with {len(web_text_units)} web_text_units')
+        try:
+            self.bm25.add_documents(web_text_units)
+            live_units = {unit.get_id(): unit for unit in self.web_text_units}
+            live_units.update((unit.get_id(), unit) for unit in web_text_units)
+            self._reindex_dense(list(live_units.values()))
+        except Exception as e:
+            self.logger.error(f'Error in add_documents: {e}')
+            raise
+        self.logger.debug('Exiting add_documents')
+
+    def remove_documents(self, unit_ids: List[str]):
+        """Removes the units with the given ids (WebTextUnit.get_id()) from both stages"""
+        self.logger.debug(f'Entering remove_documents with {len(unit_ids)} ids')
+        try:
+            self.bm25.remove_documents(unit_ids)
+            removed = set(unit_ids)
+            self._reindex_dense([unit for unit in self.web_text_units if unit.get_id() not in removed])
+        except Exception as e:
+            self.logger.error(f'Error in remove_documents: {e}')
+            raise
+        self.logger.debug('Exiting remove_documents')
+
+    def _reindex_dense(self, web_text_units: List[WebTextUnit]):
+        self.dense.index_data(web_text_units)
+        self._set_units(web_text_units)
+
+    def index_data(self, web_text_units: List[WebTextUnit]):
+        self.logger.debug(f'Entering index_data with {len(web_text_units)} web_text_units')
+        try:
+            self.bm25.index_data(web_text_units)
+            self.dense.index_data(web_text_units)
+            self._set_units(web_text_units)
+        except Exception as e:
+            self.logger.error(f'Error in index_data: {e}')
+            raise
+        self.logger.debug('Exiting index_data')
+
+    def save_index(self, directory: str):
+        self.bm25.save_index(os.path.join(directory, "bm25"))
+        self.dense.save_index(os.path.join(directory, "dense"))
+
+    def load_index(self, directory: str, web_text_units: List[WebTextUnit]) -> bool:
+        if not (self.bm25.load_index(os.path.join(directory, "bm25"), web_text_units)
+                and self.dense.load_index(os.path.join(directory, "dense"), web_text_units)):
+            return False
+        self._set_units(web_text_units)
+        return True
+
+    def retrieve_answer_source(self, queries: List[Query], k: int) -> List[List[WebTextUnit]]:
+        self.logger.debug(f'Entering retrieve_answer_source with {len(queries)} queries, k={k}')
+        try:
+            candidates, bm25_scores = self.bm25.bm25_retrieve_batch([query.indexing_optimized_query for query in queries], self.num_candidates)
+            query_vectors = self.dense.encode_queries(queries)
+            results = []
+            for query, query_vector, query_candidates, query_bm25_scores in zip(queries, query_vectors, candidates, bm25_scores):
+                rows = [self._embedding_row(unit) for unit in query_candidates]
+                embedded = [i for i, row in enumerate(rows) if row is not None]
+                if embedded:
+                    positions = np.array([rows[i] for i in embedded], dtype=np.int64)
+                    ranked = positions[self._rank(query_vector, positions, np.asarray(query_bm25_scores)[embedded])[:k]]
+                else:
+                    # The dense indexer's own search, with its ANN index and quantized vectors
+                    ranked = self.dense.top_k(query_vector[None, :], k)[0][0]
+                retrieved_docs = [self.web_text_units[position] for position in ranked]
+                query.answer_sources.extend(retrieved_docs)
+                results.append(retrieved_docs)
+            self.logger.debug(f'retrieve_answer_source ranked {sum(len(c) for c in candidates)} candidates in {self.mode} mode')
+        except Exception as e:
+            self.logger.error(f'Error in retrieve_answer_source: {e}')
+            raise
+        self.logger.debug('Exiting retrieve_answer_source')
+        return results
+
+    def _rank(self, query_vector: np.ndarray, positions: np.ndarray, bm25_scores: np.ndarray) -> np.ndarray:
+        """Order of the candidates, best first"""
+        # Sorted rows read the embeddings in file order when they are memory-mapped
+        rows = np.argsort(positions)
+        dense_scores = np.empty(len(positions), dtype=np.float32)
+        dense_scores[rows] = np.asarray(self.dense.st_vectors[positions[rows]], dtype=np.float32) @ query_vector
+        if self.mode == "rerank":
+            scores = dense_scores
+        else:
+            scores = self.bm25_weight * _min_max(bm25_scores) + (1 - self.bm25_weight) * _min_max(dense_scores)
+        # Stable, so equal scores keep the BM25 order
+        return np.argsort(-scores, kind='stable')
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = scores.max() - scores.min()
+    if spread == 0:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / spread
@@ -0,0 +1,210 @@
+import json
+import mmap
+import os
+import struct
+from typing import Iterable, List
+import numpy as np
+from components.web_text_unit import WebTextUnit, WebTextSection
+
+MAGIC = b"CORPUS01"
+HEADER_SIZE_FORMAT = "<Q"
+STRING_COLUMNS = ["doc_id", "section_id", "content", "indexing_optimized_content"]
+ALIGNMENT = 8
+
+
+class CorpusStore:
+    """
+    Read-only columnar store of web text sections, opened with mmap.
+
+    File layout: MAGIC, header length, JSON header, then for every string column an int64
+    offsets array (count + 1 entries) followed by the UTF-8 blob of all its values.
+    A uint8 column marks which sections have an indexing optimized content.
+    Texts are only decoded when a section view asks for them, so opening a store is
+    near-instant and several processes mapping the same file share it through the page cache.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._open()
+
+    def _open(self):
+        with open(self.file_path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.file_path} is not a corpus store file")
+            header_size, = struct.unpack(HEADER_SIZE_FORMAT, f.read(struct.calcsize(HEADER_SIZE_FORMAT)))
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = header["count"]
+        self._offsets = {}
+        self._data_starts = {}
+        for name, column in header["columns"].items():
+            self._offsets[name] = np.frombuffer(self._mmap, dtype=np.int64, count=self.count + 1, offset=column["offsets_start"])
+            self._data_starts[name] = column["data_start"]
+        self._has_optimized = np.frombuffer(self._mmap, dtype=np.uint8, count=self.count, offset=header["has_optimized_start"])
+
+    def __getstate__(self):
+        # The mapping is reopened in the receiving process
+        return {"file_path": self.file_path}
+
+    def __setstate__(self, state):
+        self.file_path = state["file_path"]
+        self._open()
+
+    def __len__(self):
+        return self.count
+
+    def get_string(self, column: str, index: int) -> str:
+        offsets = self._offsets[column]
+        start = self._data_starts[column] + int(offsets[index])
+        end = self._data_starts[column] + int(offsets[index + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def get_indexing_optimized_content(self, index: int) -> str | None:
+        if not self._has_optimized[index]:
+            return None
+        return self.get_string("indexing_optimized_content", index)
+
+    def units(self) -> List["StoredWebTextSection"]:
+        return [StoredWebTextSection(self, i) for i in range(self.count)]
+
+    @staticmethod
+    def write(file_path: str, units: Iterable[WebTextUnit]):
+        """Writes the units to a new store file and atomically replaces file_path with it"""
+        columns = {name: [] for name in STRING_COLUMNS}
+        has_optimized = []
+        for unit in units:
+            optimized = unit.get_indexing_optimized_content()
+            columns["doc_id"].append(unit.get_doc_id().encode('utf-8'))
+            columns["section_id"].append(_unit_section_id(unit).encode('utf-8'))
+            columns["content"].append(unit.get_content().encode('utf-8'))
+            columns["indexing_optimized_content"].append(optimized.encode('utf-8') if optimized is not None else b"")
+            has_optimized.append(optimized is not None)
+        count = len(has_optimized)
+
+        # Column positions are relative to the end of the header until its size is known
+        header = {"count": count, "columns": {}, "has_optimized_start": 0}
+        blobs = []
+        position = 0
+        for name in STRING_COLUMNS:
+            offsets = np.zeros(count + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in columns[name]], out=offsets[1:])
+            header["columns"][name] = {"offsets_start": position, "data_start": position + offsets.nbytes}
+            blobs.append(offsets.tobytes())
+            blob = b"".join(columns[name])
+            blobs.append(blob + b"\0" * _padding(len(blob)))
+            position += offsets.nbytes + len(blob) + _padding(len(blob))
+        header["has_optimized_start"] = position
+        blobs.append(np.array(has_optimized, dtype=np.uint8).tobytes())
+
+        # Shift the relative positions by the header size, keeping the arrays 8-byte aligned
+        header_size = 0
+        while True:
+            data_start = len(MAGIC) + struct.calcsize(HEADER_SIZE_FORMAT) + header_size
+            data_start += _padding(data_start)
+            shifted = _shift_header(header, data_start)
+            encoded = json.dumps(shifted).encode('utf-8')
+            if len(encoded) == header_size:
+                break
+            header_size = len(encoded)
+
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        tmp_file = file_path + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack(HEADER_SIZE_FORMAT, header_size))
+            f.write(encoded)
+            f.write(b"\0" * (data_start - f.tell()))
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_file, file_path)
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+def _shift_header(header: dict, data_start: int) -> dict:
+    shifted = {"count": header["count"], "columns": {}, "has_optimized_start": header["has_optimized_start"] + data_start}
+    for name, column in header["columns"].items():
+        shifted["columns"][name] = {key: value + data_start for key, value in column.items()}
+    return shifted
+
+
+def _unit_section_id(unit: WebTextUnit) -> str:
+    section_id = getattr(unit, "section_id", None)
+    if section_id is not None:
+        return section_id
+    # Fall back to the id suffix for units that only expose get_id
+    return unit.get_id()[len(unit.get_doc_id()) + 1:]
+
+
+class StoredWebTextSection(WebTextUnit):
+    """
+    Lazy view of a section inside a CorpusStore. Texts are decoded from the mapping on access.
+    Setting indexing_optimized_content keeps the new value on the view, the store is read-only.
+    """
+    __slots__ = ("store", "index", "_optimized_content", "_optimized_content_set")
+
+    def __init__(self, store: CorpusStore, index: int):
+        self.store = store
+        self.index = index
+        self._optimized_content = None
+        self._optimized_content_set = False
+
+    @property
+    def doc_id(self) -> str:
+        return self.store.get_string("doc_id", self.index)
+
+    @property
+    def section_id(self) -> str:
+        return self.store.get_string("section_id", self.index)
+
+    @property
+    def content(self) -> str:
+        return self.store.get_string("content", self.index)
+
+    @property
+    def indexing_optimized_content(self) -> str | None:
+        if self._optimized_content_set:
+            return self._optimized_content
+        return self.store.get_indexing_optimized_content(self.index)
+
+    @indexing_optimized_content.setter
+    def indexing_optimized_content(self, value: str | None):
+        self._optimized_content = value
+        self._optimized_content_set = True
+
+    def get_id(self) -> str:
+        return self.doc_id + "_" + self.section_id
+
+    def get_doc_id(self) -> str:
+        return self.doc_id
+
+    def get_content(self) -> str:
+        return self.content
+
+    def get_indexing_optimized_content(self) -> str:
+        return self.indexing_optimized_content
+
+    def to_section(self) -> WebTextSection:
+        return WebTextSection(self.doc_id, self.section_id, self.content, self.indexing_optimized_content)
+
+    def to_dict(self):
+        return self.to_section().to_dict()
+
+    def __getstate__(self):
+        return (self.store, self.index, self._optimized_content, self._optimized_content_set)
+
+    def __setstate__(self, state):
+        self.store, self.index, self._optimized_content, self._optimized_content_set = state
+
+    def __eq__(self, other):
+        if not isinstance(other, (WebTextSection, StoredWebTextSection)):
+            return NotImplemented
+        return (self.doc_id, self.section_id, self.content, self.indexing_optimized_content) == \
+            (other.doc_id, other.section_id, other.content, other.indexing_optimized_content)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"StoredWebTextSection(doc_id={self.doc_id!r}, section_id={self.section_id!r}, index={self.index})"
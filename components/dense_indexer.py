@@ -0,0 +1,180 @@
+from components.index_data_interface import IndexerInferface
+from components.web_text_unit import WebTextUnit
+from components.query import Query
+from components.logger import Logger
+from components.dense_search import dense_top_k
+from components.embedding_cache import EmbeddingCache
+from components.ivf_index import IvfIndex
+from components.quantized_vectors import QuantizedVectors, memory_mapped
+from components.query_embedding_cache import QueryEmbeddingCache
+from components.encoding_scheduler import EncodingScheduler, SentenceEncoder
+from components.inference_backend import InferenceBackend
+from sentence_transformers import SentenceTransformer
+import numpy as np
+import json
+import os
+import torch
+from tqdm import tqdm
+from typing import Iterable, List
+
+class DenseIndexer(IndexerInferface):
+    """
+    Sentence embedding indexer: normalized document embeddings (st_vectors) searched by dot product,
+    with the embedding cache, the ANN index and the quantized vectors shared by all dense indexers.
+    Subclasses set doc_instraction and query_instraction to encode INSTRUCTOR style
+    [[instruction, text], ...] inputs, None encodes the plain texts.
+    """
+    doc_instraction: str | None = None
+    query_instraction: str | None = None
+
+    def __init__(self, model, batch_size=64, embedding_cache_dir: str | None = None, ann_index: IvfIndex | None = None,
+                 quantized_vectors: QuantizedVectors | None = None, query_batch_size: int = 32, query_cache_size: int = 1024,
+                 encoding_scheduler: EncodingScheduler | None = None, inference_backend: InferenceBackend | None = None):
+        """
+        embedding_cache_dir: directory where document embeddings are persisted by content hash, so
+                             re-indexing only encodes new or changed sections. None disables the cache.
+        ann_index: approximate nearest neighbour index built over the document embeddings and saved
+                   with them, queries probe it instead of scoring every document. None searches exactly.
+        quantized_vectors: compact (float16, int8 or pq) copy of the document embeddings, saved with them.
+                           Queries are scored on it and their best candidates are rescored against
+                           the full embeddings, which are then memory-mapped from disk.
+        query_batch_size: queries encoded per model call.
+        query_cache_size: query embeddings kept in an LRU cache, so repeated queries skip the model. 0 disables it.
+        encoding_scheduler: batches the corpus by length and optionally encodes it in worker processes,
+                            EncodingScheduler(batch_size) (length bucketing, in process) when None.
+        inference_backend: how the model runs (int8 quantization, compilation), fp32 eager when None.
+        """
+        self.logger = Logger().get_logger()
+        self.model_name = model
+        self._model = None
+        self.web_text_units = None
+        self.doc_ids = []
+        self.batch_size = batch_size
+        self.st_vectors = None
+        self.embedding_cache_dir = embedding_cache_dir
+        self.ann_index = ann_index
+        self.quantized_vectors = quantized_vectors
+        self.query_batch_size = query_batch_size
+        self.query_cache = QueryEmbeddingCache(query_cache_size)
+        self.encoding_scheduler = encoding_scheduler or EncodingScheduler(batch_size)
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.inference_backend = inference_backend or InferenceBackend()
+
+    def fingerprint_params(self) -> dict:
+        # The model is kept by name, reading the model property would load it
+        return {**super().fingerprint_params(), "model": self.model_name}
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """Loaded on first use, so constructing the indexer or reloading a saved index doesn't load the model"""
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+            self._model = self.inference_backend.prepare(self._model, self.device)
+        return self._model
+
+    def index_data(self, web_text_units: List[WebTextUnit]):
+        batches = [web_text_units[i:i + self.batch_size] for i in range(0, len(web_text_units), self.batch_size)]
+        self.index_data_batches(tqdm(batches, desc="Indexing documents"))
+
+    def index_data_batches(self, batches: Iterable[List[WebTextUnit]]):
+        """Embeds a stream of batches, reusing the embeddings of the embedding cache when one is configured"""
+        self.web_text_units = []
+        batch_embeddings = []
+        self.doc_ids = []
+        # Sections whose content, model, instruction and backend are unchanged reuse their cached embedding
+        cache = EmbeddingCache(self.embedding_cache_dir, self.model_name, self.doc_instraction or "",
+                               repr(self.inference_backend)) if self.embedding_cache_dir is not None else None
+        try:
+            pending_texts = []
+            for batch in batches:
+                self.web_text_units.extend(batch)
+                pending_texts.extend(web_text_unit.get_content() for web_text_unit in batch)
+                self.doc_ids.extend([web_text_unit.get_doc_id() for web_text_unit in batch])
+                # Texts are collected over several batches, so the scheduler can group sections of similar lengths
+                if len(pending_texts) >= self.encoding_scheduler.window_size:
+                    batch_embeddings.append(self._encode_corpus(pending_texts, cache))
+                    pending_texts = []
+            if pending_texts:
+                batch_embeddings.append(self._encode_corpus(pending_texts, cache))
+        finally:
+            # The encoding workers hold a model each, they are not kept once the corpus is encoded
+            self.encoding_scheduler.close()
+        if cache is not None:
+            cache.save()
+
+        # Batches are concatenated once, instead of copying a list of per-row arrays
+        self.st_vectors = np.concatenate(batch_embeddings, dtype=np.float32) if batch_embeddings else np.empty((0, 0), dtype=np.float32)
+        if self.ann_index is not None:
+            self.ann_index.build(self.st_vectors)
+        if self.quantized_vectors is not None:
+            self.quantized_vectors.fit(self.st_vectors)
+            self.st_vectors = memory_mapped(self.st_vectors)
+
+    def _encode_corpus(self, texts: List[str], cache: EmbeddingCache | None) -> np.ndarray:
+        if cache is not None:
+            return cache.encode(texts, self._encode_documents)
+        return self._encode_documents(texts)
+
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
+        # Worker processes load the model by name, the parent only shares a model it already loaded
+        model = self._model if self.encoding_scheduler.num_workers > 0 else self.model
+        encoder = SentenceEncoder(self.model_name, self.doc_instraction, self.device, model, self.inference_backend)
+        return self.encoding_scheduler.encode(texts, encoder)
+
+    def save_index(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "st_vectors.npy"), self.st_vectors)
+        with open(os.path.join(directory, "doc_ids.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.doc_ids, f, ensure_ascii=False)
+        if self.ann_index is not None:
+            self.ann_index.save(directory)
+        if self.quantized_vectors is not None:
+            self.quantized_vectors.save(directory)
+            # Only the codes stay resident, the full vectors are read from disk for rescoring
+            self.st_vectors = np.load(os.path.join(directory, "st_vectors.npy"), mmap_mode='r')
+
+    def load_index(self, directory: str, web_text_units: List[WebTextUnit]) -> bool:
+        vectors_file = os.path.join(directory, "st_vectors.npy")
+        if not os.path.exists(vectors_file):
+            return False
+        st_vectors = np.load(vectors_file, mmap_mode='r' if self.quantized_vectors is not None else None)
+        if len(st_vectors) != len(web_text_units):
+            return False
+        with open(os.path.join(directory, "doc_ids.json"), encoding='utf-8') as f:
+            self.doc_ids = json.load(f)
+        self.st_vectors = st_vectors
+        self.web_text_units = web_text_units
+        if self.ann_index is not None and not self.ann_index.load(directory, len(st_vectors)):
+            self.ann_index.build(st_vectors)
+        if self.quantized_vectors is not None and not self.quantized_vectors.load(directory, len(st_vectors)):
+            self.quantized_vectors.fit(st_vectors)
+        return True
+
+    def _encode_queries(self, texts: List[str]) -> np.ndarray:
+        inputs = texts if self.query_instraction is None else [[self.query_instraction, text] for text in texts]
+        with self.inference_backend.context():
+            return self.model.encode(inputs, batch_size=self.query_batch_size, device=self.device, convert_to_numpy=True,
+                                     normalize_embeddings=True)
+
+    def encode_queries(self, queries: List[Query]) -> np.ndarray:
+        """Normalized embeddings of the queries (num_queries x dimension), comparable to st_vectors"""
+        queries_text = [query.query for query in queries]
+        return self.query_cache.encode(queries_text, self._encode_queries, self.model_name, self.query_instraction or "",
+                                       self.query_batch_size, repr(self.inference_backend))
+
+    def top_k(self, query_vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Indices and scores of the k best documents of every query embedding, through the ANN index and quantized vectors when configured"""
+        return dense_top_k(query_vectors, self.st_vectors, k, self.ann_index, self.quantized_vectors)
+
+    def retrieve_answer_source(self, queries: List[Query], k: int) -> List[List[WebTextUnit]]:
+        # Repeated queries come from the query embedding cache
+        q_emb = self.encode_queries(queries)
+        self.logger.debug(f'Searching {q_emb.shape} query embeddings against {self.st_vectors.shape} document embeddings')
+        topk_indices, _ = self.top_k(q_emb, k)
+
+        results = []
+        for query_idx, query in enumerate(queries):
+            retrieved_docs = [self.web_text_units[i] for i in topk_indices[query_idx]]
+            query.answer_sources.extend(retrieved_docs)
+            results.append(retrieved_docs)
+        return results
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Default block sizes: a block of scores is query_block_size x doc_block_size floats (16 MB in float32)
+QUERY_BLOCK_SIZE = 256
+DOC_BLOCK_SIZE = 16384
+
+
+def top_k_similarity(query_vectors: np.ndarray, doc_vectors: np.ndarray, k: int,
+                     query_block_size: int = QUERY_BLOCK_SIZE, doc_block_size: int = DOC_BLOCK_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k documents of every query by dot product, without materializing the full query x document matrix.
+
+    Scores are computed block by block, each block of documents is reduced to its top-k with argpartition
+    and merged into the running top-k of the queries, so memory stays within one block of scores.
+    doc_vectors may be a memory-mapped array, only one block is read at a time.
+
+    Returns (indices, scores) of shape (num_queries, k), sorted by decreasing score. Equal scores are
+    ordered by document index.
+    """
+    num_queries, num_docs = len(query_vectors), len(doc_vectors)
+    k = min(k, num_docs)
+    top_indices = np.empty((num_queries, k), dtype=np.int64)
+    top_scores = np.empty((num_queries, k), dtype=np.float32)
+    if k == 0:
+        return top_indices, top_scores
+
+    for query_start in range(0, num_queries, query_block_size):
+        queries = query_vectors[query_start:query_start + query_block_size]
+        running_indices = np.empty((len(queries), 0), dtype=np.int64)
+        running_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for doc_start in range(0, num_docs, doc_block_size):
+            block_scores = queries @ np.asarray(doc_vectors[doc_start:doc_start + doc_block_size]).T
+            block_indices = _top_k_columns(block_scores, k)
+            running_scores = np.concatenate([running_scores, np.take_along_axis(block_scores, block_indices, axis=1)], axis=1)
+            running_indices = np.concatenate([running_indices, block_indices + doc_start], axis=1)
+            keep = _top_k_columns(running_scores, k)
+            running_scores = np.take_along_axis(running_scores, keep, axis=1)
+            running_indices = np.take_along_axis(running_indices, keep, axis=1)
+
+        order = np.lexsort((running_indices, -running_scores), axis=1)
+        top_indices[query_start:query_start + len(queries)] = np.take_along_axis(running_indices, order, axis=1)
+        top_scores[query_start:query_start + len(queries)] = np.take_along_axis(running_scores, order, axis=1)
+    return top_indices, top_scores
+
+
+def _top_k_columns(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest scores of every row, unordered"""
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def rescore(query_vectors: np.ndarray, candidates: np.ndarray, doc_vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k of every query among its candidate rows of doc_vectors (num_queries x num_candidates),
+    after a coarse search over quantized vectors. Only the candidate rows are read, so doc_vectors
+    can stay memory-mapped on disk.
+    """
+    unique = np.unique(candidates)
+    vectors = np.asarray(doc_vectors[unique], dtype=np.float32)
+    k = min(k, candidates.shape[1])
+    top_indices = np.empty((len(query_vectors), k), dtype=np.int64)
+    top_scores = np.empty((len(query_vectors), k), dtype=np.float32)
+    for query_idx, query_vector in enumerate(query_vectors):
+        # Sorted candidates break equal scores by document index
+        rows = np.searchsorted(unique, np.sort(candidates[query_idx]))
+        positions, scores = top_k_similarity(query_vector[None, :], vectors[rows], k)
+        top_indices[query_idx] = unique[rows[positions[0]]]
+        top_scores[query_idx] = scores[0]
+    return top_indices, top_scores
+
+
+def dense_top_k(query_vectors: np.ndarray, doc_vectors: np.ndarray, k: int, ann_index=None, quantized_vectors=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k search of the dense indexers. The candidates come from ann_index when given, exact search
+    otherwise. With quantized_vectors, k * quantized_vectors.rescore_factor candidates are scored on the compact codes
+    and the best k of them are rescored against the full doc_vectors.
+    """
+    vectors = doc_vectors if quantized_vectors is None else quantized_vectors
+    num_candidates = k if quantized_vectors is None else k * quantized_vectors.rescore_factor
+    if ann_index is not None:
+        indices, scores = ann_index.search(query_vectors, vectors, num_candidates)
+    else:
+        indices, scores = top_k_similarity(query_vectors, vectors, num_candidates)
+    if quantized_vectors is not None:
+        indices, scores = rescore(query_vectors, indices, doc_vectors, k)
+    return indices, scores
@@ -0,0 +1,117 @@
+import json
+import os
+from typing import Callable, List
+import numpy as np
+from components.fingerprint import content_hash, fingerprint
+from components.logger import Logger
+
+
+class EmbeddingCache:
+    """
+    Persistent store of text embeddings, reused across index builds.
+
+    Embeddings of one model, instruction prefix and inference backend live under directory/<fingerprint of them>/:
+    vectors.npy holds one row per distinct text and hashes.json the content hash of the text of
+    every row. The vectors are memory-mapped when the cache is opened, so only the rows a build
+    asks for are read. New embeddings are kept in memory until save() rewrites the files.
+    """
+
+    def __init__(self, directory: str, model_name: str, instruction: str = "", backend: str = ""):
+        """
+        directory: root directory of the cache, shared by all models.
+        model_name: name of the embedding model, part of the cache key.
+        instruction: prefix the texts are encoded with (INSTRUCTOR style models), part of the cache key.
+        backend: how the model runs, the repr of its InferenceBackend, part of the cache key since
+                 int8 quantized models return slightly different embeddings.
+        """
+        self.logger = Logger().get_logger()
+        self.directory = os.path.join(directory, fingerprint(str(model_name), instruction, backend))
+        self.rows = {}  # content hash -> row
+        self.hashes = []
+        self.vectors = None
+        self.pending = []
+        self._open()
+
+    def _open(self):
+        vectors_file = os.path.join(self.directory, "vectors.npy")
+        hashes_file = os.path.join(self.directory, "hashes.json")
+        self.rows, self.hashes, self.vectors, self.pending = {}, [], None, []
+        if not (os.path.exists(vectors_file) and os.path.exists(hashes_file)):
+            return
+        with open(hashes_file, encoding='utf-8') as f:
+            hashes = json.load(f)
+        vectors = np.load(vectors_file, mmap_mode='r')
+        if len(vectors) != len(hashes):
+            # An interrupted save, start over rather than pair texts with the wrong vectors
+            self.logger.warning(f'Embedding cache in {self.directory} is inconsistent, ignoring it')
+            return
+        self.hashes = hashes
+        self.vectors = vectors
+        self.rows = {text_hash: row for row, text_hash in enumerate(hashes)}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings of texts (len(texts) x dimension). Only the texts missing from the cache are
+        passed to encode_fn, once each, and their embeddings are added to the cache.
+        """
+        text_hashes = [content_hash(text) for text in texts]
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in self.rows and text_hash not in missing:
+                missing[text_hash] = text
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            if self.vectors is not None and new_vectors.shape[1:] != self.vectors.shape[1:]:
+                raise ValueError(f'Embeddings of shape {new_vectors.shape[1:]} do not match the cached {self.vectors.shape[1:]}')
+            for text_hash in missing:
+                self.rows[text_hash] = len(self.hashes)
+                self.hashes.append(text_hash)
+            self.pending.append(new_vectors)
+        self.logger.debug(f'Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts reused, {len(missing)} encoded')
+        return self._gather(np.array([self.rows[text_hash] for text_hash in text_hashes], dtype=np.int64))
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        num_stored = 0 if self.vectors is None else len(self.vectors)
+        pending = np.concatenate(self.pending) if len(self.pending) > 1 else (self.pending[0] if self.pending else None)
+        if len(self.pending) > 1:
+            self.pending = [pending]
+        if self.vectors is None and pending is None:
+            return np.empty((0, 0), dtype=np.float32)
+        shape = (self.vectors if self.vectors is not None else pending).shape[1:]
+        result = np.empty((len(rows),) + shape, dtype=np.float32)
+        stored = rows < num_stored
+        if stored.any():
+            result[stored] = self.vectors[rows[stored]]
+        if not stored.all():
+            result[~stored] = pending[rows[~stored] - num_stored]
+        return result
+
+    def save(self):
+        """Writes the embeddings added since the cache was opened, replacing the files atomically"""
+        if not self.pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        pending = np.concatenate(self.pending)
+        num_stored = 0 if self.vectors is None else len(self.vectors)
+        vectors_file = os.path.join(self.directory, "vectors.npy")
+        hashes_file = os.path.join(self.directory, "hashes.json")
+        # Streamed into a memory-mapped file, the stored vectors are never loaded into memory all at once
+        tmp_vectors_file = vectors_file + ".tmp.npy"
+        out = np.lib.format.open_memmap(tmp_vectors_file, mode='w+', dtype=np.float32, shape=(num_stored + len(pending),) + pending.shape[1:])
+        if num_stored:
+            out[:num_stored] = self.vectors
+        out[num_stored:] = pending
+        out.flush()
+        del out
+        tmp_hashes_file = hashes_file + ".tmp"
+        with open(tmp_hashes_file, 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f)
+        # The vectors are replaced first: if the hashes are not, the lengths differ and the cache is ignored
+        self.vectors = None
+        os.replace(tmp_vectors_file, vectors_file)
+        os.replace(tmp_hashes_file, hashes_file)
+        self.logger.debug(f'Embedding cache saved with {len(self.hashes)} embeddings to {self.directory}')
+        self._open()
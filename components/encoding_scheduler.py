@@ -0,0 +1,128 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List
+import multiprocessing
+import numpy as np
+from components.logger import Logger
+
+# Models already loaded by this process, keyed by model name, device and inference backend
+_loaded_models = {}
+
+
+def _init_worker(torch_threads: int | None):
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+
+class SentenceEncoder:
+    """
+    Picklable SentenceTransformer encoding function. Only the model name travels to worker
+    processes, each of them loads the model once and reuses it for all its batches.
+    """
+
+    def __init__(self, model_name: str, instruction: str | None = None, device: str | None = None, model=None, inference_backend=None):
+        """
+        instruction: INSTRUCTOR style prefix, texts are encoded as [[instruction, text], ...] when given.
+        model: already loaded model, used by the process that created the encoder.
+        inference_backend: InferenceBackend the models loaded by worker processes are prepared with.
+        """
+        self.model_name = model_name
+        self.instruction = instruction
+        self.device = device
+        self.model = model
+        self.inference_backend = inference_backend
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["model"] = None
+        # Worker processes encode on CPU
+        state["device"] = "cpu"
+        return state
+
+    def _get_model(self):
+        if self.model is None:
+            key = (self.model_name, self.device, repr(self.inference_backend))
+            if key not in _loaded_models:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(self.model_name, device=self.device)
+                _loaded_models[key] = self.inference_backend.prepare(model, self.device) if self.inference_backend is not None else model
+            self.model = _loaded_models[key]
+        return self.model
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        inputs = texts if self.instruction is None else [[self.instruction, text] for text in texts]
+        model = self._get_model()
+        if self.inference_backend is None:
+            return model.encode(inputs, batch_size=len(inputs), device=self.device, convert_to_numpy=True, normalize_embeddings=True)
+        with self.inference_backend.context():
+            return model.encode(inputs, batch_size=len(inputs), device=self.device, convert_to_numpy=True, normalize_embeddings=True)
+
+
+class EncodingScheduler:
+    """
+    Schedules corpus encoding in length-bucketed batches, optionally over a pool of CPU processes.
+
+    Texts are sorted by length before being cut into batches, so every batch pads its texts to a
+    similar length instead of padding short sections to the longest one of a corpus-order batch.
+    Embeddings are returned in the original order. With num_workers > 0 the batches are encoded
+    by worker processes, each running torch with torch_threads threads.
+    """
+
+    def __init__(self, batch_size: int = 64, num_workers: int = 0, torch_threads: int | None = None, length_fn: Callable[[str], int] = len):
+        """
+        batch_size: texts per encoder call.
+        num_workers: encoding processes, 0 encodes in the calling process.
+        torch_threads: torch intra-op threads of every worker, torch's default when None.
+        length_fn: length texts are bucketed by, characters by default as a cheap proxy of tokens.
+        """
+        self.logger = Logger().get_logger()
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.torch_threads = torch_threads
+        self.length_fn = length_fn
+        self.executor = None
+
+    @property
+    def window_size(self) -> int:
+        """Texts worth collecting before encoding, so sorting them gives every worker several buckets"""
+        return self.batch_size * max(1, self.num_workers) * 8
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn: forking a process that already runs torch threads can deadlock
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_worker, initargs=(self.torch_threads,))
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None
+        return state
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings of texts in their original order. encode_fn must be picklable when num_workers > 0"""
+        self.logger.debug(f'Entering encode with {len(texts)} texts')
+        try:
+            order = sorted(range(len(texts)), key=lambda i: self.length_fn(texts[i]), reverse=True)
+            batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+            batch_texts = [[texts[i] for i in batch] for batch in batches]
+            if self.num_workers > 0 and len(batches) > 1:
+                batch_vectors = self._get_executor().map(encode_fn, batch_texts)
+            else:
+                batch_vectors = map(encode_fn, batch_texts)
+            result = None
+            for batch, vectors in zip(batches, batch_vectors):
+                vectors = np.asarray(vectors, dtype=np.float32)
+                if result is None:
+                    result = np.empty((len(texts),) + vectors.shape[1:], dtype=np.float32)
+                result[batch] = vectors
+        except Exception as e:
+            self.logger.error(f'Error in encode: {e}')
+            raise
+        self.logger.debug('Exiting encode')
+        return result if result is not None else np.empty((0, 0), dtype=np.float32)
@@ -0,0 +1,86 @@
+import hashlib
+import inspect
+import json
+from typing import Iterable, List
+from components.web_text_unit import WebTextUnit
+
+SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def describe_value(value):
+    """
+    JSON-friendly description of a parameter. Components (optimizers, indexers) are described by their
+    fingerprint_params, objects defining their own __repr__ (InferenceBackend) by it, and other
+    objects such as models by their class name
+    """
+    if hasattr(value, "fingerprint_params"):
+        return describe_component(value)
+    if isinstance(value, SIMPLE_TYPES):
+        return value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [describe_value(item) for item in value]
+        return sorted(items, key=repr) if isinstance(value, (set, frozenset)) else items
+    if isinstance(value, dict):
+        return {str(key): describe_value(item) for key, item in value.items()}
+    if type(value).__repr__ is not object.__repr__:
+        return repr(value)
+    return f"<{value.__class__.__name__}>"
+
+
+def constructor_params(component) -> dict:
+    """Constructor parameters of a component, through its base classes, that it keeps under an attribute of the same name"""
+    attributes = vars(component)
+    params = {}
+    for cls in type(component).__mro__:
+        if "__init__" not in cls.__dict__:
+            continue
+        for name in inspect.signature(cls.__dict__["__init__"]).parameters:
+            if name in attributes and name not in params:
+                params[name] = attributes[name]
+    return params
+
+
+def describe_component(component) -> dict:
+    """Class and explicit parameters (fingerprint_params) of a component, not its live attributes"""
+    params = {name: describe_value(value) for name, value in sorted(component.fingerprint_params().items())}
+    return {"class": component.__class__.__name__, "params": params}
+
+
+def optimizer_chain_signature(optimizers: Iterable) -> List[dict]:
+    """Ordered description of an optimizer chain: class names and their parameters"""
+    return [describe_component(optimizer) for optimizer in optimizers]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CorpusHasher:
+    """Incrementally hashes the ids and contents of a corpus, so it can follow a stream of batches"""
+
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.count = 0
+
+    def update(self, web_text_units: Iterable[WebTextUnit]):
+        for unit in web_text_units:
+            self.sha.update(unit.get_id().encode('utf-8'))
+            self.sha.update(b"\0")
+            self.sha.update(unit.get_content().encode('utf-8'))
+            self.sha.update(b"\0")
+            self.count += 1
+
+    def hexdigest(self) -> str:
+        return f"{self.sha.hexdigest()}_{self.count}"
+
+
+def corpus_content_hash(web_text_units: Iterable[WebTextUnit]) -> str:
+    hasher = CorpusHasher()
+    hasher.update(web_text_units)
+    return hasher.hexdigest()
+
+
+def fingerprint(*parts) -> str:
+    """Stable short hash of JSON-serializable parts"""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
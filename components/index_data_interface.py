@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
+from typing import Iterable, List
+from collections import Counter
+import json
+import os
+import threading
 import bm25s
+import numpy as np
 from components.web_text_unit import WebTextUnit
 from components.query import Query
 from components.logger import Logger
+from components.fingerprint import CorpusHasher, constructor_params, fingerprint, optimizer_chain_signature
+from components.bm25_segments import DeltaSegment, doc_freqs_from_scores, doc_token_ids_from_scores, lucene_idf
 
 class IndexerInferface(ABC):
     @abstractmethod
@@ -13,71 +21,434 @@ class IndexerInferface(ABC):
     def retrieve_answer_source(self, queries, k) -> list[WebTextUnit]:
         pass
 
+    def index_data_batches(self, batches: Iterable[List[WebTextUnit]]):
+        """
+        Indexes a stream of batches. Implementations that can build their index
+        incrementally override it, the default collects the whole corpus first.
+        """
+        web_text_units = []
+        for batch in batches:
+            web_text_units.extend(batch)
+        return self.index_data(web_text_units)
+
+    def set_index_optimizers(self, index_optimizers: list):
+        """Lets the indexer know which optimizer chain produced the indexing optimized contents"""
+        self.index_optimizers = index_optimizers
+
+    def fingerprint_params(self) -> dict:
+        """
+        Parameters the built index depends on, part of the saved retrieval state. Defaults to the
+        constructor parameters kept under an attribute of the same name.
+        """
+        return constructor_params(self)
+
+    def save_index(self, directory: str):
+        """Persists the built index so it can be reused by load_index. Indexers that can't persist do nothing."""
+        pass
+
+    def load_index(self, directory: str, web_text_units: list[WebTextUnit]) -> bool:
+        """
+        Restores an index saved by save_index over the same web_text_units.
+        Returns False when there is nothing to restore, the caller then indexes the data.
+        """
+        return False
+
 class Bm25Indexer(IndexerInferface):
 
-    def __init__(self):
+    def __init__(self, index_dir: str | None = None, mmap: bool = False, n_threads: int = 0, merge_threshold: int = 1000):
+        """
+        index_dir: directory where built indexes are persisted, each under the fingerprint of
+                   the corpus content and the optimizer chain. A matching index is reloaded
+                   instead of re-indexing. None disables persistence.
+        mmap: memory-map the arrays of reloaded indexes instead of reading them into memory.
+        n_threads: threads used to score a batch of queries, 0 scores them in the calling thread
+                   and -1 uses all available cores.
+        merge_threshold: number of documents added or removed through add_documents/remove_documents
+                         after which the delta segment is merged into the main index in the background.
+        """
         self.logger = Logger().get_logger()
         self.web_text_units = None
         self.corpus_tokens = None
         self.dictionary = None
         self.index = None
+        self.index_dir = index_dir
+        self.mmap = mmap
+        self.n_threads = n_threads
+        self.index_optimizers = []
+        self.merge_threshold = merge_threshold
+        self.avg_doc_len = None
+        # Incremental updates: documents added since the main index was built live in the delta segment,
+        # removed documents are tombstoned by their position in web_text_units
+        self.delta = DeltaSegment()
+        self.tombstones = set()
+        self._main_doc_freqs = None
+        self._main_idf = None
+        self._main_tombstoned_doc_freqs = Counter()
+        self._id_positions = None
+        self._lock = threading.RLock()
+        self._merge_thread = None
+        self._pending_operations = None
 
     def index_data(self, web_text_units : list[WebTextUnit]):
         self.logger.debug(f'Entering index_data with {len(web_text_units)} web_text_units')
-        try:
-            self.web_text_units = web_text_units
-            # Prepare the corpus for BM25
-            corpus = [u.get_indexing_optimized_content() for u in web_text_units]
+        if self.index_dir is not None:
+            hasher = CorpusHasher()
+            hasher.update(web_text_units)
+            if self.load_index(self._fingerprinted_index_dir(hasher.hexdigest()), web_text_units):
+                self.logger.debug('Reloaded persisted BM25 index')
+                return self.index
+        return self.index_data_batches([web_text_units])
+
+    def fingerprint(self, corpus_hash: str) -> str:
+        """Fingerprint of everything the index depends on: corpus content, optimizer chain and BM25 parameters"""
+        return fingerprint(corpus_hash, optimizer_chain_signature(self.index_optimizers), self.bm25_params())
+
+    def fingerprint_params(self) -> dict:
+        return {**super().fingerprint_params(), "bm25": self.bm25_params()}
+
+    @staticmethod
+    def _new_retriever() -> bm25s.BM25:
+        return bm25s.BM25()
 
-            # Initialize BM25 index
-            self.index = bm25s.BM25()
+    @classmethod
+    def bm25_params(cls) -> dict:
+        """Scoring parameters of the retriever the index is built with"""
+        retriever = cls._new_retriever()
+        return {"k1": retriever.k1, "b": retriever.b, "delta": retriever.delta, "method": retriever.method,
+                "idf_method": retriever.idf_method, "bm25s": bm25s.__version__}
 
-            # 1) Tokenize the corpus and retrieve both tokens & dictionary
-            self.corpus_tokens, self.dictionary = bm25s.tokenize(corpus)
+    def _fingerprinted_index_dir(self, corpus_hash: str) -> str:
+        return os.path.join(self.index_dir, self.fingerprint(corpus_hash))
 
-            # 2) Build the index using these tokens
-            self.index.index(self.corpus_tokens)
-            self.logger.debug('BM25 index built successfully')
+    def index_data_batches(self, batches: Iterable[List[WebTextUnit]]):
+        """
+        Tokenizes the corpus batch by batch, keeping only the token ids of each document,
+        so the optimized texts do not have to be held in memory all at once.
+        """
+        self.logger.debug('Entering index_data_batches')
+        try:
+            self.web_text_units = []
+            self.dictionary = {}
+            corpus_ids = []
+            hasher = CorpusHasher()
+            for batch in batches:
+                self.web_text_units.extend(batch)
+                hasher.update(batch)
+                # Prepare the batch for BM25, the vocabulary ids are assigned in first-seen order like bm25s.tokenize
+                batch_tokens = bm25s.tokenize([u.get_indexing_optimized_content() for u in batch], return_ids=False, show_progress=False)
+                for tokens in batch_tokens:
+                    corpus_ids.append([self.dictionary.setdefault(token, len(self.dictionary)) for token in tokens])
+            self.corpus_tokens = bm25s.tokenization.Tokenized(ids=corpus_ids, vocab=self.dictionary)
+
+            fingerprinted_index_dir = self._fingerprinted_index_dir(hasher.hexdigest()) if self.index_dir is not None else None
+            if fingerprinted_index_dir is not None and self.load_index(fingerprinted_index_dir, self.web_text_units):
+                self.logger.debug('Reloaded persisted BM25 index, skipped scoring')
+            else:
+                # Build the index using these tokens
+                self.index, self.avg_doc_len = self._build_index(self.corpus_tokens)
+                self._reset_segments()
+                self.logger.debug(f'BM25 index built successfully over {len(self.web_text_units)} web_text_units')
+                if fingerprinted_index_dir is not None:
+                    self.save_index(fingerprinted_index_dir)
         except Exception as e:
-            self.logger.error(f'Error in index_data: {e}')
+            self.logger.error(f'Error in index_data_batches: {e}')
             raise
-        self.logger.debug('Exiting index_data')
+        self.logger.debug('Exiting index_data_batches')
         return self.index
 
-    def bm25_retrieve(self, query, k):
-        self.logger.debug(f'Entering bm25_retrieve with query="{query}", k={k}')
+    @classmethod
+    def _build_index(cls, corpus_tokens, show_progress: bool = True):
+        index = cls._new_retriever()
+        index.index(corpus_tokens, show_progress=show_progress)
+        doc_lengths = [len(ids) for ids in corpus_tokens.ids]
+        avg_doc_len = float(np.mean(doc_lengths)) if doc_lengths else None
+        return index, avg_doc_len
+
+    def _reset_segments(self):
+        """Drops the delta segment and tombstones, called whenever a new main index is in place"""
+        self.delta = DeltaSegment()
+        self.tombstones = set()
+        self._main_doc_freqs = None
+        self._main_idf = None
+        self._main_tombstoned_doc_freqs = Counter()
+        self._id_positions = None
+
+    def save_index(self, directory: str):
+        self.logger.debug(f'Entering save_index with directory={directory}')
+        self.index.save(directory)
+        with open(os.path.join(directory, "bm25_stats.json"), 'w', encoding='utf-8') as f:
+            json.dump({"avg_doc_len": self.avg_doc_len}, f)
+        self.logger.debug('Exiting save_index')
+
+    def load_index(self, directory: str, web_text_units: list[WebTextUnit]) -> bool:
+        self.logger.debug(f'Entering load_index with directory={directory}')
+        if not os.path.exists(os.path.join(directory, "params.index.json")):
+            self.logger.debug('No saved BM25 index found')
+            return False
+        index = bm25s.BM25.load(directory, mmap=self.mmap)
+        if index.scores["num_docs"] != len(web_text_units):
+            self.logger.warning(f'Saved BM25 index has {index.scores["num_docs"]} documents, expected {len(web_text_units)}')
+            return False
+        self.index = index
+        self.dictionary = index.vocab_dict
+        self.corpus_tokens = None
+        self.web_text_units = web_text_units
+        stats_file = os.path.join(directory, "bm25_stats.json")
+        if os.path.exists(stats_file):
+            with open(stats_file, encoding='utf-8') as f:
+                self.avg_doc_len = json.load(f)["avg_doc_len"]
+        else:
+            self.avg_doc_len = None
+        self._reset_segments()
+        self.logger.debug('Exiting load_index')
+        return True
+
+    def add_documents(self, web_text_units: list[WebTextUnit]):
+        """
+        Makes new documents searchable immediately by adding them to the delta segment.
+        A document whose id is already indexed replaces the indexed version.
+        """
+        self.logger.debug(f'Entering add_documents with {len(web_text_units)} web_text_units')
+        tokens_per_unit = bm25s.tokenize([u.get_indexing_optimized_content() for u in web_text_units], return_ids=False, show_progress=False)
+        with self._lock:
+            self._prepare_segments()
+            for unit, tokens in zip(web_text_units, tokens_per_unit):
+                self._add_document(unit, tokens)
+                if self._pending_operations is not None:
+                    self._pending_operations.append(("add", unit, tokens))
+        self._merge_if_needed()
+        self.logger.debug('Exiting add_documents')
+
+    def remove_documents(self, unit_ids: list[str]):
+        """Tombstones the documents with the given ids (WebTextUnit.get_id()), they stop being retrieved immediately"""
+        self.logger.debug(f'Entering remove_documents with {len(unit_ids)} ids')
+        with self._lock:
+            self._prepare_segments()
+            for unit_id in unit_ids:
+                if not self._remove_document(unit_id):
+                    self.logger.warning(f'Cannot remove unknown document {unit_id}')
+                if self._pending_operations is not None:
+                    self._pending_operations.append(("remove", unit_id, None))
+        self._merge_if_needed()
+        self.logger.debug('Exiting remove_documents')
+
+    def _prepare_segments(self):
+        """Lazily computes the main index statistics the delta segment needs"""
+        if self._main_doc_freqs is None:
+            self._main_doc_freqs = doc_freqs_from_scores(self.index.scores)
+            self._main_idf = lucene_idf(self._main_doc_freqs, self.index.scores["num_docs"])
+        if self._id_positions is None:
+            self._id_positions = {
+                unit.get_id(): position
+                for position, unit in enumerate(self.web_text_units)
+                if position not in self.tombstones
+            }
+        if self.avg_doc_len is None:
+            # Indexes saved without their statistics: recompute the average length from the main documents
+            main_units = self.web_text_units[:self.index.scores["num_docs"]]
+            tokens_per_unit = bm25s.tokenize([u.get_indexing_optimized_content() for u in main_units], return_ids=False, show_progress=False)
+            self.avg_doc_len = float(np.mean([len(tokens) for tokens in tokens_per_unit]))
+
+    def _add_document(self, unit: WebTextUnit, tokens: list[str]):
+        self._remove_document(unit.get_id())
+        position = len(self.web_text_units)
+        self.web_text_units.append(unit)
+        self.delta.add(position, tokens)
+        self._id_positions[unit.get_id()] = position
+
+    def _remove_document(self, unit_id: str) -> bool:
+        position = self._id_positions.pop(unit_id, None)
+        if position is None:
+            return False
+        self.tombstones.add(position)
+        if position in self.delta:
+            self.delta.remove(position)
+        else:
+            self._main_tombstoned_doc_freqs.update(doc_token_ids_from_scores(self.index.scores, position).tolist())
+        return True
+
+    def _has_segments(self) -> bool:
+        return len(self.delta) > 0 or len(self.tombstones) > 0
+
+    def _merge_if_needed(self):
+        if len(self.delta) + len(self.tombstones) >= self.merge_threshold:
+            self.merge_segments(wait=False)
+
+    def merge_segments(self, wait: bool = True):
+        """
+        Rebuilds the main index over the live documents in a background thread.
+        Queries keep being served from the current segments until the new index is swapped in,
+        and updates made during the merge are replayed on top of it.
+        """
+        with self._lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(target=self._merge_segments, daemon=True)
+                self._merge_thread.start()
+            merge_thread = self._merge_thread
+        if wait:
+            merge_thread.join()
+
+    def _merge_segments(self):
+        self.logger.debug('Entering _merge_segments')
         try:
-            ids = [self.dictionary.get(token) for token in query.split() if self.dictionary.get(token) is not None]
+            with self._lock:
+                if not self._has_segments():
+                    return
+                live_units, live_tokens = self._live_documents()
+                self._pending_operations = []
+
+            dictionary = {}
+            corpus_ids = [[dictionary.setdefault(token, len(dictionary)) for token in tokens] for tokens in live_tokens]
+            corpus_tokens = bm25s.tokenization.Tokenized(ids=corpus_ids, vocab=dictionary)
+            index, avg_doc_len = self._build_index(corpus_tokens, show_progress=False)
 
-            if not ids:
-                self.logger.warning(f'No valid tokens found for query: {query}')
-                return []
+            with self._lock:
+                self.index, self.avg_doc_len = index, avg_doc_len
+                self.dictionary = dictionary
+                self.corpus_tokens = corpus_tokens
+                self.web_text_units = live_units
+                self._reset_segments()
+                pending_operations, self._pending_operations = self._pending_operations, None
+                self._prepare_segments()
+                for operation, payload, tokens in pending_operations:
+                    if operation == "add":
+                        self._add_document(payload, tokens)
+                    else:
+                        self._remove_document(payload)
+            self.logger.debug(f'Merged segments into a main index of {len(live_units)} web_text_units')
+        except Exception as e:
+            self.logger.error(f'Error in _merge_segments: {e}')
+            with self._lock:
+                self._pending_operations = None
+            raise
+        self.logger.debug('Exiting _merge_segments')
 
-            # Retrieve top-k results using BM25 index
-            results = self.index.retrieve(query_tokens=[ids], k=k)  # No need to pass `corpus` here
+    def _live_documents(self) -> tuple[list[WebTextUnit], list[list[str]]]:
+        """The units that are not tombstoned, with their tokens"""
+        num_main_docs = self.index.scores["num_docs"]
+        live_positions = [position for position in range(len(self.web_text_units)) if position not in self.tombstones]
+        main_positions = [position for position in live_positions if position < num_main_docs]
+        if self.corpus_tokens is not None:
+            vocabulary = [None] * len(self.dictionary)
+            for token, token_id in self.dictionary.items():
+                vocabulary[token_id] = token
+            main_tokens = [[vocabulary[token_id] for token_id in self.corpus_tokens.ids[position]] for position in main_positions]
+        else:
+            # Loaded indexes don't keep their token ids, tokenize the optimized contents again
+            main_tokens = bm25s.tokenize([self.web_text_units[position].get_indexing_optimized_content() for position in main_positions],
+                                         return_ids=False, show_progress=False)
+        tokens_by_position = dict(zip(main_positions, main_tokens))
+        tokens_by_position.update(self.delta.doc_tokens)
+        return [self.web_text_units[position] for position in live_positions], [tokens_by_position[position] for position in live_positions]
 
-            # Extract top-k document indices and scores
-            doc_indices = results.documents[0]  # First query's results
-            scores = results.scores[0]  # First query's scores
+    def _global_doc_freq(self, token: str) -> int:
+        """Number of live documents containing token, over the main index and the delta segment"""
+        doc_freq = self.delta.doc_freq(token)
+        main_id = self.dictionary.get(token)
+        if main_id is not None:
+            doc_freq += int(self._main_doc_freqs[main_id]) - self._main_tombstoned_doc_freqs[main_id]
+        return doc_freq
 
-            self.logger.debug(f'bm25_retrieve found {len(doc_indices)} documents')
-            return [self.web_text_units[doc_idx] for doc_idx in doc_indices]
+    def _score_with_segments(self, query_text: str) -> np.ndarray:
+        """
+        BM25 scores of every position in web_text_units using the live document frequencies.
+        Main index scores are rescaled by the ratio of the live idf to the idf they were built with,
+        delta documents are scored with the main index average document length.
+        """
+        scores = np.zeros(len(self.web_text_units), dtype=np.float32)
+        num_live_docs = len(self.web_text_units) - len(self.tombstones)
+        data, indices, indptr = self.index.scores["data"], self.index.scores["indices"], self.index.scores["indptr"]
+        for token in query_text.split():
+            doc_freq = self._global_doc_freq(token)
+            if doc_freq <= 0:
+                continue
+            idf = float(lucene_idf(doc_freq, num_live_docs))
+            main_id = self.dictionary.get(token)
+            if main_id is not None and self._main_doc_freqs[main_id] > 0:
+                start, end = indptr[main_id], indptr[main_id + 1]
+                scores[indices[start:end]] += data[start:end] * np.float32(idf / self._main_idf[main_id])
+            positions, token_scores = self.delta.score_token(token, idf, self.avg_doc_len)
+            scores[positions] += token_scores
+        if self.tombstones:
+            scores[np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))] = -np.inf
+        return scores
+
+    def _retrieve_with_segments(self, queries_text: list[str], k: int) -> tuple[list[list[WebTextUnit]], list[np.ndarray]]:
+        k = min(k, len(self.web_text_units) - len(self.tombstones))
+        results, scores = [], []
+        for query_text in queries_text:
+            if k <= 0 or not any(self._global_doc_freq(token) > 0 for token in query_text.split()):
+                results.append([])
+                scores.append(np.empty(0, dtype=np.float32))
+                continue
+            query_scores = self._score_with_segments(query_text)
+            top_positions = np.argpartition(-query_scores, k - 1)[:k]
+            top_positions = top_positions[np.argsort(-query_scores[top_positions], kind='stable')]
+            results.append([self.web_text_units[position] for position in top_positions])
+            scores.append(query_scores[top_positions])
+        return results, scores
+
+    def encode_queries(self, queries_text: list[str]) -> list[list[int]]:
+        """Maps every query to the ids of its tokens that appear in the vocabulary"""
+        dictionary = self.dictionary
+        return [[dictionary[token] for token in text.split() if token in dictionary] for text in queries_text]
+
+    def bm25_retrieve_batch(self, queries_text: list[str], k: int, n_threads: int | None = None) -> tuple[list[list[WebTextUnit]], list[np.ndarray]]:
+        """
+        Retrieves the top-k web text units of all queries with a single multi-query call to the index.
+        Returns the units and the matching score arrays of every query, queries without any known
+        token get empty results.
+        """
+        self.logger.debug(f'Entering bm25_retrieve_batch with {len(queries_text)} queries, k={k}')
+        with self._lock:
+            return self._bm25_retrieve_batch(queries_text, k, n_threads)
+
+    def _bm25_retrieve_batch(self, queries_text: list[str], k: int, n_threads: int | None) -> tuple[list[list[WebTextUnit]], list[np.ndarray]]:
+        try:
+            if self._has_segments():
+                results, scores = self._retrieve_with_segments(queries_text, k)
+                self.logger.debug(f'bm25_retrieve_batch answered {sum(1 for r in results if r)} queries over the segments')
+                return results, scores
+
+            queries_ids = self.encode_queries(queries_text)
+            answerable = [i for i, ids in enumerate(queries_ids) if ids]
+            if len(answerable) < len(queries_ids):
+                self.logger.warning(f'No valid tokens found for {len(queries_ids) - len(answerable)} queries')
+
+            results = [[] for _ in queries_ids]
+            scores = [np.empty(0, dtype=np.float32) for _ in queries_ids]
+            if answerable:
+                k = min(k, self.index.scores["num_docs"])
+                retrieved = self.index.retrieve(
+                    query_tokens=[queries_ids[i] for i in answerable],
+                    k=k,
+                    n_threads=self.n_threads if n_threads is None else n_threads,
+                    show_progress=False,
+                )
+                for row, query_idx in enumerate(answerable):
+                    results[query_idx] = [self.web_text_units[doc_idx] for doc_idx in retrieved.documents[row]]
+                    scores[query_idx] = retrieved.scores[row]
+            self.logger.debug(f'bm25_retrieve_batch answered {len(answerable)} queries')
+            return results, scores
         except Exception as e:
-            self.logger.error(f'Error in bm25_retrieve: {e}')
+            self.logger.error(f'Error in bm25_retrieve_batch: {e}')
             raise
-        finally:
-            self.logger.debug('Exiting bm25_retrieve')
+
+    def bm25_retrieve(self, query, k):
+        results, _ = self.bm25_retrieve_batch([query], k)
+        return results[0]
     
-    def retrieve_answer_source(self, queries: list[Query], k=1) -> list[WebTextUnit]:
+    def retrieve_answer_source(self, queries: list[Query], k=1) -> list[list[WebTextUnit]]:
         self.logger.debug(f'Entering retrieve_answer_source with {len(queries)} queries, k={k}')
         try:
-            for query in queries:
-                query.answer_sources = self.bm25_retrieve(query.indexing_optimized_query, k)
-                self.logger.debug(f'Query "{query.query}" retrieved {len(query.answer_sources)} answer sources')
+            results, _ = self.bm25_retrieve_batch([query.indexing_optimized_query for query in queries], k)
+            for query, answer_sources in zip(queries, results):
+                query.answer_sources = answer_sources
         except Exception as e:
             self.logger.error(f'Error in retrieve_answer_source: {e}')
             raise
         self.logger.debug('Exiting retrieve_answer_source')
+        return results
 
     def _preprocess_with_trankit(self, text: str) -> str:
         self.logger.debug(f'Entering _preprocess_with_trankit with text of length {len(text) if text else 0}')
@@ -0,0 +1,127 @@
+import sys
+import time
+from typing import Callable, List
+import numpy as np
+import torch
+from components.logger import Logger
+
+
+class InferenceBackend:
+    """
+    How the transformer models of the pipeline run on CPU.
+
+    The default backend runs the fp32 model eagerly under torch.inference_mode. quantize swaps the
+    Linear layers for dynamically quantized int8 ones (weights stored in int8, activations quantized
+    on the fly), which is where encoder models spend most of their CPU time. compile replaces the
+    forward of the model with a torch.compile graph. Models keep their type, so encode, predict
+    and other model specific methods keep working.
+    """
+
+    def __init__(self, quantize: bool = False, compile: bool = False, num_threads: int | None = None):
+        """
+        quantize: dynamic int8 quantization of the Linear layers, CPU only.
+        compile: torch.compile the forward of the models.
+        num_threads: torch intra-op threads, torch's default when None.
+        """
+        self.logger = Logger().get_logger()
+        self.quantize = quantize
+        self.compile = compile
+        self.num_threads = num_threads
+
+    def __repr__(self):
+        return f"InferenceBackend(quantize={self.quantize}, compile={self.compile}, num_threads={self.num_threads})"
+
+    def prepare(self, model: torch.nn.Module, device: str = "cpu") -> torch.nn.Module:
+        """
+        Puts the model in eval mode and applies the backend to it, in place for its submodules.
+        The returned module must be used instead of model: a bare Linear is replaced by its quantized version.
+        """
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        model.eval()
+        if self.quantize:
+            if str(device) == "cpu":
+                if isinstance(model, torch.nn.Linear):
+                    # quantize_dynamic only swaps submodules, never the module it is given
+                    model = torch.ao.quantization.quantize_dynamic(torch.nn.Sequential(model), {torch.nn.Linear}, dtype=torch.qint8)[0]
+                else:
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            else:
+                self.logger.warning(f'Dynamic int8 quantization only runs on CPU, {model.__class__.__name__} on {device} is kept in fp32')
+        if self.compile:
+            model.compile()
+        self.logger.debug(f'Prepared {model.__class__.__name__} with {self}')
+        return model
+
+    def context(self):
+        """Context the models are called in"""
+        return torch.inference_mode()
+
+
+def check_parity(reference_outputs, candidate_outputs) -> dict:
+    """
+    Agreement of a backend with the fp32 reference. Embeddings (2D arrays) are compared by the
+    cosine similarity of matching rows, other outputs (lemmatized texts, ...) by exact equality.
+    """
+    if isinstance(reference_outputs, np.ndarray):
+        reference = reference_outputs / np.linalg.norm(reference_outputs, axis=1, keepdims=True)
+        candidate = candidate_outputs / np.linalg.norm(candidate_outputs, axis=1, keepdims=True)
+        cosines = np.sum(reference * candidate, axis=1)
+        return {"min_cosine": float(np.min(cosines)), "mean_cosine": float(np.mean(cosines))}
+    matches = [reference == candidate for reference, candidate in zip(reference_outputs, candidate_outputs)]
+    return {"agreement": sum(matches) / len(matches)}
+
+
+def benchmark(run: Callable[[List[str]], object], texts: List[str], repeats: int = 3) -> dict:
+    """Throughput of run over texts, best of repeats after a warm-up call (compilation, caches)"""
+    run(texts[:2])
+    best = min(_timed(run, texts) for _ in range(repeats))
+    return {"seconds": best, "texts_per_second": len(texts) / best}
+
+
+def _timed(run, texts) -> float:
+    start = time.perf_counter()
+    run(texts)
+    return time.perf_counter() - start
+
+
+def compare_backends(load_model: Callable[[], torch.nn.Module], encode: Callable[[torch.nn.Module, List[str]], object],
+                     texts: List[str], backends: List[InferenceBackend] | None = None, repeats: int = 3) -> List[dict]:
+    """
+    Throughput and parity of every backend against the first one, fp32 eager by default.
+    load_model: loads a fresh copy of the model, the backends change it.
+    encode: outputs of a prepared model for texts, embeddings or texts compared by check_parity.
+    """
+    if backends is None:
+        backends = [InferenceBackend(), InferenceBackend(quantize=True), InferenceBackend(compile=True),
+                    InferenceBackend(quantize=True, compile=True)]
+    results = []
+    reference = None
+    for backend in backends:
+        model = backend.prepare(load_model())
+
+        def run(batch, model=model, backend=backend):
+            with backend.context():
+                return encode(model, batch)
+
+        outputs = run(texts)
+        reference = outputs if reference is None else reference
+        results.append({"backend": repr(backend), **benchmark(run, texts, repeats), **check_parity(reference, outputs)})
+    return results
+
+
+if __name__ == "__main__":
+    # python -m components.inference_backend <sentence transformer model> [texts file, one text per line]
+    # Compares every backend with the fp32 eager model on the same texts
+    from sentence_transformers import SentenceTransformer
+    model_name = sys.argv[1]
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = ["מה הן הזכויות של עובד שפוטר?", "האם מגיעים דמי אבטלה לאחר התפטרות?", "מי זכאי למענק לידה?"] * 64
+
+    for result in compare_backends(lambda: SentenceTransformer(model_name, device="cpu"),
+                                   lambda model, batch: model.encode(batch, batch_size=32, convert_to_numpy=True, normalize_embeddings=True),
+                                   texts):
+        print(result)
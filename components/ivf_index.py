@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import time
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from components.dense_search import top_k_similarity
+from components.logger import Logger
+
+# Points k-means is trained on per list, the rest of the corpus is only assigned to the lists
+TRAINING_POINTS_PER_LIST = 64
+
+IVF_ARRAYS = ("centroids", "list_offsets", "list_ids")
+
+
+class IvfIndex:
+    """
+    Inverted file index over normalized embeddings, for approximate dot product search.
+
+    The vectors are partitioned with k-means, every vector belongs to the list of its closest
+    centroid. A query only scores the vectors of the nprobe lists whose centroids are closest
+    to it, so the cost of a query grows with nprobe * list size rather than with the corpus.
+    The index only keeps the partition, the vectors are passed to search, so they can stay
+    memory-mapped with the rest of the dense index.
+    """
+
+    def __init__(self, num_lists: int | None = None, nprobe: int = 8, seed: int = 0):
+        """
+        num_lists: number of k-means lists, 4 * sqrt(number of vectors) when None.
+        nprobe: lists scored per query, the recall / latency trade-off. Can be changed after building.
+        seed: k-means random state, for reproducible partitions.
+        """
+        self.logger = Logger().get_logger()
+        self.num_lists = num_lists
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def __len__(self):
+        return 0 if self.list_ids is None else len(self.list_ids)
+
+    def build(self, vectors: np.ndarray) -> "IvfIndex":
+        self.logger.debug(f'Entering build with {len(vectors)} vectors')
+        try:
+            num_lists = self.num_lists or int(4 * np.sqrt(len(vectors)))
+            num_lists = max(1, min(num_lists, len(vectors)))
+            rng = np.random.default_rng(self.seed)
+            training = vectors
+            if len(vectors) > num_lists * TRAINING_POINTS_PER_LIST:
+                training = vectors[np.sort(rng.choice(len(vectors), num_lists * TRAINING_POINTS_PER_LIST, replace=False))]
+            # k-means++ seeding costs more than the whole fit with this many lists, random seeding is used instead
+            kmeans = MiniBatchKMeans(n_clusters=num_lists, init='random', n_init=1, batch_size=4096, random_state=self.seed).fit(np.asarray(training, dtype=np.float32))
+            # Lists are searched by dot product, so the centroids are normalized like the vectors
+            centroids = kmeans.cluster_centers_.astype(np.float32)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), np.float32(1e-12))
+            assignments = top_k_similarity(vectors, centroids, 1)[0][:, 0]
+
+            self.centroids = centroids
+            self.list_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+            self.list_offsets = np.zeros(num_lists + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignments, minlength=num_lists), out=self.list_offsets[1:])
+            self.logger.debug(f'IVF index built with {num_lists} lists')
+        except Exception as e:
+            self.logger.error(f'Error in build: {e}')
+            raise
+        self.logger.debug('Exiting build')
+        return self
+
+    def search(self, query_vectors: np.ndarray, vectors: np.ndarray, k: int, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k of every query, as (indices, scores) of shape (num_queries, k) sorted by
+        decreasing score, equal scores by index. More than nprobe lists are probed when these hold
+        fewer than k vectors, so every query gets k results.
+        """
+        nprobe = self.nprobe if nprobe is None else nprobe
+        k = min(k, len(vectors))
+        list_sizes = np.diff(self.list_offsets)
+        centroid_scores = query_vectors @ self.centroids.T
+        top_indices = np.empty((len(query_vectors), k), dtype=np.int64)
+        top_scores = np.empty((len(query_vectors), k), dtype=np.float32)
+        for query_idx, query_vector in enumerate(query_vectors):
+            list_order = np.argsort(-centroid_scores[query_idx], kind='stable')
+            enough = int(np.searchsorted(np.cumsum(list_sizes[list_order]), k)) + 1
+            probed = list_order[:max(nprobe, enough)]
+            # Sorted ids read the vectors in file order and break equal scores by index
+            ids = np.sort(np.concatenate([self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probed]))
+            positions, scores = top_k_similarity(query_vector[None, :], vectors[ids], k)
+            top_indices[query_idx] = ids[positions[0]]
+            top_scores[query_idx] = scores[0]
+        return top_indices, top_scores
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in IVF_ARRAYS:
+            np.save(os.path.join(directory, f"ivf_{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "ivf.json"), 'w', encoding='utf-8') as f:
+            json.dump({"num_lists": self.num_lists, "seed": self.seed, "num_vectors": len(self)}, f)
+
+    def load(self, directory: str, num_vectors: int) -> bool:
+        """Restores an index saved by save over num_vectors vectors, returns False when there is none"""
+        params_file = os.path.join(directory, "ivf.json")
+        if not os.path.exists(params_file):
+            return False
+        with open(params_file, encoding='utf-8') as f:
+            params = json.load(f)
+        if params["num_vectors"] != num_vectors or params["num_lists"] != self.num_lists or params["seed"] != self.seed:
+            return False
+        for name in IVF_ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"ivf_{name}.npy")))
+        return True
+
+
+def recall_latency_report(vectors: np.ndarray, query_vectors: np.ndarray, k: int = 10, nprobes=(1, 2, 4, 8, 16, 32),
+                          index: IvfIndex | None = None) -> list[dict]:
+    """
+    Recall@k of the IVF search against the exact search and mean latency per query, for every nprobe.
+    The first row is the exact search itself.
+    """
+    index = index or IvfIndex().build(vectors)
+    start = time.perf_counter()
+    exact, _ = top_k_similarity(query_vectors, vectors, k)
+    rows = [{"nprobe": "exact", "recall": 1.0, "latency_ms": 1000 * (time.perf_counter() - start) / len(query_vectors)}]
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        approximate, _ = index.search(query_vectors, vectors, k, nprobe=nprobe)
+        latency = 1000 * (time.perf_counter() - start) / len(query_vectors)
+        hits = sum(len(np.intersect1d(found, expected)) for found, expected in zip(approximate, exact))
+        rows.append({"nprobe": nprobe, "recall": hits / exact.size, "latency_ms": latency})
+    return rows
+
+
+if __name__ == "__main__":
+    # python -m components.ivf_index <st_vectors.npy> [query_vectors.npy]
+    # Without query vectors, a sample of the documents is used as queries
+    vectors = np.load(sys.argv[1], mmap_mode='r')
+    if len(sys.argv) > 2:
+        query_vectors = np.load(sys.argv[2])
+    else:
+        query_vectors = np.asarray(vectors[np.random.default_rng(0).choice(len(vectors), min(200, len(vectors)), replace=False)])
+    for row in recall_latency_report(vectors, query_vectors):
+        print(f'nprobe={row["nprobe"]:>5}  recall@10={row["recall"]:.3f}  latency={row["latency_ms"]:.3f} ms/query')
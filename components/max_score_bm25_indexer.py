@@ -0,0 +1,221 @@
+from collections import Counter
+import numpy as np
+from components.index_data_interface import Bm25Indexer
+from components.web_text_unit import WebTextUnit
+
+# Terms accumulated with a single scatter once the threshold can prune
+CHUNK_TERMS = 8
+
+# Candidates x terms left below which the impacts of all the terms left are looked up at once
+BATCH_LOOKUPS = 20000
+
+# A binary search per candidate costs about as much as scattering this many postings
+LOOKUP_COST = 8
+
+# Relative slack on pruning decisions, so float32 rounding never drops a document that ties the threshold
+PRUNING_SLACK = 1e-5
+
+
+class MaxScoreBm25Indexer(Bm25Indexer):
+    """
+    Bm25Indexer answering long queries with MaxScore early termination instead of scoring every posting.
+
+    The bm25s score matrix is rearranged into two posting orders per token: by document, for random
+    access, and by decreasing impact (the token's score in the document), with the maximum impact of
+    every token. Query terms are processed from the highest to the lowest max impact. Once the top-k
+    threshold exceeds the max impacts of the terms left, these can't bring new documents into the
+    top-k and are only looked up for the remaining candidates, which is where the long posting lists
+    of the frequent terms of expanded queries are skipped. Before that, documents unseen so far only
+    enter through the head of the impact ordered lists.
+
+    Queries whose posting lists are short compared to the corpus are scored exhaustively, pruning
+    doesn't pay for its bookkeeping there. Both paths sum in query token order like bm25s, so scores
+    are identical to Bm25Indexer; equal scores are ordered by corpus position.
+    """
+
+    def __init__(self, *args, min_postings_per_doc: float = 8, **kwargs):
+        """
+        min_postings_per_doc: queries are pruned when their posting lists hold at least this many
+                              postings per corpus document, shorter ones are scored exhaustively.
+        Other arguments are the ones of Bm25Indexer.
+        """
+        super().__init__(*args, **kwargs)
+        self.min_postings_per_doc = min_postings_per_doc
+        self._postings_index = None
+
+    def _prepare_postings(self):
+        """Builds the document and impact ordered postings of the current index"""
+        if self._postings_index is self.index:
+            return
+        scores = self.index.scores
+        data = np.asarray(scores["data"])
+        indices = np.asarray(scores["indices"])
+        self.indptr = np.asarray(scores["indptr"], dtype=np.int64)
+        columns = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+        # Document ordered postings are keyed by token * num_docs + document, so a single binary
+        # search finds any (token, document) pair
+        doc_order = np.lexsort((indices, columns))
+        self.posting_keys = columns[doc_order] * np.int64(scores["num_docs"]) + indices[doc_order]
+        self.doc_impacts = data[doc_order]
+        impact_order = np.lexsort((-data, columns))
+        self.impact_postings = indices[impact_order]
+        self.impact_values = data[impact_order]
+        # Ascending within every column, for binary searches of impact cutoffs
+        self.negated_impact_values = -self.impact_values
+
+        self.max_impacts = np.zeros(len(self.indptr) - 1, dtype=np.float32)
+        non_empty = np.diff(self.indptr) > 0
+        self.max_impacts[non_empty] = self.impact_values[self.indptr[:-1][non_empty]]
+        self._postings_index = self.index
+
+    def _lookup(self, token_ids: np.ndarray, docs: np.ndarray, start: int = 0, end: int | None = None) -> np.ndarray:
+        """
+        Impacts of the tokens in the documents (tokens x documents), 0 where a token doesn't occur.
+        start and end restrict the search to the postings of a single token.
+        """
+        posting_keys = self.posting_keys[start:end]
+        keys = token_ids[:, None] * np.int64(self.index.scores["num_docs"]) + docs[None, :]
+        positions = np.minimum(np.searchsorted(posting_keys, keys), len(posting_keys) - 1)
+        found = posting_keys[positions] == keys
+        return np.where(found, self.doc_impacts[start + positions], np.float32(0))
+
+    def max_score_top_k(self, token_ids: list[int], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k documents of a query given by its token ids (duplicates count as many times as they appear)"""
+        num_docs = self.index.scores["num_docs"]
+        weights = Counter(token_ids)
+        terms = np.array(sorted(weights, key=lambda token_id: -weights[token_id] * self.max_impacts[token_id]), dtype=np.int64)
+        term_weights = np.array([weights[token_id] for token_id in terms], dtype=np.float32)
+        upper_bounds = term_weights * self.max_impacts[terms]
+        # remaining_bounds[i]: upper bound of the contribution of terms[i:]
+        remaining_bounds = np.append(np.cumsum(upper_bounds[::-1])[::-1], 0).tolist()
+        total_bound = remaining_bounds[0]
+        # No score exceeds the bound of the processed terms, so the threshold can't prune anything before
+        # it outweighs the remaining bound: the terms up to that point are processed in a single chunk
+        first_chunk = next(i + 1 for i in range(len(terms)) if total_bound - remaining_bounds[i + 1] >= remaining_bounds[i + 1])
+
+        accumulated = np.zeros(num_docs, dtype=np.float32)
+        threshold = -np.inf
+        i = 0
+        while i < len(terms):
+            chunk = range(i, first_chunk if i == 0 else min(i + CHUNK_TERMS, len(terms)))
+            heads = self._accumulate_chunk(accumulated, terms, term_weights, upper_bounds, chunk, remaining_bounds[i], threshold)
+            i = chunk.stop
+            remaining = remaining_bounds[i]
+            # Partial scores only grow, so the k-th largest among the documents of any head is a
+            # lower bound of the final threshold that costs no pass over the corpus
+            threshold = max([threshold] + [self._kth_largest(accumulated[head_docs], k) for head_docs in heads])
+            if threshold * (1 - PRUNING_SLACK) > remaining:
+                break
+
+        # The remaining terms can't bring new documents into the top-k, only the candidates need their impacts
+        seen_docs = np.flatnonzero(accumulated)
+        if i < len(terms):
+            threshold = self._kth_largest(accumulated[seen_docs], k)
+        candidates = seen_docs[accumulated[seen_docs] + remaining_bounds[i] >= threshold * (1 - PRUNING_SLACK)]
+        while i < len(terms) and len(candidates) > k:
+            if len(candidates) * (len(terms) - i) <= BATCH_LOOKUPS:
+                accumulated[candidates] += term_weights[i:] @ self._lookup(terms[i:], candidates)
+                break
+            token_id, weight = int(terms[i]), term_weights[i]
+            start, end = self.indptr[token_id], self.indptr[token_id + 1]
+            if len(candidates) * LOOKUP_COST > end - start:
+                # Scattering the whole list is cheaper, documents out of the running absorb contributions
+                docs = self.posting_keys[start:end] - np.int64(token_id) * num_docs
+                np.add.at(accumulated, docs, weight * self.doc_impacts[start:end])
+            else:
+                accumulated[candidates] += weight * self._lookup(terms[i:i + 1], candidates, start, end)[0]
+            i += 1
+            threshold = max(threshold, self._kth_largest(accumulated[candidates], k))
+            candidates = candidates[accumulated[candidates] + remaining_bounds[i] >= threshold * (1 - PRUNING_SLACK)]
+
+        # Rescore the documents that can still be in the top-k in query token order, for scores identical to bm25s
+        if len(candidates) > k:
+            candidates = candidates[accumulated[candidates] >= self._kth_largest(accumulated[candidates], k) * (1 - PRUNING_SLACK)]
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for token_scores in self._lookup(np.array(token_ids, dtype=np.int64), candidates):
+            scores += token_scores
+        docs, scores = self._top_k(candidates, scores, k)
+        if len(docs) < k:
+            # Like bm25s, fill the top-k with documents that don't match any query token
+            fillers = np.setdiff1d(np.arange(num_docs), seen_docs)[:k - len(docs)]
+            docs = np.concatenate([docs, fillers])
+            scores = np.concatenate([scores, np.zeros(len(fillers), dtype=np.float32)])
+        return docs, scores
+
+    def exhaustive_top_k(self, token_ids: list[int], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k documents of a query scored over all its postings, as bm25s does"""
+        num_docs = self.index.scores["num_docs"]
+        data, indices = self.index.scores["data"], self.index.scores["indices"]
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for token_id in token_ids:
+            start, end = self.indptr[token_id], self.indptr[token_id + 1]
+            np.add.at(scores, indices[start:end], data[start:end])
+        return self._top_k(np.arange(num_docs), scores, k)
+
+    def _top_k(self, docs: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """The k best documents by decreasing score, equal scores by corpus position"""
+        if len(docs) > k:
+            keep = scores >= self._kth_largest(scores, k)
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((docs, -scores))[:k]
+        return docs[order], scores[order]
+
+    def _accumulate_chunk(self, accumulated, terms, term_weights, upper_bounds, chunk, remaining, threshold) -> np.ndarray:
+        """
+        Adds the impacts of a chunk of terms with one scatter and returns the documents of every term head.
+        A document unseen before the chunk can't score more than its impact in a term plus the bounds
+        of the other terms left, so past the head of the impact ordered list, where that falls below
+        the threshold, only documents already accumulating a score are updated.
+        """
+        docs, contributions, tail_docs, tail_contributions = [], [], [], []
+        for j in chunk:
+            token_id, weight = terms[j], term_weights[j]
+            start, end = self.indptr[token_id], self.indptr[token_id + 1]
+            head = end - start
+            if np.isfinite(threshold):
+                cutoff = (threshold - (remaining - upper_bounds[j])) * (1 - PRUNING_SLACK) / weight
+                head = int(np.searchsorted(self.negated_impact_values[start:end], -cutoff, side='right'))
+            docs.append(self.impact_postings[start:start + head])
+            contributions.append(weight * self.impact_values[start:start + head])
+            if head < end - start:
+                tail_docs.append(self.impact_postings[start + head:end])
+                tail_contributions.append(weight * self.impact_values[start + head:end])
+        heads = list(docs)
+        if tail_docs:
+            tail_docs = np.concatenate(tail_docs)
+            keep = accumulated[tail_docs] > 0
+            docs.append(tail_docs[keep])
+            contributions.append(np.concatenate(tail_contributions)[keep])
+        np.add.at(accumulated, np.concatenate(docs), np.concatenate(contributions))
+        return heads
+
+    @staticmethod
+    def _kth_largest(values: np.ndarray, k: int) -> float:
+        if len(values) < k:
+            return -np.inf
+        return float(np.partition(values, len(values) - k)[len(values) - k])
+
+    def _bm25_retrieve_batch(self, queries_text: list[str], k: int, n_threads: int | None) -> tuple[list[list[WebTextUnit]], list[np.ndarray]]:
+        if self._has_segments():
+            return super()._bm25_retrieve_batch(queries_text, k, n_threads)
+        try:
+            self._prepare_postings()
+            queries_ids = self.encode_queries(queries_text)
+            results, scores = [], []
+            for token_ids in queries_ids:
+                if not token_ids:
+                    results.append([])
+                    scores.append(np.empty(0, dtype=np.float32))
+                    continue
+                num_docs = self.index.scores["num_docs"]
+                num_postings = int(np.sum(self.indptr[np.add(token_ids, 1)] - self.indptr[token_ids]))
+                top_k = self.max_score_top_k if num_postings >= self.min_postings_per_doc * num_docs else self.exhaustive_top_k
+                docs, query_scores = top_k(token_ids, min(k, num_docs))
+                results.append([self.web_text_units[doc_idx] for doc_idx in docs])
+                scores.append(query_scores)
+            self.logger.debug(f'bm25_retrieve_batch answered {sum(1 for r in results if r)} queries ')
+            return results, scores
+        except Exception as e:
+            self.logger.error(f'Error in bm25_retrieve_batch: {e}')
+            raise
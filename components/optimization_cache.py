@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, List
+from components.fingerprint import content_hash, fingerprint, optimizer_chain_signature
+from components.logger import Logger
+
+# Host parameters of a single lookup, below SQLite's limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+class OptimizationCache:
+    """
+    Persistent store of optimized section contents, reused across runs and across experiments
+    that change the indexers but keep the optimizer chain.
+
+    Entries are keyed by the fingerprint of the ordered optimizer chain (class names and parameters)
+    and the content hash of the section, in an SQLite file under directory. Once the stored
+    optimized contents exceed max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 ** 30):
+        """
+        directory: directory of the cache file, shared by all optimizer chains.
+        max_bytes: bound on the UTF-8 size of the stored optimized contents.
+        """
+        self.logger = Logger().get_logger()
+        self.directory = directory
+        self.path = os.path.join(directory, "optimizations.sqlite")
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._total_bytes = None
+        self._last_time = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_total_bytes"] = None
+        return state
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS optimized (chain TEXT, hash TEXT, content TEXT, size INTEGER, "
+                                         "last_used REAL, PRIMARY KEY (chain, hash))")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS optimized_last_used ON optimized (last_used)")
+            self._total_bytes = self._stored_bytes()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM optimized").fetchone()[0]
+
+    def _stored_bytes(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM optimized").fetchone()[0]
+
+    @staticmethod
+    def chain_key(optimizers: Iterable) -> str:
+        return fingerprint(optimizer_chain_signature(optimizers))
+
+    def optimize(self, texts: List[str], optimize_fn: Callable[[List[str]], List[str]], chain_key: str) -> List[str]:
+        """
+        Optimized texts. Only the texts missing from the cache are passed to optimize_fn, once each,
+        and their optimized contents are added to the cache.
+        """
+        self.logger.debug(f'Entering optimize with {len(texts)} texts')
+        try:
+            text_hashes, found, missing = self._split(texts, chain_key)
+            result = self._complete(chain_key, text_hashes, found, missing, optimize_fn(list(missing.values())) if missing else [])
+        except Exception as e:
+            self.logger.error(f'Error in optimize: {e}')
+            raise
+        self.logger.debug('Exiting optimize')
+        return result
+
+    def optimize_batches(self, text_batches: Iterable[List[str]],
+                         optimize_batches_fn: Callable[[Iterable[List[str]]], Iterator[List[str]]], chain_key: str) -> Iterator[List[str]]:
+        """
+        Lazily optimized batches of texts, in order. The texts of every batch missing from the cache
+        are streamed to optimize_batches_fn as one batch, so an optimizer pool keeps optimizing the
+        misses of the next batches while earlier ones are stored and consumed.
+        """
+        self.logger.debug('Entering optimize_batches')
+        try:
+            # Batches whose misses were handed to optimize_batches_fn and are not optimized yet
+            in_flight = deque()
+
+            def missing_batches():
+                for texts in text_batches:
+                    text_hashes, found, missing = self._split(texts, chain_key)
+                    in_flight.append((text_hashes, found, missing))
+                    yield list(missing.values())
+
+            for optimized in optimize_batches_fn(missing_batches()):
+                yield self._complete(chain_key, *in_flight.popleft(), optimized)
+        except Exception as e:
+            self.logger.error(f'Error in optimize_batches: {e}')
+            raise
+        self.logger.debug('Exiting optimize_batches')
+
+    def _split(self, texts: List[str], chain_key: str) -> tuple[List[str], dict, dict]:
+        """Content hashes of texts, the cached optimized contents by hash and the distinct missing texts by hash"""
+        text_hashes = [content_hash(text) for text in texts]
+        found = self._lookup(chain_key, list(dict.fromkeys(text_hashes)))
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        return text_hashes, found, missing
+
+    def _complete(self, chain_key: str, text_hashes: List[str], found: dict, missing: dict, optimized: List[str]) -> List[str]:
+        """Stores the optimized missing texts and returns the optimized contents of all the texts"""
+        found.update(zip(missing, optimized))
+        self._store(chain_key, found, missing)
+        self.logger.debug(f'Optimization cache: {len(text_hashes) - len(missing)} of {len(text_hashes)} texts reused, {len(missing)} optimized')
+        return [found[text_hash] for text_hash in text_hashes]
+
+    def _lookup(self, chain_key: str, text_hashes: List[str]) -> dict:
+        found = {}
+        for start in range(0, len(text_hashes), LOOKUP_CHUNK_SIZE):
+            chunk = text_hashes[start:start + LOOKUP_CHUNK_SIZE]
+            rows = self.connection.execute(f"SELECT hash, content FROM optimized WHERE chain = ? AND hash IN ({','.join('?' * len(chunk))})",
+                                           [chain_key] + chunk)
+            found.update(rows)
+        return found
+
+    def _store(self, chain_key: str, found: dict, missing: dict):
+        # Strictly increasing, entries used by consecutive calls never tie on coarse clocks
+        now = self._last_time = max(time.time(), self._last_time + 1e-6)
+        new_entries = [(chain_key, text_hash, found[text_hash], len(found[text_hash].encode('utf-8')), now) for text_hash in missing]
+        with self.connection:
+            self.connection.executemany("UPDATE optimized SET last_used = ? WHERE chain = ? AND hash = ?",
+                                        [(now, chain_key, text_hash) for text_hash in found if text_hash not in missing])
+            self.connection.executemany("INSERT OR REPLACE INTO optimized VALUES (?, ?, ?, ?, ?)", new_entries)
+        self._total_bytes += sum(entry[3] for entry in new_entries)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Another process may have written to the file, start from the stored size
+        self._total_bytes = self._stored_bytes()
+        evicted = []
+        for chain_key, text_hash, size in self.connection.execute("SELECT chain, hash, size FROM optimized ORDER BY last_used"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((chain_key, text_hash))
+            self._total_bytes -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM optimized WHERE chain = ? AND hash = ?", evicted)
+        self.logger.debug(f'Optimization cache evicted {len(evicted)} entries')
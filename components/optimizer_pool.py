@@ -0,0 +1,92 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, List
+import multiprocessing
+from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface, OptimizerChain
+from components.logger import Logger
+
+# Optimizer chain of a worker process, created once by _init_worker
+_worker_chain = None
+
+
+def _init_worker(optimizers: List[IndexingTextOptimizerInterface], torch_threads: int | None):
+    global _worker_chain
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+    _worker_chain = OptimizerChain(optimizers)
+
+
+def _optimize_batch(texts: List[str]) -> List[str]:
+    return _worker_chain.optimize_documents(texts)
+
+
+def _result(future: Future | None) -> List[str]:
+    # None stands for an empty batch
+    return [] if future is None else future.result()
+
+
+class OptimizerPool:
+    """
+    Runs an optimizer chain over document batches in a pool of CPU processes.
+
+    The optimizers are sent to every worker once, when it starts, so model-backed optimizers load
+    their model once per worker rather than once per batch. Optimized batches are returned in the
+    order of the input batches.
+    """
+
+    def __init__(self, optimizers: List[IndexingTextOptimizerInterface], num_workers: int, batch_size: int = 64,
+                 torch_threads: int | None = None):
+        """
+        optimizers: chain run by every worker, must be picklable.
+        num_workers: optimizing processes.
+        batch_size: most texts sent to a worker at once by optimize_documents.
+        torch_threads: torch intra-op threads of every worker, torch's default when None.
+        """
+        self.logger = Logger().get_logger()
+        self.optimizers = optimizers
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.torch_threads = torch_threads
+        self.executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn: forking a process that already runs torch threads can deadlock
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_worker, initargs=(self.optimizers, self.torch_threads))
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def optimize_documents(self, lst_text: List[str]) -> List[str]:
+        """Optimized texts, split into at most batch_size texts per worker call"""
+        chunk_size = max(1, min(self.batch_size, -(-len(lst_text) // self.num_workers)))
+        chunks = [lst_text[start:start + chunk_size] for start in range(0, len(lst_text), chunk_size)]
+        return [text for chunk in self.optimize_document_batches(chunks) for text in chunk]
+
+    def optimize_document_batches(self, batches: Iterable[List[str]]) -> Iterator[List[str]]:
+        """
+        Lazily optimizes a stream of document batches. Only a couple of batches per worker are in
+        flight at once, so a streamed corpus is never pulled into memory as a whole. Empty batches
+        are not sent to the workers.
+        """
+        self.logger.debug(f'Entering optimize_document_batches with {self.num_workers} workers')
+        executor = self._get_executor()
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(executor.submit(_optimize_batch, batch) if batch else None)
+            if len(in_flight) >= 2 * self.num_workers:
+                yield _result(in_flight.popleft())
+        while in_flight:
+            yield _result(in_flight.popleft())
+        self.logger.debug('Exiting optimize_document_batches')
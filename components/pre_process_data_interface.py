@@ -1,13 +1,17 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup, Tag
 import glob
 import re
 from markdownify import MarkdownConverter
 from components.web_text_unit import WebTextUnit, WebTextSection
+from components.corpus_store import CorpusStore, StoredWebTextSection
 from tqdm import tqdm
 import pickle
+import hashlib
 import time
-from typing import List
+from typing import Iterator, List
 import os
 from tqdm import tqdm
 
@@ -34,22 +38,74 @@ class CustomConverter(MarkdownConverter):
         """Skip table formatting, replace with placeholder"""
         return "[טבלה]"
 
+@dataclass
+class SourceFileEntry:
+    """Manifest record of a source file, used to detect which files changed since the last run"""
+    mtime_ns: int
+    size: int
+    content_hash: str
+    sections_count: int
+
+def hash_file(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
 class PreProcessDataInterface(ABC):
     def __init__(self, data_path: str):
         self.data_path = data_path
-        self.cache_file = os.path.join("cache", f"{self.data_path}.pkl")
+        self.cache_file = os.path.join("cache", f"{self.data_path}.corpus")
+        self.manifest_file = os.path.join("cache", f"{self.data_path}.manifest.pkl")
 
     @abstractmethod
     def pre_proccess_data(self) -> list[WebTextUnit]:
         """Each implementation must provide its own data processing logic"""
         pass
 
+    def iter_pre_proccess_data(self) -> Iterator[WebTextUnit]:
+        """Lazily yields the processed data, implementations may override it to avoid materializing the whole corpus"""
+        yield from self.pre_proccess_data()
+
+    def stream_data(self) -> Iterator[WebTextUnit]:
+        """
+        Lazily yields the data for the streaming pipeline.
+        An existing cache is refreshed and served as views over the corpus store,
+        otherwise sections are yielded straight from the source without building a cache.
+        """
+        if not os.path.exists(self.cache_file):
+            yield from self.iter_pre_proccess_data()
+            return
+        yield from self.load_or_process_data()
+
+    def list_source_files(self) -> List[str] | None:
+        """
+        Implementations that process their data file by file return the files here,
+        which enables incremental cache refreshes. None keeps the all-or-nothing cache.
+        """
+        return None
+
+    def pre_proccess_files_grouped(self, file_paths: List[str]) -> List[List[WebTextSection]]:
+        """
+        Processes the given source files, returning the sections of each file in order.
+        Only called with files returned by list_source_files, implementations that list
+        their source files must override it.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} lists its source files but does not implement pre_proccess_files_grouped")
+
     def load_or_process_data(self) -> List[WebTextSection]:
         """
         Shared caching logic for all implementations.
         Attempts to load preprocessed data from cache, falls back to processing files
         if cache doesn't exist.
+        When the implementation lists its source files, only added or changed files are
+        re-processed and the sections of deleted files are dropped, deleting every file
+        empties the cache.
         """
+        source_files = self.list_source_files()
+        if source_files is not None:
+            return self._refresh_cache(source_files)
         try:
             start_time = time.time()
             data = self._load_from_cache()
@@ -71,54 +127,175 @@ class PreProcessDataInterface(ABC):
             
             return data
 
+    def _refresh_cache(self, source_files: List[str]) -> List[WebTextSection]:
+        start_time = time.time()
+        manifest, cached_sections = self._load_manifest_and_cache()
+        # Slice the cached sections back into per-file groups, they are stored in manifest order
+        cached_sections_by_file = {}
+        offset = 0
+        for file_path, entry in manifest.items():
+            cached_sections_by_file[file_path] = cached_sections[offset : offset + entry.sections_count]
+            offset += entry.sections_count
+
+        new_manifest = {}
+        changed_files = []
+        for file_path in source_files:
+            stat = os.stat(file_path)
+            entry = manifest.get(file_path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                new_manifest[file_path] = entry
+                continue
+            content_hash = hash_file(file_path)
+            if entry is not None and entry.content_hash == content_hash:
+                # Touched but unchanged, only the stat info needs updating
+                new_manifest[file_path] = SourceFileEntry(stat.st_mtime_ns, stat.st_size, content_hash, entry.sections_count)
+                continue
+            changed_files.append(file_path)
+            new_manifest[file_path] = SourceFileEntry(stat.st_mtime_ns, stat.st_size, content_hash, 0)
+        removed_files = [file_path for file_path in manifest if file_path not in new_manifest]
+
+        if not changed_files and not removed_files and list(new_manifest) == list(manifest):
+            if new_manifest != manifest:
+                self._save_manifest(new_manifest)
+            print(f"Loaded cached data in {time.time() - start_time:.2f} seconds")
+            return cached_sections
+
+        process_start = time.time()
+        processed_groups = self.pre_proccess_files_grouped(changed_files) if changed_files else []
+        process_time = time.time() - process_start
+        for file_path, sections in zip(changed_files, processed_groups):
+            cached_sections_by_file[file_path] = sections
+            new_manifest[file_path].sections_count = len(sections)
+
+        data = []
+        for file_path in new_manifest:
+            data.extend(cached_sections_by_file[file_path])
+
+        save_start = time.time()
+        self._save_to_cache(data)
+        self._save_manifest(new_manifest)
+        save_time = time.time() - save_start
+        # Serve views over the new store rather than over the replaced file
+        data = self._load_from_cache()
+
+        print(f"Processed {len(changed_files)} added or changed files in {process_time:.2f} seconds, "
+              f"dropped {len(removed_files)} deleted files")
+        print(f"Saved cache in {save_time:.2f} seconds")
+        return data
+
+    def _load_manifest_and_cache(self):
+        """Returns the manifest and the cached sections, or empty ones if they are missing or out of sync"""
+        try:
+            with open(self.manifest_file, 'rb') as f:
+                manifest = pickle.load(f)
+            cached_sections = self._load_from_cache()
+        except FileNotFoundError:
+            return {}, []
+        if sum(entry.sections_count for entry in manifest.values()) != len(cached_sections):
+            return {}, []
+        return manifest, cached_sections
+
+    def _save_manifest(self, manifest: dict):
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(manifest, f)
+        os.replace(tmp_file, self.manifest_file)
+
     def _save_to_cache(self, data: List[WebTextSection]):
-        """Shared method to save processed data to pickle file"""
-        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(data, f)
-
-    def _load_from_cache(self) -> List[WebTextSection]:
-        """Shared method to load processed data from pickle file"""
-        with open(self.cache_file, 'rb') as f:
-            return pickle.load(f)
+        """Shared method to save processed data to a memory-mapped corpus store"""
+        CorpusStore.write(self.cache_file, data)
+
+    def _load_from_cache(self) -> List[StoredWebTextSection]:
+        """Shared method to open the corpus store, sections are lazy views over the mapped file"""
+        return CorpusStore(self.cache_file).units()
     
-class WebDataPreProccessor(PreProcessDataInterface):
-    def pre_proccess_data(self) -> list[WebTextUnit]:
-        res = []
-        html_files = glob.glob(f"{self.data_path}/pages/*.html")
-        for index, html_file_path in enumerate(tqdm(html_files, desc="Processing HTML files")):
-            with open(html_file_path, encoding='utf-8') as file:
-                html_content = BeautifulSoup(file.read(), "html.parser")
-            document_id = html_file_path.split("/")[-1].replace(".html", "").replace("pages\\", "")
-            page_title = html_content.title.contents[0]
-            
-            # Get main content section
-            main_content = html_content.main
-            
-            # Convert HTML to Markdown format
-            markdown_content = CustomConverter(heading_style="ATX", bullets="*").convert_soup(main_content)
-            
-            # Clean up excessive newlines
-            markdown_content = re.sub(r"\n\n+", "\n\n", markdown_content)
-            
-            # Split content into sections based on headers
-            content_sections = markdown_content.split("\n#")
+def process_html_file(html_file_path: str) -> List[WebTextSection]:
+    """
+    Parses a single HTML page into its header-delimited sections.
+    Kept at module level so it can be dispatched to worker processes.
+    """
+    res = []
+    with open(html_file_path, encoding='utf-8') as file:
+        html_content = BeautifulSoup(file.read(), "html.parser")
+    document_id = html_file_path.split("/")[-1].replace(".html", "").replace("pages\\", "")
+    page_title = html_content.title.contents[0]
+    
+    # Get main content section
+    main_content = html_content.main
+    
+    # Convert HTML to Markdown format
+    markdown_content = CustomConverter(heading_style="ATX", bullets="*").convert_soup(main_content)
+    
+    # Clean up excessive newlines
+    markdown_content = re.sub(r"\n\n+", "\n\n", markdown_content)
+    
+    # Split content into sections based on headers
+    content_sections = markdown_content.split("\n#")
+    
+    # Process each section
+    for i, section_content in enumerate(content_sections):
+        if not section_content.strip():
+            continue  # Skip empty sections
             
-            # Process each section
-            for i, section_content in enumerate(content_sections):
-                if not section_content.strip():
-                    continue  # Skip empty sections
-                    
-                # Restore header marker and split into title and body
-                section_content = "#" + section_content
-                section_title, section_body = section_content.split("\n", 1)
-                
-                res.append(WebTextSection(document_id, str(i), page_title + section_title + section_body, None))
-        return res
+        # Restore header marker and split into title and body
+        section_content = "#" + section_content
+        section_title, section_body = section_content.split("\n", 1)
+        
+        res.append(WebTextSection(document_id, str(i), page_title + section_title + section_body, None))
+    return res
 
+class WebDataPreProccessor(PreProcessDataInterface):
+    def __init__(self, data_path: str, num_workers: int = 1, chunk_size: int = 8):
+        """
+        num_workers: number of processes used to parse the HTML files.
+                     1 keeps the serial path, None uses all available cores.
+        chunk_size: number of files handed to a worker process at a time.
+        """
+        super().__init__(data_path)
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+
+    def list_source_files(self) -> List[str]:
+        pages_dir = os.path.join(self.data_path, "pages")
+        # A missing directory is a wrong data_path, not a corpus whose pages were all deleted
+        if not os.path.isdir(pages_dir):
+            raise FileNotFoundError(f"No pages directory found at {pages_dir}")
+        return glob.glob(f"{self.data_path}/pages/*.html")
 
+    def pre_proccess_data(self) -> list[WebTextUnit]:
+        return self.pre_proccess_files(self.list_source_files())
 
+    def iter_pre_proccess_data(self) -> Iterator[WebTextSection]:
+        html_files = self.list_source_files()
+        num_workers = self.num_workers or os.cpu_count()
+        if num_workers <= 1:
+            for html_file_path in tqdm(html_files, desc="Streaming HTML files"):
+                yield from process_html_file(html_file_path)
+            return
+        # Submit a window of files at a time so only a bounded number of parsed pages is held in memory
+        window_size = num_workers * self.chunk_size
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for start in tqdm(range(0, len(html_files), window_size), desc="Streaming HTML files"):
+                window = html_files[start : start + window_size]
+                for sections in executor.map(process_html_file, window, chunksize=self.chunk_size):
+                    yield from sections
 
+    def pre_proccess_files(self, html_files: List[str]) -> List[WebTextSection]:
+        """Parses the given files, keeping the sections in file order."""
+        res = []
+        for sections in self.pre_proccess_files_grouped(html_files):
+            res.extend(sections)
+        return res
 
+    def pre_proccess_files_grouped(self, html_files: List[str]) -> List[List[WebTextSection]]:
+        num_workers = self.num_workers or os.cpu_count()
+        if num_workers <= 1 or len(html_files) <= 1:
+            return self._collect_sections(map(process_html_file, html_files), len(html_files))
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(html_files))) as executor:
+            # executor.map yields results in submission order, so the output matches the serial path
+            sections_per_file = executor.map(process_html_file, html_files, chunksize=self.chunk_size)
+            return self._collect_sections(sections_per_file, len(html_files))
 
-    
\ No newline at end of file
+    def _collect_sections(self, sections_per_file, files_count: int) -> List[List[WebTextSection]]:
+        return list(tqdm(sections_per_file, total=files_count, desc="Processing HTML files"))
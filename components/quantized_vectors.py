@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import weakref
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from components.logger import Logger
+
+QUANTIZATION_MODES = ("float16", "int8", "pq")
+
+# Candidates rescored against the full vectors per result, enough for ~0.99 recall@10 in each mode
+DEFAULT_RESCORE_FACTORS = {"float16": 2, "int8": 4, "pq": 16}
+
+# Rows encoded at a time, so fitting never holds a float64 or decoded copy of the whole corpus
+ENCODE_BLOCK_SIZE = 16384
+
+# Codebook entries per product quantization subspace, one byte per code
+PQ_CENTROIDS = 256
+
+# Vectors every subspace codebook is trained on
+PQ_TRAINING_POINTS = 16384
+
+
+def memory_mapped(vectors: np.ndarray) -> np.ndarray:
+    """
+    Read-only memory-mapped copy of vectors, backed by a temporary file, so the full vectors kept
+    for rescoring don't stay resident next to their quantized copy.
+    """
+    fd, path = tempfile.mkstemp(prefix="vectors_", suffix=".npy")
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, vectors)
+    mapped = np.load(path, mmap_mode='r')
+    try:
+        # The mapping keeps the data of the removed file readable
+        os.remove(path)
+    except OSError:
+        # Mapped files can't be removed on Windows, the file goes with the mapping
+        weakref.finalize(mapped, os.remove, path)
+    return mapped
+
+
+class QuantizedVectors:
+    """
+    Compact copy of an embedding matrix, for coarse scoring before an exact rescoring.
+
+    float16 halves the vectors, int8 maps every dimension linearly onto 256 levels between its
+    minimum and maximum (4x smaller) and pq splits the vectors into subspaces of a few dimensions,
+    each encoded by the byte id of its nearest k-means centroid (32x smaller with the default
+    8 dimensions per subspace). Indexing returns decoded float32 rows, so the quantized vectors
+    can be searched wherever the full vectors are, a block at a time.
+    """
+
+    def __init__(self, mode: str = "int8", rescore_factor: int | None = None, dims_per_subspace: int = 8, seed: int = 0):
+        """
+        mode: one of float16, int8, pq.
+        rescore_factor: a search rescores k * rescore_factor candidates against the full vectors,
+                        DEFAULT_RESCORE_FACTORS[mode] when None.
+        dims_per_subspace: dimensions encoded by one byte with pq, must divide the embedding dimension.
+        seed: random state of the pq codebooks.
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {mode}, expected one of {QUANTIZATION_MODES}")
+        self.logger = Logger().get_logger()
+        self.mode = mode
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS[mode]
+        self.dims_per_subspace = dims_per_subspace
+        self.seed = seed
+        self.codes = None
+        self.offsets = None  # int8: minimum of every dimension
+        self.scales = None  # int8: step of every dimension
+        self.codebooks = None  # pq: (subspaces, PQ_CENTROIDS, dims_per_subspace)
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the codes and their parameters"""
+        return sum(array.nbytes for array in (self.codes, self.offsets, self.scales, self.codebooks) if array is not None)
+
+    def fit(self, vectors: np.ndarray) -> "QuantizedVectors":
+        self.logger.debug(f'Entering fit with {len(vectors)} vectors, mode={self.mode}')
+        try:
+            if self.mode == "int8":
+                minimum = np.min(vectors, axis=0).astype(np.float32)
+                maximum = np.max(vectors, axis=0).astype(np.float32)
+                self.offsets = minimum
+                self.scales = np.maximum(maximum - minimum, np.float32(1e-12)) / np.float32(255)
+                code_shape, code_dtype = vectors.shape, np.uint8
+            elif self.mode == "pq":
+                self._train_codebooks(vectors)
+                code_shape, code_dtype = (len(vectors), len(self.codebooks)), np.uint8
+            else:
+                code_shape, code_dtype = vectors.shape, np.float16
+            self.codes = np.empty(code_shape, dtype=code_dtype)
+            for start in range(0, len(vectors), ENCODE_BLOCK_SIZE):
+                self.codes[start:start + ENCODE_BLOCK_SIZE] = self._encode(np.asarray(vectors[start:start + ENCODE_BLOCK_SIZE], dtype=np.float32))
+            self.logger.debug(f'Quantized {len(vectors)} vectors into {self.nbytes} bytes')
+        except Exception as e:
+            self.logger.error(f'Error in fit: {e}')
+            raise
+        self.logger.debug('Exiting fit')
+        return self
+
+    def _train_codebooks(self, vectors: np.ndarray):
+        dimension = vectors.shape[1]
+        if dimension % self.dims_per_subspace:
+            raise ValueError(f"dims_per_subspace={self.dims_per_subspace} does not divide the embedding dimension {dimension}")
+        training = vectors
+        if len(vectors) > PQ_TRAINING_POINTS:
+            rng = np.random.default_rng(self.seed)
+            training = vectors[np.sort(rng.choice(len(vectors), PQ_TRAINING_POINTS, replace=False))]
+        training = np.asarray(training, dtype=np.float32)
+        num_centroids = min(PQ_CENTROIDS, len(training))
+        codebooks = []
+        for start in range(0, dimension, self.dims_per_subspace):
+            kmeans = MiniBatchKMeans(n_clusters=num_centroids, init='random', n_init=1, batch_size=4096, random_state=self.seed)
+            codebooks.append(kmeans.fit(training[:, start:start + self.dims_per_subspace]).cluster_centers_.astype(np.float32))
+        self.codebooks = np.stack(codebooks)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.mode == "float16":
+            return vectors.astype(np.float16)
+        if self.mode == "int8":
+            return np.clip(np.rint((vectors - self.offsets) / self.scales), 0, 255).astype(np.uint8)
+        codes = np.empty((len(vectors), len(self.codebooks)), dtype=np.uint8)
+        for subspace, codebook in enumerate(self.codebooks):
+            sub_vectors = vectors[:, subspace * self.dims_per_subspace:(subspace + 1) * self.dims_per_subspace]
+            # Nearest centroid: argmin |x - c|^2 = argmax x.c - |c|^2 / 2
+            codes[:, subspace] = np.argmax(sub_vectors @ codebook.T - 0.5 * np.sum(codebook * codebook, axis=1), axis=1)
+        return codes
+
+    def __getitem__(self, index) -> np.ndarray:
+        """Decoded float32 rows, index is a slice or an array of rows"""
+        codes = self.codes[index]
+        if self.mode == "float16":
+            return codes.astype(np.float32)
+        if self.mode == "int8":
+            return codes * self.scales + self.offsets
+        decoded = self.codebooks[np.arange(len(self.codebooks)), codes]  # rows x subspaces x dims_per_subspace
+        return decoded.reshape(len(codes), -1)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in ("codes", "offsets", "scales", "codebooks"):
+            if getattr(self, name) is not None:
+                np.save(os.path.join(directory, f"quantized_{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "quantized.json"), 'w', encoding='utf-8') as f:
+            json.dump({"mode": self.mode, "dims_per_subspace": self.dims_per_subspace, "seed": self.seed, "num_vectors": len(self)}, f)
+
+    def load(self, directory: str, num_vectors: int) -> bool:
+        """Restores codes saved by save for num_vectors vectors, returns False when there are none"""
+        params_file = os.path.join(directory, "quantized.json")
+        if not os.path.exists(params_file):
+            return False
+        with open(params_file, encoding='utf-8') as f:
+            params = json.load(f)
+        if params != {"mode": self.mode, "dims_per_subspace": self.dims_per_subspace, "seed": self.seed, "num_vectors": num_vectors}:
+            return False
+        for name in ("codes", "offsets", "scales", "codebooks"):
+            array_file = os.path.join(directory, f"quantized_{name}.npy")
+            setattr(self, name, np.load(array_file) if os.path.exists(array_file) else None)
+        return True
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Callable, List
+import threading
+import numpy as np
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by (model, instruction, backend, text).
+
+    Repeated queries are answered from the cache, the others are deduplicated and encoded in
+    batches, so the encoder is invoked once per batch instead of once per query. The keys carry
+    the model, instruction and inference backend, so a cache can be shared by several dense indexers.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray], model_name: str, instruction: str = "",
+               batch_size: int = 32, backend: str = "") -> np.ndarray:
+        """
+        Embeddings of texts (len(texts) x dimension), encode_fn is called on batches of the texts missing from the cache.
+        backend: how the model runs, the repr of its InferenceBackend.
+        """
+        keys = [(str(model_name), instruction, backend, text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self.entries.get(key)
+                if vector is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = vector
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = np.asarray(encode_fn([text for _, _, _, text in batch]), dtype=np.float32)
+            # Rows are copied so an entry does not keep its whole batch alive
+            found.update((key, vector.copy()) for key, vector in zip(batch, vectors))
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            for key in missing:
+                self.entries[key] = found[key]
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
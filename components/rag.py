@@ -2,10 +2,22 @@ from components.query import Query
 from components.pre_process_data_interface import PreProcessDataInterface
 from components.index_data_interface import IndexerInferface
 from components.LlmAnswerRetriever.llm_answer_retriever_interface import LlmAnswerRetrieverInterface
-from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
+from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface, OptimizerChain
+from components.Reranker.reranker_interface import RerankerInterface
 from components.web_text_unit import WebTextUnit
+from components.corpus_store import CorpusStore
+from components.fingerprint import corpus_content_hash, describe_component, optimizer_chain_signature
+from components.optimization_cache import OptimizationCache
+from components.optimizer_pool import OptimizerPool
 from tqdm import tqdm
-from typing import List
+from typing import Callable, Iterable, Iterator, List
+from collections import deque
+import itertools
+import queue
+import threading
+from contextlib import closing
+import json
+import os
 import numpy as np
 from components.logger import Logger
 
@@ -17,41 +29,191 @@ class Rag:
         final_answer_retriever: LlmAnswerRetrieverInterface,
         index_optimizers: List[IndexingTextOptimizerInterface],
         text_units_to_retrieve_per_indexer: int,
+        streaming: bool = False,
+        state_dir: str | None = None,
+        reranker: RerankerInterface | None = None,
+        optimization_cache_dir: str | None = None,
+        optimizer_workers: int = 0,
     ):
+        """
+        streaming: index the corpus through a lazy pipeline of batches instead of materializing it.
+                   The corpus is parsed and optimized once for all the indexers, and only the batches
+                   in flight hold their optimized contents, which are not kept on the text units.
+                   The indexers still keep a reference to every text unit, these are views over the
+                   corpus store once it exists, otherwise the raw sections stay in memory.
+        state_dir: directory where build() persists the optimized corpus and the indexes,
+                   so load() can restore them without re-indexing.
+        reranker: reorders and cuts the retrieved sections of every query before they are sent to
+                  the final answer retriever.
+        optimization_cache_dir: directory where the optimized contents of the sections are persisted
+                                by optimizer chain and content hash, so only new or changed sections
+                                are optimized again.
+        optimizer_workers: processes the corpus batches are optimized in, 0 optimizes them in the
+                           calling process. The optimizers must be picklable.
+        """
         self.logger = Logger().get_logger()
         self.pre_proccessor = pre_proccessor
         self.data_indexers = data_indexers
         self.final_answers_retrievers = final_answer_retriever
         self.indexing_optimizers = index_optimizers
         self.batch_size = 64
+        # Batches waiting for each indexer when streaming
+        self.stream_queue_size = 2
         self.text_units_to_retrieve_per_indexer = text_units_to_retrieve_per_indexer
+        self.streaming = streaming
+        self.state_dir = state_dir
+        self.reranker = reranker
+        self.optimization_cache = OptimizationCache(optimization_cache_dir) if optimization_cache_dir is not None else None
+        self.optimizer_workers = optimizer_workers
+        self.web_text_units: List[WebTextUnit] | None = None
+        self.is_built = False
+        for indexer in self.data_indexers:
+            indexer.set_index_optimizers(self.indexing_optimizers)
 
     def answer_queries(self, queries: List[Query]):
+        """Builds the retrieval state on first use, then answers the queries against it"""
         self.logger.debug(f'Entering answer_queries with {len(queries)} queries')
         try:
-            self.logger.debug("Loading or processing data")
-            web_text_units = self.pre_proccessor.load_or_process_data()
+            if not self.is_built:
+                self.build()
+            self.query_batch(queries)
+        except Exception as e:
+            self.logger.error(f'Error in answer_queries: {e}')
+            raise
+        self.logger.debug('Exiting answer_queries')
 
-            self.logger.debug("Optimizing queries")
-            self.optimize_queries(queries)
+    def build(self) -> None:
+        """
+        Offline phase: loads the corpus, optimizes it and indexes it with every indexer.
+        When a state_dir is set the result is persisted for load().
+        """
+        self.logger.debug('Entering build')
+        try:
+            if self.streaming:
+                self.index_data_streaming()
+                self.web_text_units = None
+                if self.state_dir is not None:
+                    self.logger.warning('Retrieval state is not persisted in streaming mode')
+            else:
+                self.logger.debug("Loading or processing data")
+                self._index_corpus(self.pre_proccessor.load_or_process_data())
+            self.is_built = True
+        except Exception as e:
+            self.logger.error(f'Error in build: {e}')
+            raise
+        self.logger.debug('Exiting build')
+
+    def _index_corpus(self, web_text_units: List[WebTextUnit]) -> None:
+        self.logger.debug("Optimizing text units")
+        self.optimize_text_units(web_text_units)
+
+        self.logger.debug("Indexing data with each indexer")
+        for idx, indexer in enumerate(self.data_indexers, 1):
+            self.logger.debug(f"Indexing data with indexer #{idx}")
+            indexer.index_data(web_text_units)
 
-            self.logger.debug("Optimizing text units")
-            self.optimize_text_units(web_text_units)
+        self.web_text_units = web_text_units
+        if self.state_dir is not None:
+            self.save_state()
 
-            self.logger.debug("Indexing data with each indexer")
+    def load(self) -> None:
+        """
+        Restores the retrieval state persisted by build(). Falls back to building when there is
+        no saved state or it was built from another corpus, or with other indexers, optimizers or parameters.
+        Indexers that can't restore their index re-index the saved optimized corpus.
+        """
+        self.logger.debug('Entering load')
+        try:
+            if self.state_dir is None or self.streaming:
+                self.build()
+                return
+            processed_units = self.pre_proccessor.load_or_process_data()
+            if not self._saved_state_matches(processed_units):
+                self.logger.debug('No matching saved state, building')
+                self._index_corpus(processed_units)
+                self.is_built = True
+                return
+            web_text_units = CorpusStore(self._state_corpus_file()).units()
             for idx, indexer in enumerate(self.data_indexers, 1):
-                self.logger.debug(f"Indexing data with indexer #{idx}")
-                indexer.index_data(web_text_units)
+                indexer_dir = self._indexer_state_dir(idx, indexer)
+                if not indexer.load_index(indexer_dir, web_text_units):
+                    self.logger.debug(f"Re-indexing data with indexer #{idx}")
+                    indexer.index_data(web_text_units)
+                    indexer.save_index(indexer_dir)
+            self.web_text_units = web_text_units
+            self.is_built = True
+        except Exception as e:
+            self.logger.error(f'Error in load: {e}')
+            raise
+        self.logger.debug('Exiting load')
+
+    def save_state(self) -> None:
+        self.logger.debug(f'Entering save_state with state_dir={self.state_dir}')
+        os.makedirs(self.state_dir, exist_ok=True)
+        CorpusStore.write(self._state_corpus_file(), self.web_text_units)
+        for idx, indexer in enumerate(self.data_indexers, 1):
+            indexer.save_index(self._indexer_state_dir(idx, indexer))
+        # Written last, so an interrupted save is never mistaken for a complete one
+        with open(self._state_description_file(), 'w', encoding='utf-8') as f:
+            json.dump(self._state_description(self.web_text_units), f, indent=4, ensure_ascii=False)
+        self.logger.debug('Exiting save_state')
+
+    def _state_description(self, web_text_units: List[WebTextUnit]) -> dict:
+        """Everything the saved state depends on: the processed corpus, the optimizer chain and the indexers, with their parameters"""
+        return {
+            "corpus": corpus_content_hash(web_text_units),
+            "data_indexers": [describe_component(indexer) for indexer in self.data_indexers],
+            "index_optimizers": optimizer_chain_signature(self.indexing_optimizers),
+        }
+
+    def _saved_state_matches(self, web_text_units: List[WebTextUnit]) -> bool:
+        try:
+            with open(self._state_description_file(), encoding='utf-8') as f:
+                return json.load(f) == self._state_description(web_text_units)
+        except FileNotFoundError:
+            return False
+
+    def _state_description_file(self) -> str:
+        return os.path.join(self.state_dir, "state.json")
+
+    def _state_corpus_file(self) -> str:
+        return os.path.join(self.state_dir, "corpus.corpus")
+
+    def _indexer_state_dir(self, idx: int, indexer: IndexerInferface) -> str:
+        return os.path.join(self.state_dir, f"indexer_{idx}_{indexer.__class__.__name__}")
+
+    def query(self, query_text: str) -> Query:
+        """Online phase for a single question, see query_batch"""
+        query = Query(None, query_text)
+        self.query_batch([query])
+        return query
+
+    def query_batch(self, queries: List[Query]) -> None:
+        """
+        Online phase: runs only query optimization, retrieval and answer generation
+        against the built or loaded retrieval state.
+        """
+        self.logger.debug(f'Entering query_batch with {len(queries)} queries')
+        try:
+            if not self.is_built:
+                self.load()
+
+            self.logger.debug("Optimizing queries")
+            self.optimize_queries(queries)
 
             self.logger.debug("Retrieving answers from each indexer")
             self.retrieve_from_all_indexers(queries, k=self.text_units_to_retrieve_per_indexer)
 
+            if self.reranker is not None:
+                self.logger.debug("Reranking answer sources")
+                self.reranker.rerank(queries)
+
             self.logger.debug("Retrieving final answers")
             self.final_answers_retrievers.retrieve_final_answers(queries)
         except Exception as e:
-            self.logger.error(f'Error in answer_queries: {e}')
+            self.logger.error(f'Error in query_batch: {e}')
             raise
-        self.logger.debug('Exiting answer_queries')
+        self.logger.debug('Exiting query_batch')
 
     def retrieve_from_all_indexers(self, queries: List[Query], k: int):
         """
@@ -103,7 +265,7 @@ class Rag:
 
     def optimize_queries(self, queries: List[Query]) -> None:
         """
-        Runs all index_optimizers on batched queries. 
+        Runs all index_optimizers on batched queries, consecutive token level optimizers in a single pass.
         Optimized text is stored in query.indexing_optimized_query.
         """
         self.logger.debug(f'Entering optimize_queries with {len(queries)} queries')
@@ -112,12 +274,10 @@ class Rag:
                 queries[start : min(start + self.batch_size, len(queries))]
                 for start in range(0, len(queries), self.batch_size)
             ]
+            optimizer_chain = OptimizerChain(self.indexing_optimizers)
             for batch in tqdm(batched_queries, desc="Optimizing Queries"):
                 query_texts = [q.query for q in batch]
-                optimized_queries = query_texts  # raw texts as initial
-
-                for optimizer in self.indexing_optimizers:
-                    optimized_queries = optimizer.optimize_queries(optimized_queries)
+                optimized_queries = optimizer_chain.optimize_queries(query_texts)
                 for i, query in enumerate(batch):
                     query.indexing_optimized_query = optimized_queries[i]
         except Exception as e:
@@ -132,16 +292,191 @@ class Rag:
                 web_text_units[start : min(start + self.batch_size, len(web_text_units))]
                 for start in range(0, len(web_text_units), self.batch_size)
             ]
-            for batch in tqdm(batched_units, desc="Optimizing Text Units"):
-                unit_contents = [unit.get_content() for unit in batch]
-                optimized_contents = unit_contents  # raw contents as initial
-
-                for optimizer in self.indexing_optimizers:
-                    optimized_contents = optimizer.optimize_documents(optimized_contents)
-
-                for i, unit in enumerate(batch):
-                    unit.indexing_optimized_content = optimized_contents[i]
+            content_batches = ([unit.get_content() for unit in batch] for batch in batched_units)
+            # closing: the optimizer pool is shut down as soon as the last batch is optimized
+            with closing(self._optimize_batches(content_batches)) as optimized_batches:
+                for batch, optimized_contents in zip(tqdm(batched_units, desc="Optimizing Text Units"), optimized_batches):
+                    for i, unit in enumerate(batch):
+                        unit.indexing_optimized_content = optimized_contents[i]
         except Exception as e:
             self.logger.error(f'Error in optimize_text_units: {e}')
             raise
         self.logger.debug('Exiting optimize_text_units')
+
+    def _optimize_batches(self, content_batches: Iterable[List[str]]) -> Iterator[List[str]]:
+        """
+        Lazily optimizes batches of section contents, in order, through the optimization cache
+        and the optimizer pool when they are set.
+        """
+        if self.optimizer_workers > 0:
+            optimizer = OptimizerPool(self.indexing_optimizers, self.optimizer_workers, batch_size=self.batch_size)
+        else:
+            optimizer = OptimizerChain(self.indexing_optimizers)
+        try:
+            if self.optimization_cache is None:
+                yield from optimizer.optimize_document_batches(content_batches)
+            else:
+                chain_key = OptimizationCache.chain_key(self.indexing_optimizers)
+                # The misses of consecutive batches stay in flight in the optimizer pool
+                yield from self.optimization_cache.optimize_batches(content_batches, optimizer.optimize_document_batches, chain_key)
+        finally:
+            if self.optimizer_workers > 0:
+                optimizer.close()
+
+    def index_data_streaming(self) -> None:
+        """
+        Parses and optimizes the corpus once, feeding every batch to all the indexers together.
+        Each indexer consumes the stream in its own thread through a queue of at most
+        stream_queue_size batches, and the optimized contents of a batch are released once
+        every indexer has moved past it.
+        """
+        self.logger.debug('Entering index_data_streaming')
+        try:
+            self.logger.debug(f"Streaming data into {len(self.data_indexers)} indexers")
+            fan_out(self._optimized_text_unit_batches(), [indexer.index_data_batches for indexer in self.data_indexers],
+                    queue_size=self.stream_queue_size, release=_release_optimized_contents)
+        except Exception as e:
+            self.logger.error(f'Error in index_data_streaming: {e}')
+            raise
+        self.logger.debug('Exiting index_data_streaming')
+
+    def stream_optimized_text_units(self) -> Iterator[List[WebTextUnit]]:
+        """
+        Lazily yields batches of text units with their indexing optimized content set.
+        The optimized contents of a batch are released once the consumer asks for the next batch.
+        """
+        for batch in self._optimized_text_unit_batches():
+            yield batch
+            _release_optimized_contents(batch)
+
+    def _optimized_text_unit_batches(self) -> Iterator[List[WebTextUnit]]:
+        """
+        Batches of text units with their indexing optimized content set. Each optimizer (or fused
+        run of token level optimizers) pulls one batch at a time from the previous one, only the
+        batches the optimizers read ahead (one, a couple per worker with an optimizer pool) wait
+        for their optimized contents.
+        """
+        read_ahead = deque()
+
+        def contents_of(unit_batches):
+            for batch in unit_batches:
+                read_ahead.append(batch)
+                yield [unit.get_content() for unit in batch]
+
+        unit_batches = batched(self.pre_proccessor.stream_data(), self.batch_size)
+        with closing(self._optimize_batches(contents_of(unit_batches))) as optimized_batches:
+            for optimized_contents in tqdm(optimized_batches, desc="Streaming Text Units"):
+                batch = read_ahead.popleft()
+                for unit, optimized_content in zip(batch, optimized_contents):
+                    unit.indexing_optimized_content = optimized_content
+                yield batch
+
+
+def _release_optimized_contents(batch: List[WebTextUnit]):
+    for unit in batch:
+        unit.indexing_optimized_content = None
+
+
+# Queue items closing a stream fed by fan_out
+_END_OF_STREAM = object()
+_ABORTED_STREAM = object()
+
+
+def fan_out(batches: Iterable[list], consumers: List[Callable[[Iterable[list]], object]], queue_size: int = 2,
+            release: Callable[[list], None] | None = None) -> None:
+    """
+    Feeds a single stream of batches to several consumers, each running in its own thread and
+    pulling the batches from a bounded queue. The stream is produced once, and at most
+    queue_size batches wait for the slowest consumer. release is called on a batch once every
+    consumer has moved past it. The first error of the stream or of a consumer is raised.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in consumers]
+    finished = [threading.Event() for _ in consumers]
+    errors = []
+    in_use = {}  # batch number -> [consumers still using the batch, batch]
+    lock = threading.Lock()
+
+    def done_with(number):
+        with lock:
+            entry = in_use[number]
+            entry[0] -= 1
+            if entry[0] > 0:
+                return
+            del in_use[number]
+        if release is not None:
+            release(entry[1])
+
+    def stream_of(batch_queue):
+        while True:
+            item = batch_queue.get()
+            if item is _END_OF_STREAM:
+                return
+            if item is _ABORTED_STREAM:
+                raise RuntimeError('The stream of batches failed')
+            number, batch = item
+            try:
+                yield batch
+            finally:
+                done_with(number)
+
+    def run(consumer, batch_queue, consumer_finished):
+        try:
+            consumer(stream_of(batch_queue))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            consumer_finished.set()
+
+    def put(i, item) -> bool:
+        # A consumer that stopped early would never free a slot
+        while not finished[i].is_set():
+            try:
+                queues[i].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    threads = [threading.Thread(target=run, args=(consumer, batch_queue, consumer_finished), daemon=True)
+               for consumer, batch_queue, consumer_finished in zip(consumers, queues, finished)]
+    for thread in threads:
+        thread.start()
+    end = _ABORTED_STREAM
+    try:
+        for number, batch in enumerate(batches):
+            if errors:
+                break
+            targets = [i for i in range(len(consumers)) if not finished[i].is_set()]
+            if not targets:
+                if release is not None:
+                    release(batch)
+                continue
+            with lock:
+                in_use[number] = [len(targets), batch]
+            for i in targets:
+                if not put(i, (number, batch)):
+                    # The consumer finished after the targets were chosen, it will never move past the batch
+                    done_with(number)
+        else:
+            end = _END_OF_STREAM
+    except BaseException as e:
+        errors.insert(0, e)
+    finally:
+        for i in range(len(consumers)):
+            put(i, end)
+        for thread in threads:
+            thread.join()
+        # Batches still queued for consumers that stopped early were never moved past
+        for batch_queue in queues:
+            while not batch_queue.empty():
+                item = batch_queue.get_nowait()
+                if item is not _END_OF_STREAM and item is not _ABORTED_STREAM:
+                    done_with(item[0])
+    if errors:
+        raise errors[0]
+
+
+def batched(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
@@ -0,0 +1,78 @@
+import importlib
+
+# Component name -> "module:class". Modules are only imported when a component is first created,
+# so a BM25 only pipeline never imports torch, transformers or the Gemini client.
+COMPONENTS = {
+    # Indexers
+    "bm25": "components.index_data_interface:Bm25Indexer",
+    "sharded_bm25": "components.sharded_bm25_indexer:ShardedBm25Indexer",
+    "max_score_bm25": "components.max_score_bm25_indexer:MaxScoreBm25Indexer",
+    "llm": "components.LLM_indexer:LlmIndexer",
+    "instructor": "components.Instractor_indexer:InstractorIndexer",
+    "cascade": "components.cascade_indexer:CascadeIndexer",
+    # Index optimizers
+    "prefix_suffix_splitter": "components.IndexOptimizer.prefix_suffix_splitter_optimizer:PrefixSuffixSplitterOptimizer",
+    "word_filtering": "components.IndexOptimizer.word_filtering_indexing_optimizer:WordFilteringIndexingOptimizer",
+    "synonym_enrichment": "components.IndexOptimizer.synonym_encrichment_optimizer:SynonymEnrichmentOptimizer",
+    "lemmatizer_bert": "components.IndexOptimizer.lemmatize_optim_bert:LemmatizerIndexOptimizerBert",
+    "lemmatizer_trankit": "components.IndexOptimizer.lemmatize_optim_trankit:LemmatizerIndexOptimizerTrankit",
+    "hyde": "components.IndexOptimizer.hyde_indexing_optimizer:HydeIndexingOptimizer",
+    "none": "components.IndexOptimizer.indexing_text_optimizer_interface:NoneIndexOptimizer",
+    # Rerankers
+    "cross_encoder_reranker": "components.Reranker.cross_encoder_reranker:CrossEncoderReranker",
+    "none_reranker": "components.Reranker.reranker_interface:NoneReranker",
+    # LLM answer retrieval
+    "gemini": "components.LlmAnswerRetriever.gemini:Gemini",
+    "gemini_free_tier": "components.LlmAnswerRetriever.GeminiFreeTierAnswerRetriever:GeminiFreeTierAnswerRetriever",
+    "empty_answer_retriever": "components.LlmAnswerRetriever.llm_answer_retriever_interface:EmptyAnswerRetrieverInterface",
+}
+
+
+def resolve(name: str) -> type:
+    """Class of a registered component, importing its module"""
+    if name not in COMPONENTS:
+        raise KeyError(f"Unknown component {name}, expected one of {sorted(COMPONENTS)}")
+    module_name, class_name = COMPONENTS[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create(name: str, *args, **kwargs):
+    """Instance of a registered component"""
+    return resolve(name)(*args, **kwargs)
+
+
+def lazy(name: str, *args, **kwargs) -> "LazyComponent":
+    """Component created, and its module imported, on first attribute access"""
+    return LazyComponent(name, args, kwargs)
+
+
+class LazyComponent:
+    """
+    Stand-in for a component whose construction is expensive or has side effects (loading a model,
+    reading API keys). The component is created the first time one of its attributes is used.
+    """
+
+    def __init__(self, name: str, args: tuple = (), kwargs: dict | None = None):
+        self._name = name
+        self._args = args
+        self._kwargs = kwargs or {}
+        self._instance = None
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            self._instance = create(self._name, *self._args, **self._kwargs)
+        return self._instance
+
+    @property
+    def is_created(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, attribute):
+        # Only called for attributes missing on the stand-in itself
+        if attribute.startswith("__") or attribute in ("_name", "_args", "_kwargs", "_instance"):
+            raise AttributeError(attribute)
+        return getattr(self.instance, attribute)
+
+    def __repr__(self):
+        return f"LazyComponent({self._name!r}, created={self.is_created})"
@@ -0,0 +1,264 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
+import bm25s
+import numpy as np
+from scipy import sparse
+from components.index_data_interface import IndexerInferface
+from components.web_text_unit import WebTextUnit
+from components.query import Query
+from components.logger import Logger
+from components.bm25_segments import lucene_idf, lucene_tfc
+
+SHARD_ARRAYS = ("data", "indices", "indptr")
+
+# Shards already loaded by this process: shard directory -> (build generation, arrays, vocab)
+_loaded_shards = {}
+
+
+def _count_shard(texts: list[str]) -> tuple[Counter, int]:
+    """First build phase: document frequencies and total length of a shard"""
+    doc_freqs = Counter()
+    total_length = 0
+    for tokens in bm25s.tokenize(texts, return_ids=False, show_progress=False):
+        doc_freqs.update(set(tokens))
+        total_length += len(tokens)
+    return doc_freqs, total_length
+
+
+def _build_shard(shard_dir: str, texts: list[str], idf: dict, avg_doc_len: float) -> int:
+    """
+    Second build phase: writes the CSC matrix of BM25 scores of a shard (documents x shard tokens),
+    computed with the global idf and average document length so scores are comparable across shards.
+    """
+    vocab = {}
+    rows, cols, term_freqs, doc_lengths = [], [], [], []
+    for row, tokens in enumerate(bm25s.tokenize(texts, return_ids=False, show_progress=False)):
+        for token, term_freq in Counter(tokens).items():
+            rows.append(row)
+            cols.append(vocab.setdefault(token, len(vocab)))
+            term_freqs.append(term_freq)
+            doc_lengths.append(len(tokens))
+    # float32 idf times the float64 tfc of lucene_tfc, cast to float32: the scores of the unsharded index
+    token_idf = np.array([idf[token] for token in vocab], dtype=np.float32)
+    cols = np.array(cols, dtype=np.int64)
+    data = (token_idf[cols] * lucene_tfc(np.array(term_freqs, dtype=np.float32), doc_lengths, avg_doc_len)).astype(np.float32)
+    matrix = sparse.csc_matrix((data, (rows, cols)), shape=(len(texts), len(vocab)))
+    matrix.sort_indices()
+
+    os.makedirs(shard_dir, exist_ok=True)
+    # Files are replaced, not rewritten, so workers still mapping the previous build never read a truncated file
+    for name in SHARD_ARRAYS:
+        with open(os.path.join(shard_dir, f"{name}.npy.tmp"), 'wb') as f:
+            np.save(f, getattr(matrix, name))
+        os.replace(os.path.join(shard_dir, f"{name}.npy.tmp"), os.path.join(shard_dir, f"{name}.npy"))
+    with open(os.path.join(shard_dir, "vocab.json.tmp"), 'w', encoding='utf-8') as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    os.replace(os.path.join(shard_dir, "vocab.json.tmp"), os.path.join(shard_dir, "vocab.json"))
+    return len(texts)
+
+
+def _load_shard(shard_dir: str, generation: str):
+    """
+    Loaded shard of a build generation. A shard directory rebuilt in place gets a new generation,
+    which replaces the stale entry of the previous build.
+    """
+    shard = _loaded_shards.get(shard_dir)
+    if shard is None or shard[0] != generation:
+        arrays = {name: np.load(os.path.join(shard_dir, f"{name}.npy"), mmap_mode='r') for name in SHARD_ARRAYS}
+        with open(os.path.join(shard_dir, "vocab.json"), encoding='utf-8') as f:
+            vocab = json.load(f)
+        shard = _loaded_shards[shard_dir] = (generation, arrays, vocab)
+    return shard[1], shard[2]
+
+
+def _query_shard(shard_dir: str, generation: str, offset: int, num_docs: int, queries_tokens: list[list[str]],
+                 k: int) -> list[list[tuple[float, int]]]:
+    """
+    Scores the queries against one shard and returns the top-k (score, global position) pairs of each.
+    When fewer than k documents match, the remaining slots hold zero-score documents in corpus order,
+    so k results are merged even from shards the query barely matches.
+    """
+    arrays, vocab = _load_shard(shard_dir, generation)
+    data, indices, indptr = arrays["data"], arrays["indices"], arrays["indptr"]
+    k = min(k, num_docs)
+    results = []
+    for tokens in queries_tokens:
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for token_id in (vocab[token] for token in tokens if token in vocab):
+            start, end = indptr[token_id], indptr[token_id + 1]
+            scores[indices[start:end]] += data[start:end]
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        unmatched = np.flatnonzero(scores == 0)[:k - len(matched)]
+        results.append([(float(scores[i]), offset + int(i)) for i in np.concatenate([matched, unmatched])])
+    return results
+
+
+class ShardedBm25Indexer(IndexerInferface):
+    """
+    BM25 over web_text_units split into contiguous shards, built and queried in a process pool.
+
+    Building runs in two phases: the shards count their document frequencies and lengths, the
+    global idf and average document length are computed here, then every shard writes its score
+    matrix to disk using these global statistics. Queries are scattered to all shards and the
+    per-shard top-k lists are merged with a heap, so results match Bm25Indexer.
+    """
+
+    def __init__(self, num_shards: int = 4, num_workers: int = 4, index_dir: str | None = None):
+        """
+        num_shards: number of shards the corpus is split into.
+        num_workers: processes building and querying the shards.
+        index_dir: directory the shards are written to, a temporary directory when None,
+                   removed once the indexer is garbage collected or the interpreter exits.
+        """
+        self.logger = Logger().get_logger()
+        self.num_shards = num_shards
+        self.num_workers = num_workers
+        self.index_dir = index_dir
+        self.index_optimizers = []
+        self.web_text_units = None
+        self.shards = []  # (shard directory, global offset, number of documents)
+        # Identifies a build of the shards, so workers never serve shards cached from a previous build
+        self.generation = None
+        self.executor = None
+        self._temp_dir_finalizer = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["_temp_dir_finalizer"] = None
+        return state
+
+    def index_data(self, web_text_units: list[WebTextUnit]):
+        self.logger.debug(f'Entering index_data with {len(web_text_units)} web_text_units')
+        try:
+            self.web_text_units = web_text_units
+            if self.index_dir is None:
+                self.index_dir = tempfile.mkdtemp(prefix="sharded_bm25_")
+                self._temp_dir_finalizer = weakref.finalize(self, shutil.rmtree, self.index_dir, ignore_errors=True)
+            shard_size = max(1, -(-len(web_text_units) // self.num_shards))
+            bounds = [(start, min(start + shard_size, len(web_text_units))) for start in range(0, len(web_text_units), shard_size)]
+            shard_texts = [[u.get_indexing_optimized_content() for u in web_text_units[start:end]] for start, end in bounds]
+            executor = self._get_executor()
+
+            doc_freqs = Counter()
+            total_length = 0
+            shard_vocabs = []
+            for shard_doc_freqs, shard_length in executor.map(_count_shard, shard_texts):
+                doc_freqs.update(shard_doc_freqs)
+                total_length += shard_length
+                shard_vocabs.append(shard_doc_freqs.keys())
+            num_docs = len(web_text_units)
+            avg_doc_len = total_length / num_docs if num_docs else 0.0
+            tokens = list(doc_freqs)
+            idf = dict(zip(tokens, lucene_idf([doc_freqs[token] for token in tokens], num_docs).tolist()))
+
+            shard_dirs = [os.path.join(self.index_dir, f"shard_{i}") for i in range(len(bounds))]
+            shard_idfs = [{token: idf[token] for token in vocab} for vocab in shard_vocabs]
+            list(executor.map(_build_shard, shard_dirs, shard_texts, shard_idfs, repeat(avg_doc_len)))
+            self.shards = [(shard_dir, start, end - start) for shard_dir, (start, end) in zip(shard_dirs, bounds)]
+            self.generation = uuid.uuid4().hex
+            self.logger.debug(f'Sharded BM25 index built over {num_docs} web_text_units in {len(self.shards)} shards')
+        except Exception as e:
+            self.logger.error(f'Error in index_data: {e}')
+            raise
+        self.logger.debug('Exiting index_data')
+
+    def save_index(self, directory: str):
+        self.logger.debug(f'Entering save_index with directory={directory}')
+        os.makedirs(directory, exist_ok=True)
+        shards = []
+        for shard_dir, offset, num_docs in self.shards:
+            saved_dir = os.path.join(directory, os.path.basename(shard_dir))
+            if os.path.abspath(saved_dir) != os.path.abspath(shard_dir):
+                shutil.copytree(shard_dir, saved_dir, dirs_exist_ok=True)
+            shards.append({"name": os.path.basename(shard_dir), "offset": offset, "num_docs": num_docs, "generation": self.generation})
+        with open(os.path.join(directory, "shards.json"), 'w', encoding='utf-8') as f:
+            json.dump(shards, f)
+        self.logger.debug('Exiting save_index')
+
+    def load_index(self, directory: str, web_text_units: list[WebTextUnit]) -> bool:
+        self.logger.debug(f'Entering load_index with directory={directory}')
+        manifest_file = os.path.join(directory, "shards.json")
+        if not os.path.exists(manifest_file):
+            return False
+        with open(manifest_file, encoding='utf-8') as f:
+            shards = json.load(f)
+        if sum(shard["num_docs"] for shard in shards) != len(web_text_units):
+            self.logger.warning(f'Sharded index in {directory} does not match the corpus, ignoring it')
+            return False
+        self.shards = [(os.path.join(directory, shard["name"]), shard["offset"], shard["num_docs"]) for shard in shards]
+        # Manifests saved before generations existed get a fresh one, they can't be served from a stale cache entry
+        self.generation = (shards[0].get("generation") if shards else None) or uuid.uuid4().hex
+        self.index_dir = directory
+        self.web_text_units = web_text_units
+        self.logger.debug('Exiting load_index')
+        return True
+
+    def bm25_retrieve_batch(self, queries_text: list[str], k: int) -> tuple[list[list[WebTextUnit]], list[np.ndarray]]:
+        """
+        Scatters the queries to every shard and merges the per-shard top-k lists.
+        Ties are broken by corpus position. Queries without any known token get empty results,
+        like Bm25Indexer, the others get k results padded with zero-score documents.
+        """
+        self.logger.debug(f'Entering bm25_retrieve_batch with {len(queries_text)} queries, k={k}')
+        try:
+            queries_tokens = [text.split() for text in queries_text]
+            shard_results = list(self._get_executor().map(
+                _query_shard,
+                [shard_dir for shard_dir, _, _ in self.shards],
+                repeat(self.generation),
+                [offset for _, offset, _ in self.shards],
+                [num_docs for _, _, num_docs in self.shards],
+                repeat(queries_tokens),
+                repeat(k),
+            ))
+            results, scores = [], []
+            for query_idx in range(len(queries_text)):
+                candidates = [candidate for shard in shard_results for candidate in shard[query_idx]]
+                # Every known token scores above zero somewhere, only zero scores means no known token
+                top = heapq.nsmallest(k, candidates, key=lambda candidate: (-candidate[0], candidate[1]))
+                if not top or top[0][0] <= 0:
+                    top = []
+                results.append([self.web_text_units[position] for _, position in top])
+                scores.append(np.array([score for score, _ in top], dtype=np.float32))
+            self.logger.debug(f'bm25_retrieve_batch answered {sum(1 for r in results if r)} queries')
+            return results, scores
+        except Exception as e:
+            self.logger.error(f'Error in bm25_retrieve_batch: {e}')
+            raise
+
+    def bm25_retrieve(self, query, k):
+        results, _ = self.bm25_retrieve_batch([query], k)
+        return results[0]
+
+    def retrieve_answer_source(self, queries: list[Query], k=1) -> list[list[WebTextUnit]]:
+        self.logger.debug(f'Entering retrieve_answer_source with {len(queries)} queries, k={k}')
+        try:
+            results, _ = self.bm25_retrieve_batch([query.indexing_optimized_query for query in queries], k)
+            for query, answer_sources in zip(queries, results):
+                query.answer_sources = answer_sources
+        except Exception as e:
+            self.logger.error(f'Error in retrieve_answer_source: {e}')
+            raise
+        self.logger.debug('Exiting retrieve_answer_source')
+        return results
@@ -2,18 +2,9 @@ import csv
 import os
 from components.query import Query
 from components.pre_process_data_interface import WebDataPreProccessor
-from components.index_data_interface import Bm25Indexer
-from components.LlmAnswerRetriever.llm_answer_retriever_interface import EmptyAnswerRetrieverInterface
-from components.LlmAnswerRetriever.GeminiFreeTierAnswerRetriever import GeminiFreeTierAnswerRetriever
 from components.rag_results import RagResults
 from components.rag import Rag
-from components.IndexOptimizer.word_filtering_indexing_optimizer import WordFilteringIndexingOptimizer
-from components.LlmAnswerRetriever.gemini import Gemini
-from components.IndexOptimizer.hyde_indexing_optimizer import HydeIndexingOptimizer
-from components.Instractor_indexer import InstractorIndexer
-from components.IndexOptimizer.synonym_encrichment_optimizer import SynonymEnrichmentOptimizer
-from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
-from components.LLM_indexer import LlmIndexer
+from components.registry import create, lazy
 from components.logger import Logger
 
 
@@ -22,6 +13,11 @@ web_database_name = f'kolzchut_min_database'
 constrained_model = False
 cons = "_cons" if constrained_model else ""
 text_units_to_retrieve_per_indexer = 7
+index_optimizer_names = ["prefix_suffix_splitter"]
+reranker_name = None  # e.g. "cross_encoder_reranker", keeps only the best sections of the retrieved ones
+rag_state_dir = os.path.join("cache", "rag_state", web_database_name)
+optimization_cache_dir = os.path.join("cache", "optimized_contents")
+_rag = None
 
 def parse_queries_csv(file_path) -> list[Query]:
     logger = Logger().get_logger()
@@ -63,16 +59,23 @@ def build_rag():
     logger = Logger().get_logger()
     logger.debug('Entering build_rag')
     try:
-        gemini = Gemini(constraint_model=constrained_model)
+        # Components are created by name, only their modules are imported: a BM25 only run never loads torch.
+        # Gemini reads its API keys and configures the client on first use.
+        gemini = lazy("gemini", constraint_model=constrained_model)
         pre_proccessor = WebDataPreProccessor(web_database_name)
-        index_optimizers = [PrefixSuffixSplitterOptimizer()]
-        indexers = [Bm25Indexer()]
-        get_final_answers_retriever = GeminiFreeTierAnswerRetriever(gemini)
+        index_optimizers = [create(name) for name in index_optimizer_names]
+        # The built index is persisted once, with the rest of the retrieval state under rag_state_dir
+        indexers = [create("bm25", mmap=True)]
+        get_final_answers_retriever = create("gemini_free_tier", gemini)
+        reranker = create(reranker_name) if reranker_name else None
         rag = Rag(pre_proccessor, 
                   indexers, 
                   get_final_answers_retriever,
                   index_optimizers,
-                  text_units_to_retrieve_per_indexer)
+                  text_units_to_retrieve_per_indexer,
+                  state_dir=rag_state_dir,
+                  reranker=reranker,
+                  optimization_cache_dir=optimization_cache_dir)
         logger.debug('build_rag created Rag instance')
     except Exception as e:
         logger.error(f'Error in build_rag: {e}')
@@ -80,13 +83,20 @@ def build_rag():
     logger.debug('Exiting build_rag')
     return rag
 
+def get_rag() -> Rag:
+    """Builds the rag once per process and restores its persisted retrieval state"""
+    global _rag
+    if _rag is None:
+        _rag = build_rag()
+        _rag.load()
+    return _rag
+
 def query(query_object: str)->str:
     logger = Logger().get_logger()
     logger.debug(f'Entering query with query_object={query_object}')
     try:
-        rag = build_rag()
-        query_obj = Query(None, query_object)
-        rag.answer_queries([query_obj])
+        rag = get_rag()
+        query_obj = rag.query(query_object)
         logger.debug('Exiting query')
         return query_obj.final_answer
     except Exception as e:
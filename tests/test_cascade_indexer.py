@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import zlib
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.index_data_interface import IndexerInferface, Bm25Indexer
+from components.cascade_indexer import CascadeIndexer
+from components.dense_search import top_k_similarity
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from tests.test_index_data_interface import optimized_min_database, optimized_queries
+
+class HashedTokensIndexer(IndexerInferface):
+    """Deterministic stand-in for a dense indexer: normalized bags of hashed tokens"""
+    dimension = 256
+
+    def _embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.split():
+                vectors[row, zlib.crc32(token.encode('utf-8')) % self.dimension] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def index_data(self, web_text_units):
+        self.web_text_units = web_text_units
+        self.st_vectors = self._embed([unit.get_indexing_optimized_content() for unit in web_text_units])
+        self.top_k_calls = 0
+
+    def encode_queries(self, queries):
+        return self._embed([query.indexing_optimized_query for query in queries])
+
+    def top_k(self, query_vectors, k):
+        self.top_k_calls += 1
+        return top_k_similarity(query_vectors, self.st_vectors, k)
+
+    def retrieve_answer_source(self, queries, k):
+        indices, _ = self.top_k(self.encode_queries(queries), k)
+        return [[self.web_text_units[i] for i in row] for row in indices]
+
+class TestCascadeIndexer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.optimizers = [PrefixSuffixSplitterOptimizer()]
+        cls.web_text_units = optimized_min_database(cls.optimizers)
+        cls.questions = ["אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?",
+                         "האם מותר לעבוד בזמן שירות לאומי?",
+                         "מי ממן את הוצאות הקבורה ושירותי הקבורה המקובלים?"]
+
+    def cascade(self, **kwargs):
+        indexer = CascadeIndexer(Bm25Indexer(), HashedTokensIndexer(), **kwargs)
+        indexer.index_data(self.web_text_units)
+        return indexer
+
+    def test_rerank_orders_bm25_candidates_by_dense_score(self):
+        indexer = self.cascade(num_candidates=50)
+        queries = optimized_queries(self.questions, self.optimizers)
+        results = indexer.retrieve_answer_source(queries, 10)
+        candidates, _ = indexer.bm25.bm25_retrieve_batch([q.indexing_optimized_query for q in queries], 50)
+        query_vectors = indexer.dense.encode_queries(queries)
+        for query, query_vector, answer_sources, query_candidates in zip(queries, query_vectors, results, candidates):
+            self.assertEqual(len(answer_sources), 10)
+            self.assertEqual(query.answer_sources, answer_sources)
+            candidate_ids = {unit.get_id() for unit in query_candidates}
+            self.assertTrue(all(unit.get_id() in candidate_ids for unit in answer_sources))
+            scores = indexer.dense._embed([unit.get_indexing_optimized_content() for unit in answer_sources]) @ query_vector
+            self.assertTrue(np.all(np.diff(scores) <= 1e-6))
+
+    def test_all_candidates_match_dense_search(self):
+        # With the whole corpus as candidates the cascade ranks like the dense indexer alone
+        indexer = self.cascade(num_candidates=len(self.web_text_units))
+        self.assert_ranks_like_dense_search(indexer, 10)
+
+    def assert_ranks_like_dense_search(self, indexer, k):
+        queries = optimized_queries(self.questions, self.optimizers)
+        results = indexer.retrieve_answer_source(queries, k)
+        query_vectors = indexer.dense.encode_queries(queries)
+        expected_indices, expected_scores = top_k_similarity(query_vectors, indexer.dense.st_vectors, k)
+        for query_vector, answer_sources, indices, scores in zip(query_vectors, results, expected_indices, expected_scores):
+            ids = [unit.get_id() for unit in answer_sources]
+            self.assertEqual(ids, [indexer.dense.web_text_units[i].get_id() for i in indices])
+            positions = [indexer.web_text_units.index(unit) for unit in answer_sources]
+            np.testing.assert_allclose(indexer.dense.st_vectors[positions] @ query_vector, scores, rtol=1e-6)
+
+    def test_added_and_removed_documents_are_ranked_by_both_stages(self):
+        web_text_units = optimized_min_database(self.optimizers)
+        indexer = CascadeIndexer(Bm25Indexer(), HashedTokensIndexer(), num_candidates=len(web_text_units))
+        indexer.index_data(web_text_units[:-5])
+        indexer.add_documents(web_text_units[-5:])
+        indexer.remove_documents([web_text_units[0].get_id()])
+        self.assertEqual(len(indexer.web_text_units), len(web_text_units) - 1)
+        self.assert_ranks_like_dense_search(indexer, 10)
+        queries = optimized_queries(self.questions, self.optimizers)
+        for answer_sources in indexer.retrieve_answer_source(queries, 10):
+            self.assertNotIn(web_text_units[0].get_id(), [unit.get_id() for unit in answer_sources])
+
+        # Added to the BM25 stage alone: no embedding yet, the unit is not proposed
+        extra = optimized_min_database(self.optimizers)[0]
+        extra.doc_id = "extra"
+        indexer.bm25.add_documents([extra])
+        for answer_sources in indexer.retrieve_answer_source(optimized_queries(self.questions, self.optimizers), 10):
+            self.assertNotIn(extra.get_id(), [unit.get_id() for unit in answer_sources])
+
+    def test_fused_mode_and_fallback(self):
+        indexer = self.cascade(num_candidates=50, mode="fused", bm25_weight=1.0)
+        queries = optimized_queries(self.questions, self.optimizers)
+        results = indexer.retrieve_answer_source(queries, 5)
+        expected, _ = indexer.bm25.bm25_retrieve_batch([q.indexing_optimized_query for q in queries], 5)
+        # Only the BM25 score counts, the top score of every query is BM25's
+        for answer_sources, expected_sources in zip(results, expected):
+            self.assertEqual(answer_sources[0].get_id(), expected_sources[0].get_id())
+
+        # No BM25 candidate, the query is answered by the dense stage's own search
+        self.assertEqual(indexer.dense.top_k_calls, 0)
+        unknown = optimized_queries(["qwertyuiop"], self.optimizers)
+        self.assertEqual(len(indexer.retrieve_answer_source(unknown, 3)[0]), 3)
+        self.assertEqual(indexer.dense.top_k_calls, 1)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            CascadeIndexer(Bm25Indexer(), HashedTokensIndexer(), mode="sum")
+
+if __name__ == '__main__':
+    unittest.main()
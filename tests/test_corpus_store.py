@@ -0,0 +1,50 @@
+import unittest
+import sys
+import os
+import pickle
+import tempfile
+import shutil
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.corpus_store import CorpusStore, StoredWebTextSection
+from components.web_text_unit import WebTextSection
+
+class TestCorpusStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_file = os.path.join(self.tmp_dir, "corpus.corpus")
+        self.sections = [
+            WebTextSection(doc_id="a1", section_id="0", content="זכויות עובדים # כותרת", indexing_optimized_content=None),
+            WebTextSection(doc_id="a1", section_id="2", content="", indexing_optimized_content=""),
+            WebTextSection(doc_id="b2", section_id="1", content="This is a test document.", indexing_optimized_content="test document"),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        CorpusStore.write(self.store_file, self.sections)
+        units = CorpusStore(self.store_file).units()
+        self.assertEqual(len(units), 3)
+        self.assertIsInstance(units[0], StoredWebTextSection)
+        self.assertEqual(units, self.sections)
+        self.assertEqual(units[2].get_id(), "b2_1")
+        self.assertIsNone(units[0].get_indexing_optimized_content())
+        self.assertEqual(units[1].get_indexing_optimized_content(), "")
+
+    def test_views_are_picklable_and_keep_overrides(self):
+        CorpusStore.write(self.store_file, self.sections)
+        units = CorpusStore(self.store_file).units()
+        units[0].indexing_optimized_content = "זכויות"
+        restored = pickle.loads(pickle.dumps(units))
+        self.assertEqual(restored[0].get_indexing_optimized_content(), "זכויות")
+        self.assertEqual(restored[2].to_section(), self.sections[2])
+
+    def test_empty_store(self):
+        CorpusStore.write(self.store_file, [])
+        self.assertEqual(CorpusStore(self.store_file).units(), [])
+
+if __name__ == '__main__':
+    unittest.main()
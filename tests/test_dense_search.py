@@ -0,0 +1,34 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.dense_search import top_k_similarity
+
+class TestDenseSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.queries = rng.standard_normal((37, 16)).astype(np.float32)
+        self.docs = rng.standard_normal((1000, 16)).astype(np.float32)
+        # Duplicated documents give equal scores, which must be ordered by document index
+        self.docs[500:510] = self.docs[0]
+
+    def test_matches_full_sort(self):
+        scores = self.queries @ self.docs.T
+        expected = np.argsort(-scores, axis=1, kind='stable')
+        for k in (1, 10, 1000, 2000):
+            indices, top_scores = top_k_similarity(self.queries, self.docs, k, query_block_size=8, doc_block_size=64)
+            self.assertEqual(indices.tolist(), expected[:, :k].tolist())
+            self.assertTrue(np.array_equal(top_scores, np.take_along_axis(scores, indices, axis=1)))
+
+    def test_empty_inputs(self):
+        indices, scores = top_k_similarity(self.queries[:0], self.docs, 5)
+        self.assertEqual(indices.shape, (0, 5))
+        indices, scores = top_k_similarity(self.queries, self.docs, 0)
+        self.assertEqual(indices.shape, (37, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.embedding_cache import EmbeddingCache
+
+class CountingEncoder:
+    """Deterministic stand-in for an embedding model, recording the texts it encodes"""
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts], dtype=np.float32)
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.texts = ["זכויות עובדים", "דמי אבטלה", "מענק לידה", "דמי אבטלה"]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_only_new_texts_are_encoded_after_reopening(self):
+        encoder = CountingEncoder()
+        cache = EmbeddingCache(self.cache_dir, "model")
+        first = cache.encode(self.texts, encoder)
+        self.assertEqual(encoder.encoded, ["זכויות עובדים", "דמי אבטלה", "מענק לידה"])
+        np.testing.assert_array_equal(first, CountingEncoder()(self.texts))
+        cache.save()
+
+        encoder = CountingEncoder()
+        cache = EmbeddingCache(self.cache_dir, "model")
+        changed = ["מענק לידה", "קצבת זקנה", "זכויות עובדים"]
+        np.testing.assert_array_equal(cache.encode(changed, encoder), CountingEncoder()(changed))
+        self.assertEqual(encoder.encoded, ["קצבת זקנה"])
+        cache.save()
+        self.assertEqual(len(EmbeddingCache(self.cache_dir, "model")), 4)
+
+    def test_model_instruction_and_backend_are_part_of_the_key(self):
+        cache = EmbeddingCache(self.cache_dir, "model")
+        cache.encode(self.texts, CountingEncoder())
+        cache.save()
+        quantized = "InferenceBackend(quantize=True, compile=False, num_threads=None)"
+        for other in (EmbeddingCache(self.cache_dir, "other-model"), EmbeddingCache(self.cache_dir, "model", "Represents the document: "),
+                      EmbeddingCache(self.cache_dir, "model", backend=quantized)):
+            encoder = CountingEncoder()
+            other.encode(self.texts, encoder)
+            self.assertEqual(len(encoder.encoded), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.encoding_scheduler import EncodingScheduler
+
+class PaddingEncoder:
+    """Picklable stand-in for an embedding model: embeds a text by its length and its batch's padded length"""
+    def __call__(self, texts):
+        padded = max(len(text) for text in texts)
+        return np.array([[len(text), padded] for text in texts], dtype=np.float32)
+
+class TestEncodingScheduler(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.texts = ["א" * int(length) for length in rng.integers(1, 500, 200)]
+
+    def assert_bucketed_in_order(self, vectors):
+        # Original order is restored
+        self.assertEqual(vectors[:, 0].tolist(), [len(text) for text in self.texts])
+        # Sorted batches pad far less than corpus order batches
+        corpus_order = np.concatenate([PaddingEncoder()(self.texts[i:i + 16]) for i in range(0, len(self.texts), 16)])
+        self.assertLess(np.sum(vectors[:, 1] - vectors[:, 0]), np.sum(corpus_order[:, 1] - corpus_order[:, 0]) / 4)
+
+    def test_length_bucketing(self):
+        self.assert_bucketed_in_order(EncodingScheduler(batch_size=16).encode(self.texts, PaddingEncoder()))
+
+    def test_worker_processes(self):
+        scheduler = EncodingScheduler(batch_size=16, num_workers=2)
+        try:
+            self.assert_bucketed_in_order(scheduler.encode(self.texts, PaddingEncoder()))
+        finally:
+            scheduler.close()
+
+if __name__ == '__main__':
+    unittest.main()
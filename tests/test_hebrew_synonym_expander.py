@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import torch
+    from components.SynonymExpanders.hebrew_synonym_expander import HebrewSynonymExpander
+except ImportError:
+    torch = None
+
+WORDS = ["[PAD]", "[CLS]", "[SEP]", "[MASK]", "[UNK]", "זה", "כמו", "או", "במילים", "אחרות", "דומה", "ל", "מילה", "נרדפת",
+         "הוא", "בית", "דירה", "ספר", "מעניין", "גדול", "קטן", "ללכת", "מהר", "לרוץ", "חדר", "עבודה", "משרה", "כסף", "מענק"]
+
+class StubTokenizer:
+    """Whitespace tokenizer over WORDS, padding on the right like the BERT tokenizers"""
+    mask_token = "[MASK]"
+    mask_token_id = WORDS.index("[MASK]")
+
+    def __call__(self, texts, return_tensors="pt", padding=False):
+        texts = [texts] if isinstance(texts, str) else texts
+        ids = [[1] + [WORDS.index(word) if word in WORDS else 4 for word in text.split()] + [2] for text in texts]
+        length = max(len(row) for row in ids)
+        return {"input_ids": torch.tensor([row + [0] * (length - len(row)) for row in ids]),
+                "attention_mask": torch.tensor([[1] * len(row) + [0] * (length - len(row)) for row in ids])}
+
+    def decode(self, token_ids):
+        return " ".join(WORDS[int(token_id)] for token_id in token_ids)
+
+    def batch_decode(self, sequences):
+        return [self.decode(token_ids) for token_ids in sequences]
+
+class StubOutput:
+    def __init__(self, last_hidden_state):
+        self.last_hidden_state = last_hidden_state
+
+class StubModel(torch.nn.Module if torch is not None else object):
+    """Hidden state of a token: its embedding plus the mean embedding of the attended tokens, so padding must be masked"""
+    def __init__(self, hidden_size=16):
+        super().__init__()
+        self.embeddings = torch.nn.Embedding(len(WORDS), hidden_size)
+
+    def forward(self, input_ids, attention_mask):
+        embeddings = self.embeddings(input_ids)
+        mask = attention_mask.unsqueeze(-1).float()
+        context = (embeddings * mask).sum(dim=1, keepdim=True) / mask.sum(dim=1, keepdim=True)
+        return StubOutput(embeddings + context)
+
+@unittest.skipIf(torch is None, "torch and transformers are not installed")
+class TestHebrewSynonymExpander(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.expander = HebrewSynonymExpander(top_k=3, batch_size=4)
+        self.expander.device = torch.device("cpu")
+        self.expander._tokenizer = StubTokenizer()
+        self.expander._model = StubModel().eval()
+        self.expander._mlm_head = torch.nn.Linear(16, len(WORDS)).eval()
+
+    def test_batched_predictions_match_single_predictions(self):
+        words = ["בית", "ספר", "ללכת מהר", "עבודה"]
+        # Templates of different lengths share padded batches
+        texts = [template.replace('TARGET', word).replace('MASK', "[MASK]") for word in words for template in self.expander.templates]
+        batched = self.expander.get_predictions_batch(texts)
+        for text, predictions in zip(texts, batched):
+            expected = self.expander.get_predictions(text)
+            self.assertEqual([word for word, _ in predictions], [word for word, _ in expected])
+            for (_, prob), (_, expected_prob) in zip(predictions, expected):
+                self.assertAlmostEqual(prob, expected_prob, places=6)
+
+    def test_texts_need_exactly_one_mask(self):
+        for text in ["בית זה כמו דירה", "[MASK] זה כמו [MASK]"]:
+            with self.assertRaises(ValueError):
+                self.expander.get_predictions_batch(["בית זה כמו [MASK]", text])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 import sys
 import os
+import shutil
+import tempfile
+import bm25s
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -8,6 +11,29 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from components.index_data_interface import Bm25Indexer
 from components.web_text_unit import WebTextSection
 from components.pre_process_data_interface import WebDataPreProccessor
+from components.query import Query
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from components.IndexOptimizer.word_filtering_indexing_optimizer import WordFilteringIndexingOptimizer
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def optimized_min_database(optimizers):
+    web_text_units = WebDataPreProccessor(os.path.join(project_root, "kolzchut_min_database")).pre_proccess_data()
+    contents = [unit.get_content() for unit in web_text_units]
+    for optimizer in optimizers:
+        contents = optimizer.optimize_documents(contents)
+    for unit, content in zip(web_text_units, contents):
+        unit.indexing_optimized_content = content
+    return web_text_units
+
+def optimized_queries(texts, optimizers):
+    queries = [Query(None, text) for text in texts]
+    optimized = texts
+    for optimizer in optimizers:
+        optimized = optimizer.optimize_queries(optimized)
+    for query, optimized_text in zip(queries, optimized):
+        query.indexing_optimized_query = optimized_text
+    return queries
 
 class TestBm25Indexer(unittest.TestCase):
     def setUp(self):
@@ -45,5 +71,117 @@ class TestBm25Indexer(unittest.TestCase):
         except Exception as e:
             self.fail(f"Exception raised: {e}")
 
+class TestBm25IndexerBatchRetrieval(unittest.TestCase):
+    def test_batch_matches_single_queries(self):
+        optimizers = [PrefixSuffixSplitterOptimizer()]
+        indexer = Bm25Indexer(n_threads=2)
+        indexer.index_data(optimized_min_database(optimizers))
+        queries = optimized_queries(["אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?",
+                                     "האם מותר לעבוד בזמן שירות לאומי?",
+                                     "unknown words only"], optimizers)
+        texts = [query.indexing_optimized_query for query in queries]
+        results, scores = indexer.bm25_retrieve_batch(texts, 5)
+        for text, answer_sources, query_scores in zip(texts[:2], results, scores):
+            self.assertEqual([s.get_id() for s in answer_sources], [s.get_id() for s in indexer.bm25_retrieve(text, 5)])
+            self.assertEqual(len(query_scores), 5)
+            self.assertTrue(all(query_scores[i] >= query_scores[i + 1] for i in range(4)))
+        self.assertEqual(results[2], [])
+        self.assertEqual(results[1][0].get_doc_id(), "8630efca")
+
+class TestBm25IndexerPersistence(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.optimizers = [PrefixSuffixSplitterOptimizer()]
+        self.web_text_units = optimized_min_database(self.optimizers)
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def make_indexer(self, optimizers, mmap=False):
+        indexer = Bm25Indexer(index_dir=self.index_dir, mmap=mmap)
+        indexer.set_index_optimizers(optimizers)
+        return indexer
+
+    def test_reloads_index_with_matching_fingerprint(self):
+        built = self.make_indexer(self.optimizers)
+        built.index_data(self.web_text_units)
+        self.assertIsNotNone(built.corpus_tokens)
+
+        reloaded = self.make_indexer(self.optimizers, mmap=True)
+        reloaded.index_data(self.web_text_units)
+        self.assertIsNone(reloaded.corpus_tokens)  # loaded from disk, not tokenized
+        self.assertEqual(len(os.listdir(self.index_dir)), 1)
+
+        texts = ["האם מותר לעבוד בזמן שירות לאומי?"]
+        built_queries = optimized_queries(texts, self.optimizers)
+        reloaded_queries = optimized_queries(texts, self.optimizers)
+        built.retrieve_answer_source(built_queries, 5)
+        reloaded.retrieve_answer_source(reloaded_queries, 5)
+        self.assertEqual([s.get_id() for s in built_queries[0].answer_sources],
+                         [s.get_id() for s in reloaded_queries[0].answer_sources])
+
+    def test_optimizer_chain_changes_fingerprint(self):
+        self.make_indexer(self.optimizers).index_data(self.web_text_units)
+        other = self.make_indexer([WordFilteringIndexingOptimizer()] + self.optimizers)
+        other.index_data(self.web_text_units)
+        self.assertIsNotNone(other.corpus_tokens)
+        self.assertEqual(len(os.listdir(self.index_dir)), 2)
+
+    def test_fingerprint_ignores_mutable_state_and_follows_bm25_parameters(self):
+        indexer = self.make_indexer(self.optimizers)
+        expected = indexer.fingerprint("corpus")
+        self.optimizers[0].last_text = "state that is not a parameter"
+        self.assertEqual(indexer.fingerprint("corpus"), expected)
+
+        class LowerK1Indexer(Bm25Indexer):
+            @staticmethod
+            def _new_retriever():
+                return bm25s.BM25(k1=1.2)
+
+        other = LowerK1Indexer(index_dir=self.index_dir)
+        other.set_index_optimizers(self.optimizers)
+        self.assertEqual(other.bm25_params()["k1"], 1.2)
+        self.assertNotEqual(other.fingerprint("corpus"), expected)
+
+class TestBm25IndexerIncrementalUpdates(unittest.TestCase):
+    def setUp(self):
+        self.optimizers = [PrefixSuffixSplitterOptimizer()]
+        self.web_text_units = optimized_min_database(self.optimizers)
+        self.texts = [query.indexing_optimized_query for query in optimized_queries(
+            ["אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?", "האם מותר לעבוד בזמן שירות לאומי?"], self.optimizers)]
+
+    def ranked_ids(self, indexer, k=10):
+        results, _ = indexer.bm25_retrieve_batch(self.texts, k)
+        return [[unit.get_id() for unit in answer_sources] for answer_sources in results]
+
+    def test_updates_are_visible_before_merge(self):
+        indexer = Bm25Indexer()
+        indexer.index_data(list(self.web_text_units[:-5]))
+        indexer.add_documents(self.web_text_units[-5:])
+        removed_ids = [unit.get_id() for unit in self.web_text_units if unit.get_doc_id() == "8630efca"][:2]
+        indexer.remove_documents(removed_ids)
+
+        live_units = [unit for unit in self.web_text_units if unit.get_id() not in removed_ids]
+        for token in set(self.texts[1].split()):
+            self.assertEqual(indexer._global_doc_freq(token),
+                             sum(1 for unit in live_units if token in unit.get_indexing_optimized_content().split()))
+        ranked_ids = self.ranked_ids(indexer)
+        self.assertFalse(set(removed_ids) & set(ranked_ids[1]))
+        added_ids = {unit.get_id() for unit in self.web_text_units[-5:]}
+        self.assertTrue(added_ids & set(self.ranked_ids(indexer, len(live_units))[0]))
+
+    def test_merge_matches_full_rebuild(self):
+        indexer = Bm25Indexer(merge_threshold=4)
+        indexer.index_data(list(self.web_text_units[:-5]))
+        indexer.remove_documents([unit.get_id() for unit in self.web_text_units[:3]])
+        indexer.add_documents(self.web_text_units[-5:])  # crosses the threshold, merges in the background
+        indexer.merge_segments(wait=True)
+        self.assertEqual(len(indexer.delta), 0)
+        self.assertEqual(indexer.tombstones, set())
+
+        rebuilt = Bm25Indexer()
+        rebuilt.index_data(list(self.web_text_units[3:]))
+        self.assertEqual(self.ranked_ids(indexer), self.ranked_ids(rebuilt))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
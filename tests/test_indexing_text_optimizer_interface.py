@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface, OptimizerChain, TokenLevelOptimizer, TokenPipeline
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from components.IndexOptimizer.word_filtering_indexing_optimizer import WordFilteringIndexingOptimizer
+
+class UpperCaseOptimizer(IndexingTextOptimizerInterface):
+    """String level optimizer, breaks the runs of token level optimizers"""
+    def optimize_queries(self, lst_text):
+        return [text.upper() for text in lst_text]
+
+    def optimize_documents(self, lst_text):
+        return self.optimize_queries(lst_text)
+
+class TestOptimizerChain(unittest.TestCase):
+    def setUp(self):
+        self.texts = ["מה הן הזכויות של עובד שפוטר?", "האם  מגיעים\tדמי אבטלה\\לאחר התפטרות או פיטורים?",
+                      "abc על\\הבית", "", "   "]
+
+    def sequential(self, optimizers, texts):
+        for optimizer in optimizers:
+            texts = optimizer.optimize_documents(texts)
+        return texts
+
+    def test_fused_chain_matches_sequential_optimizers(self):
+        chains = [[WordFilteringIndexingOptimizer(), PrefixSuffixSplitterOptimizer()],
+                  [PrefixSuffixSplitterOptimizer(), WordFilteringIndexingOptimizer()],
+                  [WordFilteringIndexingOptimizer(), UpperCaseOptimizer(), PrefixSuffixSplitterOptimizer()]]
+        for optimizers in chains:
+            chain = OptimizerChain(optimizers)
+            expected = self.sequential(optimizers, self.texts)
+            self.assertEqual(chain.optimize_documents(self.texts), expected)
+            self.assertEqual(chain.optimize_queries(self.texts), expected)
+            batches = list(chain.optimize_document_batches(iter([self.texts[:2], self.texts[2:]])))
+            self.assertEqual(batches[0] + batches[1], expected)
+
+    def test_token_level_optimizers_are_fused(self):
+        chain = OptimizerChain([WordFilteringIndexingOptimizer(), PrefixSuffixSplitterOptimizer(), UpperCaseOptimizer(),
+                                WordFilteringIndexingOptimizer()])
+        self.assertEqual([stage.__class__ for stage in chain.stages], [TokenPipeline, UpperCaseOptimizer, TokenPipeline])
+        self.assertEqual(len(chain.stages[0].optimizers), 2)
+        self.assertFalse(hasattr(UpperCaseOptimizer(), "optimize_tokens"))
+
+    def test_token_level_optimizers_implement_optimize_tokens(self):
+        class MissingTokensOptimizer(TokenLevelOptimizer):
+            pass
+
+        with self.assertRaises(TypeError):
+            MissingTokensOptimizer()
+        # Texts are split on any whitespace and joined by single spaces
+        self.assertEqual(WordFilteringIndexingOptimizer().optimize_queries(["מה  הזכויות\tשל עובד"]), ["הזכויות של עובד"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import torch
+    from components.inference_backend import InferenceBackend, benchmark, check_parity, compare_backends
+except ImportError:
+    torch = None
+
+def load_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(16, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8))
+
+def encode(model, texts):
+    """Embeds a text through the model from the character codes of its first 16 characters"""
+    features = torch.tensor([[ord(char) % 97 / 97 for char in text.ljust(16)[:16]] for text in texts], dtype=torch.float32)
+    return model(features).numpy()
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class TestInferenceBackend(unittest.TestCase):
+    def setUp(self):
+        self.texts = ["מה הן הזכויות של עובד שפוטר?", "האם מגיעים דמי אבטלה לאחר התפטרות?", "מי זכאי למענק לידה?"] * 8
+
+    def test_quantize_replaces_a_bare_linear(self):
+        linear = torch.nn.Linear(16, 8)
+        quantized = InferenceBackend(quantize=True).prepare(linear)
+        self.assertIsNot(type(quantized), torch.nn.Linear)
+        self.assertIsInstance(quantized, torch.ao.nn.quantized.dynamic.Linear)
+        # Nested Linear layers are swapped in place
+        model = InferenceBackend(quantize=True).prepare(load_model())
+        self.assertIsInstance(model[0], torch.ao.nn.quantized.dynamic.Linear)
+
+    def test_check_parity(self):
+        vectors = np.array([[1.0, 0.0], [0.0, 2.0]], dtype=np.float32)
+        self.assertEqual(check_parity(vectors, vectors * 3), {"min_cosine": 1.0, "mean_cosine": 1.0})
+        self.assertAlmostEqual(check_parity(vectors, vectors[::-1])["min_cosine"], 0.0)
+        self.assertEqual(check_parity(["א", "ב", "ג", "ד"], ["א", "ב", "ג", "ה"]), {"agreement": 0.75})
+
+    def test_benchmark(self):
+        calls = []
+        result = benchmark(calls.append, self.texts, repeats=2)
+        # A warm-up call, then the timed repeats
+        self.assertEqual([len(texts) for texts in calls], [2, len(self.texts), len(self.texts)])
+        self.assertGreater(result["texts_per_second"], 0)
+
+    def test_compare_backends(self):
+        results = compare_backends(load_model, encode, self.texts, [InferenceBackend(), InferenceBackend(quantize=True)], repeats=1)
+        self.assertEqual([result["backend"] for result in results],
+                         [repr(InferenceBackend()), repr(InferenceBackend(quantize=True))])
+        self.assertAlmostEqual(results[0]["min_cosine"], 1.0, places=6)
+        self.assertGreater(results[1]["min_cosine"], 0.99)
+        self.assertTrue(all(result["texts_per_second"] > 0 for result in results))
+
+if __name__ == '__main__':
+    unittest.main()
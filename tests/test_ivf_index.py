@@ -0,0 +1,50 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.ivf_index import IvfIndex, recall_latency_report
+from components.dense_search import top_k_similarity
+
+def normalized(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+class TestIvfIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((20, 32))
+        self.vectors = normalized(centers[rng.integers(0, 20, 2000)] + 0.5 * rng.standard_normal((2000, 32)))
+        self.queries = normalized(centers[rng.integers(0, 20, 50)] + 0.5 * rng.standard_normal((50, 32)))
+        self.index = IvfIndex(num_lists=40).build(self.vectors)
+
+    def test_probing_every_list_is_exact(self):
+        indices, scores = self.index.search(self.queries, self.vectors, 10, nprobe=40)
+        expected_indices, expected_scores = top_k_similarity(self.queries, self.vectors, 10)
+        self.assertEqual(indices.tolist(), expected_indices.tolist())
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_recall_grows_with_nprobe(self):
+        report = recall_latency_report(self.vectors, self.queries, k=10, nprobes=(1, 4, 40), index=self.index)
+        recalls = [row["recall"] for row in report[1:]]
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreater(recalls[1], 0.8)
+        self.assertEqual(recalls[-1], 1.0)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.index.save(directory)
+            loaded = IvfIndex(num_lists=40)
+            self.assertTrue(loaded.load(directory, len(self.vectors)))
+            self.assertFalse(IvfIndex(num_lists=40).load(directory, len(self.vectors) + 1))
+            np.testing.assert_array_equal(loaded.search(self.queries, self.vectors, 5)[0], self.index.search(self.queries, self.vectors, 5)[0])
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.index_data_interface import Bm25Indexer
+from components.max_score_bm25_indexer import MaxScoreBm25Indexer
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from tests.test_index_data_interface import optimized_min_database, optimized_queries
+
+class TestMaxScoreBm25Indexer(unittest.TestCase):
+    def setUp(self):
+        optimizers = [PrefixSuffixSplitterOptimizer()]
+        self.web_text_units = optimized_min_database(optimizers)
+        questions = ["אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?",
+                     "האם מותר לעבוד בזמן שירות לאומי?",
+                     "מי ממן את הוצאות הקבורה ושירותי הקבורה המקובלים?"]
+        # Expanded queries: a question followed by a whole section, like a hypothetical answer
+        expanded = [question + " " + self.web_text_units[i * 40].get_content() for i, question in enumerate(questions)]
+        self.texts = [query.indexing_optimized_query for query in optimized_queries(questions + expanded, optimizers)]
+        self.bm25 = Bm25Indexer()
+        self.bm25.index_data(self.web_text_units)
+
+    def assert_same_rankings(self, indexer, k):
+        expected, expected_scores = self.bm25.bm25_retrieve_batch(self.texts, k)
+        results, scores = indexer.bm25_retrieve_batch(self.texts, k)
+        for answer_sources, query_scores, expected_sources, query_expected_scores in zip(results, scores, expected, expected_scores):
+            self.assertEqual(query_scores.tolist(), query_expected_scores.tolist())
+            # bm25s orders equal scores arbitrarily, compare the documents of every score
+            by_score = lambda units, unit_scores: sorted(zip(unit_scores.tolist(), [u.get_id() for u in units]))
+            ranked = by_score(answer_sources, query_scores)
+            expected_ranked = by_score(expected_sources, query_expected_scores)
+            boundary = query_scores[-1]
+            self.assertEqual([r for r in ranked if r[0] > boundary], [r for r in expected_ranked if r[0] > boundary])
+
+    def test_pruned_rankings_match_bm25(self):
+        indexer = MaxScoreBm25Indexer(min_postings_per_doc=0)
+        indexer.index_data(self.web_text_units)
+        for k in (1, 10, 50):
+            self.assert_same_rankings(indexer, k)
+
+    def test_exhaustive_rankings_match_bm25(self):
+        indexer = MaxScoreBm25Indexer(min_postings_per_doc=float("inf"))
+        indexer.index_data(self.web_text_units)
+        self.assert_same_rankings(indexer, 10)
+
+if __name__ == '__main__':
+    unittest.main()
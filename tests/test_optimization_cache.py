@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+import pickle
+import shutil
+import tempfile
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.optimization_cache import OptimizationCache
+from components.IndexOptimizer.indexing_text_optimizer_interface import IndexingTextOptimizerInterface
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from components.IndexOptimizer.word_filtering_indexing_optimizer import WordFilteringIndexingOptimizer
+
+class CountingOptimizer:
+    def __init__(self):
+        self.optimized = []
+
+    def __call__(self, texts):
+        self.optimized.extend(texts)
+        return [text[::-1] for text in texts]
+
+class Backend:
+    """Stand-in for InferenceBackend, described by its repr"""
+    def __init__(self, quantize):
+        self.quantize = quantize
+
+    def __repr__(self):
+        return f"Backend(quantize={self.quantize})"
+
+class Model:
+    """Object without its own repr, described by its class name"""
+    def __init__(self, weights):
+        self.weights = weights
+
+class ModelOptimizer(IndexingTextOptimizerInterface):
+    def __init__(self, backend, model):
+        self.backend = backend
+        self.model = model
+
+    def optimize_queries(self, lst_text):
+        return lst_text
+
+    def optimize_documents(self, lst_text):
+        return lst_text
+
+class TestOptimizationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.texts = ["זכאות לדמי אבטלה", "מענק לידה", "זכאות לדמי אבטלה", "פיצויי פיטורים"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_only_missing_texts_are_optimized(self):
+        cache = OptimizationCache(self.tmp_dir)
+        optimize_fn = CountingOptimizer()
+        expected = [text[::-1] for text in self.texts]
+        self.assertEqual(cache.optimize(self.texts, optimize_fn, "chain"), expected)
+        self.assertEqual(len(optimize_fn.optimized), 3)
+        cache.close()
+
+        # Reopened from disk, and pickled like a process pool would
+        reopened = pickle.loads(pickle.dumps(OptimizationCache(self.tmp_dir)))
+        self.assertEqual(reopened.optimize(self.texts + ["חדש"], optimize_fn, "chain"), expected + ["שדח"])
+        self.assertEqual(optimize_fn.optimized[3:], ["חדש"])
+        # Another chain does not reuse the entries
+        reopened.optimize(self.texts, optimize_fn, "other chain")
+        self.assertEqual(len(optimize_fn.optimized), 7)
+        self.assertEqual(len(reopened), 7)
+
+    def test_batches_stream_only_their_misses(self):
+        cache = OptimizationCache(self.tmp_dir)
+        cache.optimize(self.texts[:1], CountingOptimizer(), "chain")
+        received = []
+
+        def optimize_batches(batches):
+            # Pulls a batch ahead, like an optimizer pool keeping batches in flight
+            pending = []
+            for batch in batches:
+                received.append(batch)
+                pending.append([text[::-1] for text in batch])
+                if len(pending) == 2:
+                    yield pending.pop(0)
+            yield from pending
+
+        batches = [self.texts[:2], self.texts[2:], ["מענק לידה"], ["חדש", "חדש"]]
+        optimized = list(cache.optimize_batches(iter(batches), optimize_batches, "chain"))
+        self.assertEqual(optimized, [[text[::-1] for text in batch] for batch in batches])
+        self.assertEqual(received, [["מענק לידה"], ["פיצויי פיטורים"], [], ["חדש"]])
+        self.assertEqual(len(cache), 4)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        entry_bytes = len("מענק לידה".encode('utf-8'))
+        cache = OptimizationCache(self.tmp_dir, max_bytes=2 * entry_bytes)
+        optimize_fn = CountingOptimizer()
+        for text in ["מענק לידה", "דמי לידה", "מענק לידה", "חופש לידה"]:
+            cache.optimize([text], optimize_fn, "chain")
+        self.assertEqual(len(cache), 2)
+        cache.optimize(["מענק לידה", "חופש לידה"], optimize_fn, "chain")
+        self.assertEqual(optimize_fn.optimized, ["מענק לידה", "דמי לידה", "חופש לידה"])
+
+    def test_chain_key_follows_optimizers_and_parameters(self):
+        chain = [WordFilteringIndexingOptimizer(), PrefixSuffixSplitterOptimizer()]
+        self.assertEqual(OptimizationCache.chain_key(chain), OptimizationCache.chain_key([WordFilteringIndexingOptimizer(), PrefixSuffixSplitterOptimizer()]))
+        self.assertNotEqual(OptimizationCache.chain_key(chain), OptimizationCache.chain_key(chain[::-1]))
+        splitter = PrefixSuffixSplitterOptimizer()
+        splitter.suffixes_to_split = ["ים"]
+        self.assertNotEqual(OptimizationCache.chain_key(chain), OptimizationCache.chain_key([WordFilteringIndexingOptimizer(), splitter]))
+
+    def test_chain_key_follows_object_parameters(self):
+        def key(quantize, weights):
+            return OptimizationCache.chain_key([ModelOptimizer(Backend(quantize), Model(weights))])
+        self.assertEqual(key(False, 1), key(False, 1))
+        # Chains differing only in their inference backend don't share entries
+        self.assertNotEqual(key(True, 1), key(False, 1))
+        # Objects without their own repr are described by their class alone
+        self.assertEqual(key(False, 1), key(False, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.optimizer_pool import OptimizerPool
+from components.IndexOptimizer.indexing_text_optimizer_interface import OptimizerChain
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from components.IndexOptimizer.word_filtering_indexing_optimizer import WordFilteringIndexingOptimizer
+from components.pre_process_data_interface import WebDataPreProccessor
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestOptimizerPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        web_text_units = WebDataPreProccessor(os.path.join(project_root, "kolzchut_min_database")).pre_proccess_data()
+        cls.texts = [unit.get_content() for unit in web_text_units]
+        cls.optimizers = [WordFilteringIndexingOptimizer(), PrefixSuffixSplitterOptimizer()]
+        cls.expected = OptimizerChain(cls.optimizers).optimize_documents(cls.texts)
+
+    def test_pool_matches_serial_optimization_in_order(self):
+        with OptimizerPool(self.optimizers, num_workers=2, batch_size=16) as pool:
+            self.assertEqual(pool.optimize_documents(self.texts), self.expected)
+            batches = [self.texts[start:start + 10] for start in range(0, len(self.texts), 10)]
+            optimized = list(pool.optimize_document_batches(iter(batches)))
+            self.assertEqual([len(batch) for batch in optimized], [len(batch) for batch in batches])
+            self.assertEqual([text for batch in optimized for text in batch], self.expected)
+        self.assertIsNone(pool.executor)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.pre_process_data_interface import WebDataPreProccessor
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_path = os.path.join(project_root, "kolzchut_min_database")
+
+class CountingPreProccessor(WebDataPreProccessor):
+    def __init__(self, data_path: str):
+        super().__init__(data_path)
+        self.processed_files = []
+
+    def pre_proccess_files_grouped(self, html_files):
+        self.processed_files.extend(html_files)
+        return super().pre_proccess_files_grouped(html_files)
+
+class TestWebDataPreProccessor(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_copy = os.path.join(self.tmp_dir, "corpus")
+        shutil.copytree(data_path, self.data_copy)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_matches_serial(self):
+        serial = WebDataPreProccessor(data_path).pre_proccess_data()
+        parallel = WebDataPreProccessor(data_path, num_workers=3, chunk_size=2).pre_proccess_data()
+        self.assertGreater(len(serial), 0)
+        self.assertEqual(serial, parallel)
+
+    def test_incremental_cache_refresh(self):
+        pre_proccessor = CountingPreProccessor(self.data_copy)
+        first = pre_proccessor.load_or_process_data()
+        self.assertEqual(first, pre_proccessor.pre_proccess_data())
+
+        # Unchanged corpus is served from the cache
+        pre_proccessor = CountingPreProccessor(self.data_copy)
+        self.assertEqual(pre_proccessor.load_or_process_data(), first)
+        self.assertEqual(pre_proccessor.processed_files, [])
+
+        pages = sorted(pre_proccessor.list_source_files())
+        changed_page, deleted_page = pages[0], pages[1]
+        with open(changed_page, encoding='utf-8') as f:
+            html = f.read()
+        with open(changed_page, 'w', encoding='utf-8') as f:
+            f.write(html.replace("<title>", "<title>updated "))
+        os.remove(deleted_page)
+
+        pre_proccessor = CountingPreProccessor(self.data_copy)
+        refreshed = pre_proccessor.load_or_process_data()
+        self.assertEqual(pre_proccessor.processed_files, [changed_page])
+        self.assertEqual(refreshed, WebDataPreProccessor(self.data_copy).pre_proccess_data())
+        deleted_doc_id = os.path.basename(deleted_page).replace(".html", "")
+        self.assertNotIn(deleted_doc_id, {section.doc_id for section in refreshed})
+
+    def test_deleting_every_file_empties_the_cache(self):
+        first = WebDataPreProccessor(self.data_copy).load_or_process_data()
+        self.assertGreater(len(first), 0)
+        for page in WebDataPreProccessor(self.data_copy).list_source_files():
+            os.remove(page)
+        self.assertEqual(WebDataPreProccessor(self.data_copy).load_or_process_data(), [])
+        # The emptied cache and manifest are saved, not only returned
+        self.assertEqual(WebDataPreProccessor(self.data_copy).load_or_process_data(), [])
+
+    def test_missing_pages_directory_raises(self):
+        WebDataPreProccessor(self.data_copy).load_or_process_data()
+        shutil.rmtree(os.path.join(self.data_copy, "pages"))
+        with self.assertRaises(FileNotFoundError):
+            WebDataPreProccessor(self.data_copy).load_or_process_data()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+import pickle
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+
+class TestPrefixSuffixSplitterOptimizer(unittest.TestCase):
+    def setUp(self):
+        # Expected outputs were produced by the original list scanning implementation
+        self.expected = {
+            "הדרכים": "הדרכים דרכים דרך הדרך",
+            'ובמשפחות, של "צה"ל" abc\\שלום!': "ובמשפחות במשפחות במשפח משפחות משפח שפחות שפח פחות פח ובמשפח של שלום לום ום",
+            "": "",
+        }
+
+    def test_expansions(self):
+        optimizer = PrefixSuffixSplitterOptimizer()
+        self.assertEqual(optimizer.optimize_queries(list(self.expected)), list(self.expected.values()))
+        # Cached words give the same expansions
+        self.assertEqual(optimizer.optimize_documents(list(self.expected)), list(self.expected.values()))
+
+    def test_small_cache_and_pickling(self):
+        optimizer = pickle.loads(pickle.dumps(PrefixSuffixSplitterOptimizer(cache_size=2)))
+        self.assertEqual(optimizer.optimize_documents(list(self.expected) * 2), list(self.expected.values()) * 2)
+
+    def test_assigned_affixes_are_used(self):
+        optimizer = PrefixSuffixSplitterOptimizer()
+        self.assertEqual(optimizer.optimize_text("דירותיו"), "דירותיו דירותי דירות דיר")
+        optimizer.suffixes_to_split = ["ים"]
+        self.assertEqual(optimizer.optimize_text("דירותיו"), "דירותיו")
+        optimizer.prefixes_to_split = ["ו"]
+        self.assertEqual(optimizer.optimize_text("ודירים"), "ודירים דירים דיר ודיר")
+        self.assertEqual(pickle.loads(pickle.dumps(optimizer)).optimize_text("ודירים"), "ודירים דירים דיר ודיר")
+        with self.assertRaises(AttributeError):
+            optimizer.suffixes_to_split.append("ות")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.quantized_vectors import QuantizedVectors, QUANTIZATION_MODES, memory_mapped
+from components.dense_search import dense_top_k, top_k_similarity
+
+def normalized(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+class TestQuantizedVectors(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((20, 32))
+        self.vectors = normalized(centers[rng.integers(0, 20, 3000)] + 0.5 * rng.standard_normal((3000, 32)))
+        self.queries = normalized(centers[rng.integers(0, 20, 30)] + 0.5 * rng.standard_normal((30, 32)))
+        self.expected_indices, self.expected_scores = top_k_similarity(self.queries, self.vectors, 10)
+
+    def test_rescored_search_matches_exact_search(self):
+        for mode in QUANTIZATION_MODES:
+            quantized = QuantizedVectors(mode).fit(self.vectors)
+            self.assertLess(quantized.nbytes, self.vectors.nbytes)
+            indices, scores = dense_top_k(self.queries, self.vectors, 10, quantized_vectors=quantized)
+            recall = np.mean([len(np.intersect1d(found, expected)) / 10 for found, expected in zip(indices, self.expected_indices)])
+            self.assertGreater(recall, 0.95, mode)
+            # Rescored scores are exact scores of the returned documents
+            np.testing.assert_allclose(scores, np.take_along_axis(self.queries @ self.vectors.T, indices, axis=1), rtol=1e-5)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            quantized = QuantizedVectors("pq").fit(self.vectors)
+            quantized.save(directory)
+            loaded = QuantizedVectors("pq")
+            self.assertTrue(loaded.load(directory, len(self.vectors)))
+            self.assertFalse(QuantizedVectors("int8").load(directory, len(self.vectors)))
+            np.testing.assert_array_equal(loaded[:5], quantized[:5])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_memory_mapped_copy_matches_vectors(self):
+        mapped = memory_mapped(self.vectors)
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertFalse(mapped.flags.writeable)
+        np.testing.assert_array_equal(mapped, self.vectors)
+        quantized = QuantizedVectors("int8").fit(self.vectors)
+        indices, scores = dense_top_k(self.queries, mapped, 10, quantized_vectors=quantized)
+        expected_indices, expected_scores = dense_top_k(self.queries, self.vectors, 10, quantized_vectors=quantized)
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_array_equal(scores, expected_scores)
+
+if __name__ == '__main__':
+    unittest.main()
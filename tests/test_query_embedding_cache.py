@@ -0,0 +1,47 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.query_embedding_cache import QueryEmbeddingCache
+
+class BatchRecordingEncoder:
+    """Deterministic stand-in for an embedding model, recording the batches it is called with"""
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(text), sum(map(ord, text)) % 89] for text in texts], dtype=np.float32)
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def test_batches_and_repeated_queries(self):
+        cache = QueryEmbeddingCache(max_size=10)
+        encoder = BatchRecordingEncoder()
+        texts = ["מה זה מענק לידה?", "מי זכאי לדמי אבטלה?", "מה זה מענק לידה?", "איך מגישים ערעור?", "מה גובה קצבת זקנה?"]
+        vectors = cache.encode(texts, encoder, "model", batch_size=2)
+        np.testing.assert_array_equal(vectors, BatchRecordingEncoder()(texts))
+        self.assertEqual([len(batch) for batch in encoder.batches], [2, 2])
+
+        encoder = BatchRecordingEncoder()
+        np.testing.assert_array_equal(cache.encode(texts[::-1], encoder, "model"), vectors[::-1])
+        self.assertEqual(encoder.batches, [])
+        # Another instruction, model or inference backend is another key
+        cache.encode(texts[:1], encoder, "model", "Represents the query for retrieval: ")
+        cache.encode(texts[:1], encoder, "other-model")
+        cache.encode(texts[:1], encoder, "model", backend="InferenceBackend(quantize=True, compile=False, num_threads=None)")
+        self.assertEqual(len(encoder.batches), 3)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        encoder = BatchRecordingEncoder()
+        cache.encode(["a", "b"], encoder, "model")
+        cache.encode(["a"], encoder, "model")
+        cache.encode(["c"], encoder, "model")
+        self.assertEqual([text for _, _, _, text in cache.entries], ["a", "c"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.rag import Rag, fan_out
+from components.query import Query
+from components.pre_process_data_interface import WebDataPreProccessor
+from components.index_data_interface import Bm25Indexer
+from components.LlmAnswerRetriever.llm_answer_retriever_interface import EmptyAnswerRetrieverInterface
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from components.optimizer_pool import OptimizerPool
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_path = os.path.join(project_root, "kolzchut_min_database")
+queries_text = [
+    ("7f18f662", "אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?"),
+    ("8630efca", "האם מותר לעבוד בזמן שירות לאומי?"),
+]
+
+def make_queries():
+    return [Query(gold_doc_id, text) for gold_doc_id, text in queries_text]
+
+class TestRag(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_copy = os.path.join(self.tmp_dir, "corpus")
+        shutil.copytree(data_path, self.data_copy)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def build_rag(self, **kwargs):
+        return Rag(WebDataPreProccessor(self.data_copy),
+                   [Bm25Indexer()],
+                   EmptyAnswerRetrieverInterface(),
+                   [PrefixSuffixSplitterOptimizer()],
+                   5,
+                   **kwargs)
+
+    def test_streaming_matches_materialized(self):
+        queries = make_queries()
+        self.build_rag().answer_queries(queries)
+        streamed_queries = make_queries()
+        self.build_rag(streaming=True).answer_queries(streamed_queries)
+        for query, streamed_query in zip(queries, streamed_queries):
+            self.assertEqual([s.get_id() for s in query.answer_sources],
+                             [s.get_id() for s in streamed_query.answer_sources])
+        self.assertEqual(queries[0].answer_sources[0].get_doc_id(), "7f18f662")
+
+    def test_streaming_parses_corpus_once_for_all_indexers(self):
+        pre_proccessor = WebDataPreProccessor(self.data_copy)
+        stream_data = pre_proccessor.stream_data
+        calls = []
+        pre_proccessor.stream_data = lambda: calls.append(1) or stream_data()
+        indexers = [Bm25Indexer(), Bm25Indexer()]
+        rag = Rag(pre_proccessor, indexers, EmptyAnswerRetrieverInterface(), [PrefixSuffixSplitterOptimizer()], 5, streaming=True)
+        rag.build()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([u.get_id() for u in indexers[0].web_text_units], [u.get_id() for u in indexers[1].web_text_units])
+        self.assertTrue(all(u.indexing_optimized_content is None for u in indexers[0].web_text_units))
+
+    def test_load_restores_built_state(self):
+        state_dir = os.path.join(self.tmp_dir, "state")
+        rag = self.build_rag(state_dir=state_dir)
+        rag.build()
+        queries = make_queries()
+        rag.query_batch(queries)
+
+        loaded_rag = self.build_rag(state_dir=state_dir)
+        loaded_rag.load()
+        loaded_queries = make_queries()
+        loaded_rag.query_batch(loaded_queries)
+        for query, loaded_query in zip(queries, loaded_queries):
+            self.assertEqual([s.get_id() for s in query.answer_sources],
+                             [s.get_id() for s in loaded_query.answer_sources])
+        self.assertIsNotNone(loaded_queries[0].answer_sources[0].get_indexing_optimized_content())
+        self.assertIsNone(loaded_rag.data_indexers[0].corpus_tokens)  # restored, not re-indexed
+
+        single = loaded_rag.query(queries_text[1][1])
+        self.assertEqual(single.answer_sources[0].get_doc_id(), "8630efca")
+
+    def test_load_rebuilds_state_of_another_corpus_or_parameters(self):
+        state_dir = os.path.join(self.tmp_dir, "state")
+        self.build_rag(state_dir=state_dir).build()
+
+        other_parameters = Rag(WebDataPreProccessor(self.data_copy), [Bm25Indexer(merge_threshold=10)],
+                               EmptyAnswerRetrieverInterface(), [PrefixSuffixSplitterOptimizer()], 5, state_dir=state_dir)
+        other_parameters.load()
+        self.assertIsNotNone(other_parameters.data_indexers[0].corpus_tokens)  # re-indexed
+
+        os.remove(os.path.join(self.data_copy, "pages", "8630efca.html"))
+        other_corpus = self.build_rag(state_dir=state_dir)
+        other_corpus.load()
+        self.assertIsNotNone(other_corpus.data_indexers[0].corpus_tokens)
+        self.assertNotIn("8630efca", {unit.get_doc_id() for unit in other_corpus.web_text_units})
+
+        unchanged = self.build_rag(state_dir=state_dir)
+        unchanged.load()
+        self.assertIsNone(unchanged.data_indexers[0].corpus_tokens)
+
+    def test_optimization_cache_reuses_optimized_contents(self):
+        cache_dir = os.path.join(self.tmp_dir, "optimized")
+        rag = self.build_rag(optimization_cache_dir=cache_dir)
+        rag.build()
+        cached_rag = self.build_rag(optimization_cache_dir=cache_dir)
+        # Every section is reused, the optimizer is never called
+        with patch.object(PrefixSuffixSplitterOptimizer, "optimize_tokens", side_effect=AssertionError):
+            cached_rag.build()
+        self.assertEqual([u.get_indexing_optimized_content() for u in rag.web_text_units],
+                         [u.get_indexing_optimized_content() for u in cached_rag.web_text_units])
+
+    def test_optimizer_workers_match_serial_optimization(self):
+        rag = self.build_rag()
+        rag.build()
+        pooled_rag = self.build_rag(optimizer_workers=2)
+        pooled_rag.build()
+        self.assertEqual([u.get_indexing_optimized_content() for u in rag.web_text_units],
+                         [u.get_indexing_optimized_content() for u in pooled_rag.web_text_units])
+
+        # With the cache, the misses of consecutive batches are streamed to the pool instead of one batch at a time
+        cached_pooled_rag = self.build_rag(optimizer_workers=2, optimization_cache_dir=os.path.join(self.tmp_dir, "optimized"))
+        with patch.object(OptimizerPool, "optimize_documents", side_effect=AssertionError):
+            cached_pooled_rag.build()
+        self.assertEqual([u.get_indexing_optimized_content() for u in rag.web_text_units],
+                         [u.get_indexing_optimized_content() for u in cached_pooled_rag.web_text_units])
+
+class TestFanOut(unittest.TestCase):
+    def test_every_consumer_gets_every_batch_and_batches_are_released_once(self):
+        produced = []
+        released = []
+
+        def batches():
+            for i in range(20):
+                produced.append(i)
+                yield [i]
+
+        def fast(stream):
+            fast.seen = [batch[0] for batch in stream]
+
+        def slow(stream):
+            slow.seen = []
+            for batch in stream:
+                # The producer never runs further ahead of the slowest consumer than its queue
+                self.assertLessEqual(len(produced) - batch[0], 2 + 2)
+                self.assertNotIn(batch[0], released)
+                slow.seen.append(batch[0])
+
+        fan_out(batches(), [fast, slow], queue_size=2, release=lambda batch: released.append(batch[0]))
+        self.assertEqual(fast.seen, list(range(20)))
+        self.assertEqual(slow.seen, list(range(20)))
+        self.assertEqual(sorted(released), list(range(20)))
+
+    def test_consumer_error_is_raised(self):
+        def failing(stream):
+            next(iter(stream))
+            raise ValueError("indexer failed")
+
+        with self.assertRaises(ValueError):
+            fan_out(([i] for i in range(100)), [failing, lambda stream: list(stream)])
+
+    def test_batches_are_released_when_a_consumer_stops_early(self):
+        released = []
+
+        def first_only(stream):
+            next(iter(stream))
+
+        def slow(stream):
+            for _ in stream:
+                time.sleep(0.01)
+
+        fan_out(([i] for i in range(20)), [first_only, slow], queue_size=2, release=lambda batch: released.append(batch[0]))
+        # Batches left in the queue of the stopped consumer, or skipped for it, are released too
+        self.assertEqual(sorted(released), list(range(20)))
+
+if __name__ == '__main__':
+    unittest.main()
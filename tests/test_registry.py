@@ -0,0 +1,41 @@
+import unittest
+import subprocess
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.registry import COMPONENTS, create, lazy, resolve
+from components.index_data_interface import Bm25Indexer
+
+class TestRegistry(unittest.TestCase):
+    def test_create_by_name(self):
+        indexer = create("bm25", n_threads=2)
+        self.assertIsInstance(indexer, Bm25Indexer)
+        self.assertEqual(indexer.n_threads, 2)
+        with self.assertRaises(KeyError):
+            resolve("no_such_component")
+
+    def test_lazy_component_is_created_on_first_use(self):
+        indexer = lazy("bm25", n_threads=3)
+        self.assertFalse(indexer.is_created)
+        self.assertEqual(indexer.n_threads, 3)
+        self.assertTrue(indexer.is_created)
+        self.assertIsInstance(indexer.instance, Bm25Indexer)
+
+    def test_bm25_pipeline_does_not_import_model_libraries(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys, main; main.build_rag(); "
+                "print(','.join(m for m in ('torch', 'transformers', 'sentence_transformers', 'google.generativeai') if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "")
+
+    def test_registered_modules_exist(self):
+        for name, target in COMPONENTS.items():
+            module_name = target.split(":")[0]
+            module_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), *module_name.split(".")) + ".py"
+            self.assertTrue(os.path.exists(module_file), name)
+
+if __name__ == '__main__':
+    unittest.main()
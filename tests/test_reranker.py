@@ -0,0 +1,97 @@
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.Reranker.reranker_interface import BudgetedReranker
+from components.query import Query
+from components.web_text_unit import WebTextSection
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class WordOverlapReranker(BudgetedReranker):
+    """Scores a pair by the words the section shares with the question, each pair takes seconds_per_pair of the clock"""
+    def __init__(self, seconds_per_pair=0.0, **kwargs):
+        self.fake_clock = FakeClock()
+        super().__init__(clock=self.fake_clock, **kwargs)
+        self.seconds_per_pair = seconds_per_pair
+        self.batches = []
+
+    def score_pairs(self, pairs):
+        self.batches.append(pairs)
+        self.fake_clock.now += self.seconds_per_pair * len(pairs)
+        return [len(set(query.split()) & set(section.split())) for query, section in pairs]
+
+class LazyModelReranker(WordOverlapReranker):
+    """Loading the model takes load_seconds of the clock, on first use unless prepare loaded it"""
+    def __init__(self, load_seconds=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.load_seconds = load_seconds
+        self.loaded = False
+
+    def prepare(self):
+        self.load()
+
+    def load(self):
+        if not self.loaded:
+            self.fake_clock.now += self.load_seconds
+            self.loaded = True
+
+    def score_pairs(self, pairs):
+        self.load()
+        return super().score_pairs(pairs)
+
+def make_query(text, contents):
+    query = Query(None, text)
+    query.answer_sources = [WebTextSection(f"doc{i}", "0", content, "title") for i, content in enumerate(contents)]
+    return query
+
+class TestReranker(unittest.TestCase):
+    def setUp(self):
+        self.contents = ["אין קשר", "זכאות לדמי אבטלה", "דמי אבטלה", "מענק לידה"]
+
+    def test_keeps_top_n_by_score(self):
+        queries = [make_query("מי זכאי לדמי אבטלה", self.contents), make_query("מענק לידה", self.contents)]
+        reranker = WordOverlapReranker(top_n=2, batch_size=3)
+        reranker.rerank(queries)
+        self.assertEqual([s.get_content() for s in queries[0].answer_sources], ["זכאות לדמי אבטלה", "דמי אבטלה"])
+        self.assertEqual([s.get_content() for s in queries[1].answer_sources], ["מענק לידה", "אין קשר"])
+        # Pairs of both queries share batches, in order of retrieval rank
+        self.assertEqual([len(batch) for batch in reranker.batches], [3, 3, 2])
+        self.assertEqual(reranker.batches[0][1][0], "מענק לידה")
+
+    def test_latency_budget_stops_scoring(self):
+        queries = [make_query("מענק לידה", self.contents)]
+        reranker = WordOverlapReranker(seconds_per_pair=1.0, top_n=3, latency_budget=3.5, batch_size=2)
+        reranker.rerank(queries)
+        # The fourth pair would go past the budget, its source keeps its retrieval order
+        self.assertEqual([len(batch) for batch in reranker.batches], [2, 1])
+        self.assertEqual([s.get_id() for s in queries[0].answer_sources], ["doc0_0", "doc1_0", "doc2_0"])
+
+    def test_latency_budget_is_per_query(self):
+        # The short query leaves most of its budget unused, the long one can't spend it
+        queries = [make_query("מענק לידה", self.contents), make_query("דמי אבטלה", self.contents[:1])]
+        reranker = WordOverlapReranker(seconds_per_pair=1.0, top_n=4, latency_budget=2.5, batch_size=2)
+        reranker.rerank(queries)
+        self.assertEqual([[query for query, _ in batch] for batch in reranker.batches],
+                         [["מענק לידה", "דמי אבטלה"], ["מענק לידה"]])
+        # Only the first two sources of the long query are scored, the best one stays unscored
+        self.assertEqual([s.get_id() for s in queries[0].answer_sources], ["doc0_0", "doc1_0", "doc2_0", "doc3_0"])
+
+    def test_model_loading_is_not_charged_to_the_budget(self):
+        queries = [make_query("מענק לידה", self.contents)]
+        reranker = LazyModelReranker(load_seconds=100.0, seconds_per_pair=1.0, top_n=3, latency_budget=3.5, batch_size=2)
+        reranker.rerank(queries)
+        self.assertTrue(reranker.loaded)
+        # Same batches as without the load: the first one doesn't come out 50 seconds per pair
+        self.assertEqual([len(batch) for batch in reranker.batches], [2, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.index_data_interface import Bm25Indexer
+from components.web_text_unit import WebTextSection
+from components.sharded_bm25_indexer import ShardedBm25Indexer
+from components.IndexOptimizer.prefix_suffix_splitter_optimizer import PrefixSuffixSplitterOptimizer
+from tests.test_index_data_interface import optimized_min_database, optimized_queries
+
+def sections(prefix, contents):
+    return [WebTextSection(f"{prefix}_{i}", "0", content, content) for i, content in enumerate(contents)]
+
+class TestShardedBm25Indexer(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        optimizers = [PrefixSuffixSplitterOptimizer()]
+        self.web_text_units = optimized_min_database(optimizers)
+        self.texts = [query.indexing_optimized_query for query in optimized_queries(
+            ["אמא שהתפטרה כדי לטפל בילד שלה זכאית לפיצויי פיטורים?",
+             "האם מותר לעבוד בזמן שירות לאומי?",
+             "unknown words only"], optimizers)]
+        self.indexer = ShardedBm25Indexer(num_shards=3, num_workers=2, index_dir=os.path.join(self.index_dir, "build"))
+        self.indexer.index_data(self.web_text_units)
+
+    def tearDown(self):
+        self.indexer.close()
+        shutil.rmtree(self.index_dir)
+
+    def test_matches_unsharded_indexer(self):
+        unsharded = Bm25Indexer()
+        unsharded.index_data(self.web_text_units)
+        expected, expected_scores = unsharded.bm25_retrieve_batch(self.texts, 10)
+        results, scores = self.indexer.bm25_retrieve_batch(self.texts, 10)
+        self.assertEqual(len(self.indexer.shards), 3)
+        self.assertEqual([[unit.get_id() for unit in r] for r in results], [[unit.get_id() for unit in r] for r in expected])
+        for query_scores, query_expected_scores in zip(scores, expected_scores):
+            self.assertEqual(query_scores.tolist(), query_expected_scores.tolist())
+
+    def test_save_and_load(self):
+        saved_dir = os.path.join(self.index_dir, "saved")
+        self.indexer.save_index(saved_dir)
+        loaded = ShardedBm25Indexer(num_workers=1)
+        self.assertTrue(loaded.load_index(saved_dir, self.web_text_units))
+        try:
+            self.assertEqual([unit.get_id() for unit in loaded.bm25_retrieve(self.texts[1], 5)],
+                             [unit.get_id() for unit in self.indexer.bm25_retrieve(self.texts[1], 5)])
+        finally:
+            loaded.close()
+
+    def test_sparse_queries_are_padded_like_unsharded_indexer(self):
+        units = sections("d", ["apple pie", "banana bread", "kiwi salad", "cherry tart", "lemon cake", "kiwi juice", "plum jam"])
+        unsharded = Bm25Indexer()
+        unsharded.index_data(units)
+        indexer = ShardedBm25Indexer(num_shards=3, num_workers=1, index_dir=os.path.join(self.index_dir, "sparse"))
+        try:
+            indexer.index_data(units)
+            texts = ["kiwi", "apple kiwi", "plum", "unknown"]
+            expected, expected_scores = unsharded.bm25_retrieve_batch(texts, 4)
+            results, scores = indexer.bm25_retrieve_batch(texts, 4)
+            for result, query_scores, expected_result, query_expected_scores in zip(results, scores, expected, expected_scores):
+                self.assertEqual(len(result), len(expected_result))
+                np.testing.assert_array_equal(query_scores, query_expected_scores)
+                self.assertEqual({unit.get_id() for unit, score in zip(result, query_scores) if score > 0},
+                                 {unit.get_id() for unit, score in zip(expected_result, query_expected_scores) if score > 0})
+            # The zero-score slots hold the first unmatched documents in corpus order
+            self.assertEqual([unit.get_id() for unit in results[0]], ["d_2_0", "d_5_0", "d_0_0", "d_1_0"])
+            self.assertEqual(results[3], [])
+        finally:
+            indexer.close()
+
+    def test_reindexing_in_place_serves_the_new_shards(self):
+        indexer = ShardedBm25Indexer(num_shards=2, num_workers=1, index_dir=os.path.join(self.index_dir, "reindexed"))
+        try:
+            indexer.index_data(sections("p", ["apple pie", "banana bread", "cherry tart"]))
+            self.assertEqual(indexer.bm25_retrieve("apple", 1)[0].get_id(), "p_0_0")
+            # Same shard directories, the worker that served the first build must not reuse its shards
+            indexer.index_data(sections("q", ["kiwi salad", "lemon cake", "apple juice", "apple cake"]))
+            self.assertEqual([unit.get_id() for unit in indexer.bm25_retrieve("apple", 2)], ["q_2_0", "q_3_0"])
+            self.assertEqual(indexer.bm25_retrieve("kiwi", 1)[0].get_id(), "q_0_0")
+        finally:
+            indexer.close()
+
+    def test_temporary_index_dir_is_removed(self):
+        indexer = ShardedBm25Indexer(num_shards=2, num_workers=1)
+        indexer.index_data(self.web_text_units)
+        temp_dir = indexer.index_dir
+        self.assertTrue(os.path.isdir(temp_dir))
+        indexer.close()
+        del indexer
+        self.assertFalse(os.path.exists(temp_dir))
+
+if __name__ == '__main__':
+    unittest.main()